@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""Benchmark the serial, thread and process backends of the image loader.
+
+Run on the node that will do the reduction, e.g.
+
+.. code-block:: sh
+
+   python scripts/benchmark_load_data.py /HFIR/CG1D/IPTS-25777/raw/ct_scans/iron_man --fnmatch "*.tiff" -n 200
+
+The table lists the wall time of every executor for increasing worker counts, followed
+by the smallest worker count at which each parallel executor beats the serial reader.
+"""
+
+# package imports
+from imars3d.backend.dataio.data import _load_images
+
+# standard imports
+import argparse
+from pathlib import Path
+import time
+
+
+def _time_load(filelist, executor: str, max_workers: int, repeat: int) -> float:
+    """Return the best wall time out of ``repeat`` loads."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _load_images(filelist, desc=executor, max_workers=max_workers, executor=executor)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory", type=Path, help="directory holding the images")
+    parser.add_argument("--fnmatch", default="*.tiff", help="pattern for selecting the images (default: %(default)s)")
+    parser.add_argument("-n", "--num-files", type=int, default=0, help="number of images to load, 0 for all")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, 8, 16], help="worker counts to try")
+    parser.add_argument("--repeat", type=int, default=3, help="number of repetitions per measurement")
+    args = parser.parse_args(args)
+
+    filelist = sorted(map(str, args.directory.glob(args.fnmatch)))
+    if args.num_files > 0:
+        filelist = filelist[: args.num_files]
+    if not filelist:
+        raise SystemExit(f"No file matching {args.fnmatch} in {args.directory}")
+
+    serial = _time_load(filelist, "serial", 1, args.repeat)
+    print(f"{len(filelist)} files, serial: {serial:.3f} s")
+    print(f"{'workers':>8} | {'thread (s)':>10} | {'process (s)':>11}")
+    crossover = {}
+    for max_workers in args.workers:
+        timings = {
+            executor: _time_load(filelist, executor, max_workers, args.repeat) for executor in ("thread", "process")
+        }
+        print(f"{max_workers:>8} | {timings['thread']:>10.3f} | {timings['process']:>11.3f}")
+        for executor, timing in timings.items():
+            if timing < serial:
+                crossover.setdefault(executor, max_workers)
+    for executor in ("thread", "process"):
+        if executor in crossover:
+            print(f"{executor} beats serial from {crossover[executor]} workers on")
+        else:
+            print(f"{executor} never beats serial for the tested worker counts")
+
+
+if __name__ == "__main__":
+    main()
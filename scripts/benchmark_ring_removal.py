@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""Benchmark the batched Ketcham ring removal against the per-sinogram implementation.
+
+Run on the node that will do the reduction, e.g.
+
+.. code-block:: sh
+
+   python scripts/benchmark_ring_removal.py --shape 720 512 1024 --workers 1 4 8
+
+The per-sinogram path maps ``_remove_ring_artifact_Ketcham`` over the sinograms with the
+shared process pool, the batched path is ``remove_ring_artifact``, which corrects blocks of
+sinograms in place with threads. The table lists the best wall time of both for every
+worker count, and the results are checked to be identical.
+"""
+
+# package imports
+from imars3d.backend.corrections.ring_removal import _remove_ring_artifact_Ketcham, remove_ring_artifact
+from imars3d.backend.util.pool import shutdown_pool, warm_pool
+from imars3d.backend.util.shared import map_slices
+
+# third-party imports
+import numpy as np
+
+# standard imports
+import argparse
+import time
+
+
+def _per_sinogram(arrays: np.ndarray, max_workers: int) -> np.ndarray:
+    return map_slices(_remove_ring_artifact_Ketcham, arrays, axis=1, out=arrays, max_workers=max_workers)
+
+
+def _batched(arrays: np.ndarray, max_workers: int) -> np.ndarray:
+    return remove_ring_artifact(arrays=arrays, max_workers=max_workers)
+
+
+def _time_correction(correct, stack: np.ndarray, max_workers: int, repeat: int) -> tuple:
+    """Return the best wall time out of ``repeat`` corrections, and the corrected stack."""
+    best = float("inf")
+    for _ in range(repeat):
+        arrays = stack.copy()
+        start = time.perf_counter()
+        correct(arrays, max_workers)
+        best = min(best, time.perf_counter() - start)
+    return best, arrays
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--shape", type=int, nargs=3, default=[720, 256, 512], help="angles, rows and columns of the stack"
+    )
+    parser.add_argument("--dtype", default="float32", help="data type of the stack (default: %(default)s)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="worker counts to try")
+    parser.add_argument("--repeat", type=int, default=3, help="number of repetitions per measurement")
+    args = parser.parse_args(args)
+
+    # flat field with a few multiplicative stripes, as left by miscalibrated pixels
+    rng = np.random.default_rng(0)
+    stack = (0.5 + rng.random(args.shape)).astype(args.dtype)
+    stripes = rng.integers(0, args.shape[2], size=args.shape[2] // 50)
+    stack[:, :, stripes] *= 1.05
+    print(f"stack {'x'.join(map(str, args.shape))} {args.dtype}, {stack.nbytes / 1024**2:.0f} MiB")
+    print(f"{'workers':>8} | {'per sinogram (s)':>16} | {'batched (s)':>11} | {'speedup':>7}")
+    warm_pool(max(args.workers))
+    try:
+        for max_workers in args.workers:
+            per_sinogram, expected = _time_correction(_per_sinogram, stack, max_workers, args.repeat)
+            batched, result = _time_correction(_batched, stack, max_workers, args.repeat)
+            if not np.array_equal(result, expected):
+                raise SystemExit(
+                    f"The batched correction differs from the per-sinogram one with {max_workers} workers"
+                )
+            print(f"{max_workers:>8} | {per_sinogram:>16.3f} | {batched:>11.3f} | {per_sinogram / batched:>6.1f}x")
+    finally:
+        shutdown_pool()
+
+
+if __name__ == "__main__":
+    main()
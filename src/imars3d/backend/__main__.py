@@ -10,7 +10,11 @@ This can be invoked using
 The built-in help will give the options when supplied a ``--help`` flag.
 """
 
-from imars3d.backend.workflow.engine import WorkflowEngineAuto
+from imars3d.backend.util.pool import warm_pool
+from imars3d.backend.workflow.engine import WorkflowEngineAuto, WorkflowEngineExitCodes
+from imars3d.backend.workflow.estimate import calibrate, format_estimate
+from imars3d.backend.workflow.snapshot import RegistrySnapshot
+import json
 import logging
 from pathlib import Path
 
@@ -29,7 +33,9 @@ def main(args=None):
         description="Execute a workflow from a preconfigured json document",
         epilog="https://imars3d.readthedocs.io/en/latest/",
     )
-    parser.add_argument("configfile", type=Path)
+    parser.add_argument(
+        "configfile", type=Path, nargs="?", help="Not allowed with --resume, which reads it from the snapshot"
+    )
     parser.add_argument(
         "-l",
         "--log",
@@ -38,8 +44,69 @@ def main(args=None):
         choices=["debug", "info", "warn", "error"],
         help="The log level (default: %(default)s)",
     )
+    parser.add_argument(
+        "--scheduler",
+        default="sequential",
+        choices=WorkflowEngineAuto.schedulers,
+        help="Run the tasks in order, or as soon as their inputs are ready (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=2,
+        help="Maximum number of tasks running concurrently with the dag scheduler (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Write the time and memory used by every task to a JSON report next to the log file",
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="Also write the profile as Chrome trace events, implies --profile",
+    )
+    parser.add_argument(
+        "--warm-pool",
+        action="store_true",
+        help="Start the worker processes shared by the parallel filters before running the workflow",
+    )
+    parser.add_argument(
+        "--estimate",
+        action="store_true",
+        help="Print the size of the task outputs, the peak memory and the runtime of the workflow without running it",
+    )
+    parser.add_argument(
+        "--memory-gb",
+        type=float,
+        help="Memory available to the workflow for --estimate (default: the memory available on this node)",
+    )
+    parser.add_argument(
+        "--calibration",
+        nargs="+",
+        type=Path,
+        default=[],
+        help="Profile reports of previous runs (see --profile) to derive the runtime of the tasks for --estimate",
+    )
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="Save the outputs of every task to <workingdir>/snapshot, so that a failed run can be resumed",
+    )
+    parser.add_argument(
+        "--resume",
+        type=Path,
+        metavar="WORKDIR",
+        help="Resume the run snapshotted in the working directory WORKDIR from its first incomplete task, "
+        "with the configuration it was started with",
+    )
     # configure
     args = parser.parse_args(args)
+    if args.configfile is None and args.resume is None:
+        parser.error("the configfile is required unless resuming a run with --resume")
+    if args.configfile is not None and args.resume is not None:
+        # the snapshot is only valid for the configuration it was taken with
+        parser.error("the configfile cannot be given with --resume, the run resumes with the snapshotted one")
 
     # configure logging
     logging.basicConfig()  # setup default handlers and formatting
@@ -48,9 +115,37 @@ def main(args=None):
         handler.setLevel(args.log.upper())
     logger = logging.getLogger("imars3d.backend")
 
+    config = args.configfile
+    if args.resume is not None:
+        try:
+            config = RegistrySnapshot.read_config(args.resume / "snapshot")
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"No run to resume in {args.resume}: {e}")
+            return WorkflowEngineExitCodes.ERROR_GENERAL.value
+    workflow = WorkflowEngineAuto(
+        config,
+        scheduler=args.scheduler,
+        max_workers=args.workers,
+        profile=args.profile,
+        trace=args.trace,
+        snapshot=args.snapshot,
+        resume=args.resume is not None,
+    )
+    if args.estimate:
+        reports = [json.loads(path.read_text()) for path in args.calibration]
+        estimate = workflow.estimate(
+            memory_bytes=None if args.memory_gb is None else int(args.memory_gb * 1024**3),
+            seconds_per_pixel=calibrate(reports),
+        )
+        print(format_estimate(estimate))
+        return (
+            WorkflowEngineExitCodes.SUCCESS.value if estimate["fits"] else WorkflowEngineExitCodes.ERROR_MEMORY.value
+        )
+
     # run the workflow
-    logger.info(f'Processing data using "{args.configfile}"')
-    workflow = WorkflowEngineAuto(args.configfile)
+    logger.info(f'Processing data using "{args.configfile or args.resume}"')
+    if args.warm_pool:
+        warm_pool()
     return workflow.run()
 
 
@@ -4,18 +4,22 @@
 import logging
 import param
 import numpy as np
-from imars3d.backend.util.functions import clamp_max_workers, calculate_chunksize
-from multiprocessing.managers import SharedMemoryManager
-from functools import partial
-from tqdm.contrib.concurrent import process_map
-from algotom.prep.correction import beam_hardening_correction as algotom_beam_hardening_correction
+from imars3d.backend.util.functions import clamp_max_workers, output_target, result_dtype
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
 logger = logging.getLogger(__name__)
 
+# size of the blocks of images corrected at once, small enough to stay in the processor cache
+_BLOCK_BYTES = 16 * 1024**2
+
 
 class beam_hardening_correction(param.ParameterizedFunction):
     """Imaging correction for beam hardening.
 
+    Applies the response curve of ``algotom.prep.correction.beam_hardening_correction``, which is
+    pointwise, to blocks of images with in-place arithmetic, in threads.
+
     Parameters
     ----------
     arrays: np.ndarray
@@ -27,9 +31,15 @@ class beam_hardening_correction(param.ParameterizedFunction):
     opt: bool
         If True, correction biased towards 1.0, else correction biased towards 0.0.
     max_workers: int
-        The maximum number of workers to use for parallel processing.
+        The maximum number of threads correcting blocks of images.
     tqdm_class: panel.widgets.Tqdm
-        Class to be used for rendering tqdm progress
+        Class to be used for rendering tqdm progress, unused as the correction is quick.
+    inplace: bool
+        Write the result into arrays instead of a new array.
+    out: np.ndarray
+        Array to write the result into instead of a new array.
+    dtype: str
+        Floating point data type of the result when it is a new array, float32 by default.
 
     Returns
     -------
@@ -61,6 +71,9 @@ class beam_hardening_correction(param.ParameterizedFunction):
         bounds=(0, None),
     )
     tqdm_class = param.ClassSelector(class_=object, doc="Progress bar to render with")
+    inplace = param.Boolean(default=False, doc="Write the result into arrays instead of a new array.")
+    out = param.Array(default=None, doc="Array to write the result into instead of a new array.")
+    dtype = param.String(default="float32", doc="Floating point data type of the result when it is a new array.")
 
     def __call__(self, **params):
         """Perform the beam hardening correction."""
@@ -73,26 +86,122 @@ class beam_hardening_correction(param.ParameterizedFunction):
         self.max_workers = clamp_max_workers(params.max_workers)
         logger.debug(f"max_worker={self.max_workers}")
 
-        if params.arrays.ndim == 2:
-            return algotom_beam_hardening_correction(params.arrays, params.q, params.n, params.opt)
-        elif params.arrays.ndim == 3:
-            with SharedMemoryManager() as smm:
-                shm = smm.SharedMemory(params.arrays.nbytes)
-                shm_arrays = np.ndarray(params.arrays.shape, dtype=params.arrays.dtype, buffer=shm.buf)
-                np.copyto(shm_arrays, params.arrays)
-                # mp
-                kwargs = {
-                    "max_workers": self.max_workers,
-                    "chunksize": calculate_chunksize(params.arrays.shape[0], self.max_workers),
-                    "desc": "denoise_by_bilateral",
-                }
-                if self.tqdm_class:
-                    kwargs["tqdm_class"] = self.tqdm_class
-                rst = process_map(
-                    partial(algotom_beam_hardening_correction, q=params.q, n=params.n, opt=params.opt),
-                    [shm_arrays[i] for i in range(shm_arrays.shape[0])],
-                    **kwargs,
-                )
-                return np.array(rst)
-        else:
+        if params.arrays.ndim not in (2, 3):
             raise ValueError("The input array must be either 2D or 3D.")
+        if bool(params.tqdm_class):
+            logger.info("Ignoring supplied progress bar indicator")
+        dtype = result_dtype(params.arrays, params.dtype)
+        if not np.issubdtype(dtype, np.floating):
+            raise ValueError(f"Corrected images cannot be of type {dtype}")
+        # check the whole stack before modifying any block of it
+        _check_beam_hardening(params.arrays, params.n)
+        target = output_target(params.arrays, params.inplace, params.out, dtype)
+        if target is None:
+            target = np.empty(params.arrays.shape, dtype=dtype)
+
+        copy = target is not params.arrays
+        arrays = params.arrays[np.newaxis] if params.arrays.ndim == 2 else params.arrays
+        output = target[np.newaxis] if target.ndim == 2 else target
+        block = max(1, _BLOCK_BYTES // max(1, 8 * output[0].size))
+
+        def process(start):
+            source = arrays[start : start + block] if copy else None
+            _beam_hardening_block(output[start : start + block], params.q, params.n, params.opt, source)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            list(pool.map(process, range(0, len(output), block)))
+        logger.info("FINISHED beam hardening correction.")
+        return target
+
+
+# use _func to avoid sphinx pulling it into docs
+def _beam_hardening_block(
+    out: np.ndarray, q: float, n: float, opt: bool = True, source: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Write the beam hardening correction of a block of images into ``out``, without checking the input.
+
+    The curve is computed in double precision as algotom does, in a scratch block for a single
+    precision result, e.g. for the images of value 0 to be corrected to 0 exactly.
+
+    Parameters
+    ----------
+    out:
+        floating point images receiving the correction, also the images to correct if ``source`` is None.
+    q:
+        positive number.
+    n:
+        number larger than or equal to 2.
+    opt:
+        if True, curve towards 1.0, else towards 0.0.
+    source:
+        the images to correct, if they are not ``out``.
+
+    Returns
+    -------
+        ``out``.
+    """
+    source = out if source is None else source
+    if np.promote_types(out.dtype, np.float64) != out.dtype:
+        corrected = source.astype(np.float64)
+        _beam_hardening_inplace(corrected, q, n, opt, check=False)
+        np.copyto(out, corrected, casting="same_kind")
+        return out
+    if source is not out:
+        np.copyto(out, source, casting="unsafe")
+    return _beam_hardening_inplace(out, q, n, opt, check=False)
+
+
+# use _func to avoid sphinx pulling it into docs
+def _check_beam_hardening(arrays: np.ndarray, n: float) -> None:
+    """Raise the errors of ``algotom.prep.correction.beam_hardening_correction``."""
+    if n < 2.0:
+        raise ValueError("n must be larger than or equal to 2")
+    if arrays.size and np.max(arrays) >= 2.0:
+        raise ValueError("Input image must be normalized, i.e. gray-scales are in the range of [0.0, 1.0]")
+
+
+# use _func to avoid sphinx pulling it into docs
+def _beam_hardening_inplace(
+    arrays: np.ndarray, q: float, n: float, opt: bool = True, check: bool = True
+) -> np.ndarray:
+    """
+    Apply the response curve of ``algotom.prep.correction.beam_hardening_correction`` in place.
+
+    The curve is pointwise, so it is applied with in-place ufuncs and a single temporary
+    array instead of one Python call per image.
+
+    Parameters
+    ----------
+    arrays:
+        normalized floating point images, modified in place.
+    q:
+        positive number.
+    n:
+        number larger than or equal to 2.
+    opt:
+        if True, curve towards 1.0, else towards 0.0.
+    check:
+        whether to check n and the range of the arrays, as algotom does.
+
+    Returns
+    -------
+        the corrected arrays.
+    """
+    if check:
+        _check_beam_hardening(arrays, n)
+    num = np.log(1.0 - q * (1.0 - n))
+    if opt:
+        np.subtract(1.0, arrays, out=arrays)
+    # log(1 - q * (x**n - n * x)) / num
+    power = np.power(arrays, n)
+    np.multiply(arrays, n, out=arrays)
+    np.subtract(power, arrays, out=arrays)
+    del power
+    np.multiply(arrays, -q, out=arrays)
+    np.add(arrays, 1.0, out=arrays)
+    np.log(arrays, out=arrays)
+    np.divide(arrays, num, out=arrays)
+    if opt:
+        np.subtract(1.0, arrays, out=arrays)
+    return arrays
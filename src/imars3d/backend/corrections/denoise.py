@@ -3,19 +3,29 @@
 """Image noise reduction (denoise) module."""
 import logging
 import param
-from imars3d.backend.util.functions import clamp_max_workers, calculate_chunksize
+from imars3d.backend.util.functions import (
+    astype_result,
+    clamp_max_workers,
+    output_target,
+    result_dtype,
+    store_result,
+)
 import numpy as np
 import tomopy
-from multiprocessing.managers import SharedMemoryManager
-from tqdm.contrib.concurrent import process_map
+from imars3d.backend.util.shared import map_slices
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
+from typing import Optional
 from scipy.signal import convolve2d
-from scipy.ndimage import median_filter
+from scipy.ndimage import gaussian_filter, median_filter
 from skimage.restoration import denoise_bilateral
 
 
 logger = logging.getLogger(__name__)
 
+# number of pixels in the blocks of images denoised at once by denoise_by_bilateral_fast
+_GRID_BLOCK_PIXELS = 2**20
+
 
 def measure_noiseness(image: np.ndarray) -> float:
     """Measure the noiseness of the image.
@@ -110,7 +120,13 @@ def denoise_by_median(
 
 
 def denoise_by_bilateral(
-    arrays: np.ndarray, sigma_color: float = 0.02, sigma_spatial: float = 5.0, max_workers: int = 0, tqdm_class=None
+    arrays: np.ndarray,
+    sigma_color: float = 0.02,
+    sigma_spatial: float = 5.0,
+    max_workers: int = 0,
+    tqdm_class=None,
+    out: Optional[np.ndarray] = None,
+    dtype: Optional[np.dtype] = None,
 ) -> np.ndarray:
     """
     Denoise the image stack with the bilateral filter.
@@ -127,6 +143,10 @@ def denoise_by_bilateral(
         The number of cores to use for parallel processing, default is 0, which means using all available cores.
     tqdm_class: panel.widgets.Tqdm
         Class to be used for rendering tqdm progress
+    out:
+        Array to write the denoised image stack into, can be ``arrays`` itself.
+    dtype:
+        Data type of the denoised image stack when ``out`` is not given, float64 by default.
 
     Returns
     -------
@@ -135,41 +155,163 @@ def denoise_by_bilateral(
     # NOTE:
     #  The bilateral filter based denoise method can be contributed back to tomopy
     #  upstream.
+    denoise_2d = partial(denoise_by_bilateral_2d, sigma_color=sigma_color, sigma_spatial=sigma_spatial)
+    if dtype is not None and out is None:
+        # convert every image as it is denoised instead of the whole stack at the end
+        denoise_2d = astype_result(denoise_2d, dtype)
     if arrays.ndim == 2:
-        return denoise_by_bilateral_2d(arrays)
+        rst = denoise_2d(arrays)
+        if out is None:
+            return rst
+        np.copyto(out, rst, casting="unsafe")
+        return out
     elif arrays.ndim == 3:
         max_workers = clamp_max_workers(max_workers)
-        with SharedMemoryManager() as smm:
-            # create the shared memory
-            shm = smm.SharedMemory(arrays.nbytes)
-            # create a numpy array point to the shared memory
-            shm_arrays = np.ndarray(
-                arrays.shape,
-                dtype=arrays.dtype,
-                buffer=shm.buf,
-            )
-            # copy the data to the shared memory
-            np.copyto(shm_arrays, arrays)
-            # mp
-            kwargs = {
-                "max_workers": max_workers,
-                "chunksize": calculate_chunksize(arrays.shape[0], max_workers),
-                "desc": "denoise_by_bilateral",
-            }
-            if tqdm_class:
-                kwargs["tqdm_class"] = tqdm_class
-
-            rst = process_map(
-                partial(denoise_by_bilateral_2d, sigma_color=sigma_color, sigma_spatial=sigma_spatial),
-                [img for img in shm_arrays],
-                **kwargs,
-            )
+        rst = map_slices(
+            denoise_2d,
+            arrays,
+            out=out,
+            max_workers=max_workers,
+            desc="denoise_by_bilateral",
+            tqdm_class=tqdm_class,
+        )
         logger.info("denoise completed via bilateral filter")
-        return np.array(rst)
+        return rst
     else:
         raise ValueError("Unsupported image dimension: {}".format(arrays.ndim))
 
 
+def denoise_by_bilateral_fast(
+    arrays: np.ndarray,
+    sigma_color: float = 0.02,
+    sigma_spatial: float = 5.0,
+    max_workers: int = 0,
+    out: Optional[np.ndarray] = None,
+    dtype: Optional[np.dtype] = None,
+    sampling: float = 1.0,
+    max_levels: int = 256,
+) -> np.ndarray:
+    """
+    Denoise the image stack with an approximation of the bilateral filter on a bilateral grid.
+
+    The pixels of a block of images are accumulated into a grid downsampled by ``sigma_spatial / sampling``
+    in space and ``sigma_color / sampling`` in intensity, the grid is blurred with a small Gaussian,
+    and the denoised pixels are interpolated from it. The cost per pixel is then independent of the size
+    of the window of the bilateral filter. Same filter as ``denoise_by_bilateral`` (whose normalization
+    by the maximum of each image cancels out), up to the discretization of the grid,
+    see ``scripts/benchmark_bilateral.py``.
+
+    Parameters
+    ----------
+    arrays:
+        The image stack to denoise.
+    sigma_color:
+        Standard deviation for grayvalue/color distance (radiometric similarity).
+    sigma_spatial:
+        Standard deviation for range distance.
+    max_workers:
+        The number of threads denoising blocks of images, default is 0, which means using all available cores.
+    out:
+        Array to write the denoised image stack into, can be ``arrays`` itself.
+    dtype:
+        Data type of the denoised image stack when ``out`` is not given, float64 by default.
+    sampling:
+        Number of grid cells per standard deviation, larger values are more accurate and slower.
+    max_levels:
+        Maximum number of intensity levels of the grid, the intensity is sampled more coarsely for images
+        spanning more than ``max_levels * sigma_color / sampling``.
+
+    Returns
+    -------
+        The denoised image stack.
+    """
+    if arrays.ndim not in (2, 3):
+        raise ValueError(f"Unsupported image dimension: {arrays.ndim}")
+    if out is None:
+        out = np.empty(arrays.shape, dtype=np.float64 if dtype is None else dtype)
+    stack = arrays[np.newaxis] if arrays.ndim == 2 else arrays
+    target = out[np.newaxis] if out.ndim == 2 else out
+    block = max(1, _GRID_BLOCK_PIXELS // max(1, stack[0].size))
+
+    def process(start):
+        target[start : start + block] = _bilateral_grid(
+            stack[start : start + block], sigma_color, sigma_spatial, sampling, max_levels
+        )
+
+    with ThreadPoolExecutor(max_workers=clamp_max_workers(max_workers)) as pool:
+        list(pool.map(process, range(0, len(stack), block)))
+    logger.info("denoise completed via bilateral grid")
+    return out
+
+
+# use _func to avoid sphinx pulling it into docs
+def _bilateral_grid(
+    images: np.ndarray, sigma_color: float, sigma_spatial: float, sampling: float, max_levels: int
+) -> np.ndarray:
+    """Bilateral filter of a block of images on a bilateral grid, in double precision."""
+    images = np.asarray(images, dtype=np.float64)
+    num_images, height, width = images.shape
+    lows = images.min(axis=(1, 2))
+    spread = float(np.max(images.max(axis=(1, 2)) - lows))
+    spatial_step = sigma_spatial / sampling
+    range_step = sigma_color / sampling
+    if spread / range_step > max_levels - 2:
+        logger.warning(f"Intensity spread {spread} sampled with {max_levels} levels, coarser than sigma_color")
+        range_step = spread / (max_levels - 2)
+    # grid coordinates of the pixels, intensities from the minimum of each image
+    z = (images - lows[:, np.newaxis, np.newaxis]) / range_step
+    y = np.arange(height) / spatial_step
+    x = np.arange(width) / spatial_step
+    shape = (num_images, int(z.max()) + 2, int(y[-1]) + 2, int(x[-1]) + 2)
+    # accumulate the pixels into their nearest cell, weighted sums and counts
+    cells = np.ravel_multi_index(
+        (
+            np.arange(num_images)[:, np.newaxis, np.newaxis],
+            np.rint(z).astype(np.intp),
+            np.rint(y).astype(np.intp)[:, np.newaxis],
+            np.rint(x).astype(np.intp),
+        ),
+        shape,
+    ).ravel()
+    size = int(np.prod(shape))
+    sums = np.bincount(cells, weights=images.ravel(), minlength=size).reshape(shape)
+    counts = np.bincount(cells, minlength=size).astype(np.float64).reshape(shape)
+    del cells
+    # the nearest cell and the linear interpolation add variances of 1/12 and 1/6 cell squared
+    blur = np.sqrt(max(sampling**2 - 0.25, 0.0))
+    for grid in (sums, counts):
+        gaussian_filter(grid, sigma=(0, blur, blur, blur), mode="constant", output=grid)
+    # trilinear interpolation of the blurred grid at the pixels, one axis at a time
+    z0 = np.minimum(z.astype(np.intp), shape[1] - 2)
+    y0 = np.minimum(y.astype(np.intp), shape[2] - 2)
+    x0 = np.minimum(x.astype(np.intp), shape[3] - 2)
+    fz = z - z0
+    fy = (y - y0)[:, np.newaxis]
+    fx = x - x0
+    base = np.ravel_multi_index((np.arange(num_images)[:, np.newaxis, np.newaxis], z0, y0[:, np.newaxis], x0), shape)
+    del z, z0
+    rows, planes = shape[3], shape[2] * shape[3]
+
+    def interpolate(grid):
+        flat = grid.ravel()
+        along_z = []
+        for dz in (0, planes):
+            along_y = []
+            for dy in (0, rows):
+                left = np.take(flat, base + (dz + dy))
+                right = np.take(flat, base + (dz + dy + 1))
+                along_y.append(left + fx * (right - left))
+            along_z.append(along_y[0] + fy * (along_y[1] - along_y[0]))
+        return along_z[0] + fz * (along_z[1] - along_z[0])
+
+    denoised = interpolate(sums)
+    weights = interpolate(counts)
+    valid = weights > 0
+    np.divide(denoised, weights, out=denoised, where=valid)
+    np.copyto(denoised, images, where=~valid)
+    return denoised
+
+
 def denoise_by_bilateral_2d(
     array_2d: np.ndarray,
     sigma_color: float = 0.02,
@@ -196,7 +338,7 @@ def denoise_by_bilateral_2d(
     array2d_max = array_2d.max()
     logger.debug(f"denoise_by_bilateral_2d:array2d_max = {array2d_max}")
     _sigma_color = sigma_color / array2d_max
-    array_2d /= array2d_max
+    array_2d = array_2d / array2d_max
     array_2d = denoise_bilateral(array_2d, sigma_color=_sigma_color, sigma_spatial=sigma_spatial)
     return array_2d * array2d_max
 
@@ -210,17 +352,24 @@ class denoise(param.ParameterizedFunction):
     arrays: np.ndarray
         The image stack to denoise.
     method: str = 'bilateral'
-        The denoise method to use.
+        The denoise method to use, 'bilateral_fast' approximates the bilateral filter on a bilateral grid,
+        which is much faster for large stacks.
     median_filter_kernel: int = 3
         The kernel size of the median filter, only valid for 'median' method.
     bilateral_sigma_color: float = 0.02
-        The sigma of the color/gray space, only valid for 'bilateral' method.
+        The sigma of the color/gray space, only valid for 'bilateral' and 'bilateral_fast' methods.
     bilateral_sigma_spatial: float = 5.
-        The sigma of the spatial space, only valid for 'bilateral' method.
+        The sigma of the spatial space, only valid for 'bilateral' and 'bilateral_fast' methods.
     max_workers: int = 0
         The number of cores to use for parallel processing, default is 0, which means using all available cores.
     tqdm_class: panel.widgets.Tqdm
         Class to be used for rendering tqdm progress
+    inplace: bool = False
+        Write the result into arrays instead of a new array.
+    out: np.ndarray = None
+        Array to write the result into instead of a new array.
+    dtype: str = "float32"
+        Data type of the result when it is a new array, "same" for the data type of arrays.
 
     Returns
     -------
@@ -230,7 +379,7 @@ class denoise(param.ParameterizedFunction):
     arrays = param.Array(doc="The image stack to denoise.", default=None)
     method = param.Selector(
         default="bilateral",
-        objects=["median", "bilateral"],
+        objects=["median", "bilateral", "bilateral_fast"],
         doc="The denoise method to use.",
     )
     median_filter_kernel = param.Integer(
@@ -241,12 +390,12 @@ class denoise(param.ParameterizedFunction):
     bilateral_sigma_color = param.Number(
         default=0.02,
         bounds=(0.0, None),
-        doc="The sigma of the color/gray space, only valid for 'bilateral' method.",
+        doc="The sigma of the color/gray space, only valid for 'bilateral' and 'bilateral_fast' methods.",
     )
     bilateral_sigma_spatial = param.Number(
         default=5.0,
         bounds=(0.0, None),
-        doc="The sigma of the spatial space, only valid for 'bilateral' method.",
+        doc="The sigma of the spatial space, only valid for 'bilateral' and 'bilateral_fast' methods.",
     )
     max_workers = param.Integer(
         default=0,
@@ -254,6 +403,11 @@ class denoise(param.ParameterizedFunction):
         doc="The number of cores to use for parallel processing, default is 0, which means using all available cores.",
     )
     tqdm_class = param.ClassSelector(class_=object, doc="Progress bar to render with")
+    inplace = param.Boolean(default=False, doc="Write the result into arrays instead of a new array.")
+    out = param.Array(default=None, doc="Array to write the result into instead of a new array.")
+    dtype = param.String(
+        default="float32", doc='Data type of the result when it is a new array, "same" for the data type of arrays.'
+    )
 
     def __call__(self, **params):
         """Call the denoise function."""
@@ -266,24 +420,44 @@ class denoise(param.ParameterizedFunction):
         # type validation is done, now replacing max_worker with an actual integer
         self.max_workers = clamp_max_workers(params.max_workers)
         logger.debug(f"max_worker={self.max_workers}")
+        dtype = result_dtype(params.arrays, params.dtype)
         denoised_array = None
         if params.method == "median":
             logger.info("Executing Filter: Denoise Filter with median filter")
             if bool(params.tqdm_class):
                 logger.info("Ignoring supplied progress bar indicator")
+            # the medians have the data type of the arrays
+            target = output_target(params.arrays, params.inplace, params.out)
             denoised_array = denoise_by_median(
                 arrays=params.arrays,
                 median_filter_kernel=params.median_filter_kernel,
                 max_workers=self.max_workers,
             )
+            denoised_array = store_result(denoised_array, target, dtype)
         elif params.method == "bilateral":
             logger.info("Executing Filter: Denoise Filter with bilateral filter")
+            target = output_target(params.arrays, params.inplace, params.out, np.float64)
             denoised_array = denoise_by_bilateral(
                 arrays=params.arrays,
                 sigma_color=params.bilateral_sigma_color,
                 sigma_spatial=params.bilateral_sigma_spatial,
                 max_workers=self.max_workers,
                 tqdm_class=params.tqdm_class,
+                out=target,
+                dtype=dtype,
+            )
+        elif params.method == "bilateral_fast":
+            logger.info("Executing Filter: Denoise Filter with bilateral grid")
+            if bool(params.tqdm_class):
+                logger.info("Ignoring supplied progress bar indicator")
+            target = output_target(params.arrays, params.inplace, params.out, np.float64)
+            denoised_array = denoise_by_bilateral_fast(
+                arrays=params.arrays,
+                sigma_color=params.bilateral_sigma_color,
+                sigma_spatial=params.bilateral_sigma_spatial,
+                max_workers=self.max_workers,
+                out=target,
+                dtype=dtype,
             )
         else:
             # NOTE:
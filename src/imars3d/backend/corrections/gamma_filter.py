@@ -3,7 +3,7 @@
 """iMars3D: gamma filter module."""
 import logging
 import param
-from imars3d.backend.util.functions import clamp_max_workers
+from imars3d.backend.util.functions import clamp_max_workers, output_target, result_dtype, store_result
 import numpy as np
 import tomopy
 
@@ -17,6 +17,7 @@ class gamma_filter(param.ParameterizedFunction):
     Replace near saturated pixels (due to gamma radiation) with median values.
     The median filtering is carried out by tomopy.remove_outlier.
     If selective median filtering is enabled (default), only the pixels greater than the specified threshold are replaced.
+    In sparse mode, the median is only computed around these pixels.
 
     Parameters
     ----------
@@ -34,6 +35,16 @@ class gamma_filter(param.ParameterizedFunction):
         whether to use selective median filtering, default is True.
     diff_tomopy: float = -1
         threshold passed to tomopy for median filter based outlier detection. Negative values will use the internal default value (see source code).
+    sparse: bool = False
+        with selective median filtering, only compute the median around the pixels above the threshold.
+        Time scales with the number of such pixels instead of the size of the stack, and with ``inplace``
+        no memory is allocated beyond them.
+    inplace: bool = False
+        write the result into arrays instead of a new array.
+    out: np.ndarray = None
+        array to write the result into instead of a new array.
+    dtype: str = "float32"
+        data type of the result when it is a new array, "same" for the data type of arrays.
 
     Returns
     -------
@@ -69,6 +80,15 @@ class gamma_filter(param.ParameterizedFunction):
         default=-1,
         doc="threshold passed to tomopy for median filter based outlier detection. Negative values will use the internal default value (see source code).",
     )
+    sparse = param.Boolean(
+        default=False,
+        doc="with selective median filtering, only compute the median around the pixels above the threshold.",
+    )
+    inplace = param.Boolean(default=False, doc="write the result into arrays instead of a new array")
+    out = param.Array(default=None, doc="array to write the result into instead of a new array")
+    dtype = param.String(
+        default="float32", doc='data type of the result when it is a new array, "same" for the data type of arrays'
+    )
 
     def __call__(self, **params):
         """Replace near saturated pixels (due to gamma radiation) with median values."""
@@ -98,6 +118,19 @@ class gamma_filter(param.ParameterizedFunction):
         # NOTE: use 20% of the total dynamic range as the outlier detection criterion
         diff_tomopy = 0.2 * saturation_intensity if params.diff_tomopy < 0.0 else params.diff_tomopy
         logger.debug(f"diff_tomopy={diff_tomopy}")
+        # the medians have the data type of the arrays
+        target = output_target(params.arrays, params.inplace, params.out)
+        dtype = result_dtype(params.arrays, params.dtype)
+        if params.selective_median_filter and params.sparse:
+            if target is None:
+                target = params.arrays.astype(dtype)
+            elif target is not params.arrays:
+                np.copyto(target, params.arrays, casting="unsafe")
+            num_replaced = _sparse_gamma_filter(target, threshold, diff_tomopy, params.median_kernel, params.axis)
+            logger.debug(f"replaced {num_replaced} pixels")
+            logger.info("FINISHED Executing Filter: Gamma Filter")
+            return target
+
         # median filtering
         arrays_filtered = tomopy.remove_outlier(
             params.arrays,
@@ -111,13 +144,72 @@ class gamma_filter(param.ParameterizedFunction):
         # selective replacement
         if params.selective_median_filter:
             logger.debug("use selective median filtering")
-            arrays_filtered = np.where(
-                params.arrays > threshold,
-                arrays_filtered,
-                params.arrays,
-            )
+            saturated = params.arrays > threshold
+            if target is params.arrays:
+                # only the saturated pixels change
+                np.copyto(target, arrays_filtered, casting="unsafe", where=saturated)
+                arrays_filtered = target
+            elif np.can_cast(params.arrays.dtype, arrays_filtered.dtype):
+                np.copyto(arrays_filtered, params.arrays, where=~saturated)
+            else:
+                arrays_filtered = np.where(saturated, arrays_filtered, params.arrays)
+            del saturated
         logger.debug(f"arrays_selective_filtered.shape={arrays_filtered.shape}")
 
         #
         logger.info("FINISHED Executing Filter: Gamma Filter")
-        return arrays_filtered
+        return store_result(arrays_filtered, target, dtype)
+
+
+# use _func to avoid sphinx pulling it into docs
+def _reflect(index: np.ndarray, size: int) -> np.ndarray:
+    """Fold indices into ``[0, size)`` as ``scipy.ndimage`` does in "reflect" mode, i.e. ``d c b a | a b c d | d c b a``."""
+    index = np.mod(index, 2 * size)
+    return np.where(index < size, index, 2 * size - 1 - index)
+
+
+# use _func to avoid sphinx pulling it into docs
+def _candidates(arrays: np.ndarray, threshold: float, block: int = 16) -> tuple:
+    """Indices of the pixels above the threshold, a few images at a time to avoid a mask of the whole stack."""
+    found = []
+    for start in range(0, arrays.shape[0], block):
+        coords = np.nonzero(arrays[start : start + block] > threshold)
+        found.append((coords[0] + start,) + coords[1:])
+    return tuple(np.concatenate(coords) for coords in zip(*found))
+
+
+# use _func to avoid sphinx pulling it into docs
+def _sparse_gamma_filter(
+    arrays: np.ndarray, threshold: float, dif: float, size: int, axis: int, batch: int = 65536
+) -> int:
+    """Selective gamma filter computing the median around the pixels above the threshold only, in place.
+
+    Same results as ``tomopy.remove_outlier`` (a median filter of the given size across ``axis``,
+    then replacing the pixels exceeding the median by ``dif`` or more) restricted to the pixels
+    above the threshold.
+
+    Returns
+    -------
+        The number of pixels replaced.
+    """
+    coords = _candidates(arrays, threshold)
+    if coords[0].size == 0:
+        return 0
+    # footprint of scipy.ndimage.median_filter in the planes across axis
+    dims = [dim for dim in range(arrays.ndim) if dim != axis]
+    offsets = np.arange(size) - size // 2
+    grids = [grid.ravel() for grid in np.meshgrid(*[offsets] * len(dims), indexing="ij")]
+    # the medians are computed from the original values before any pixel is replaced
+    medians = np.empty(coords[0].size, dtype=arrays.dtype)
+    for start in range(0, coords[0].size, batch):
+        index = [c[start : start + batch, np.newaxis] for c in coords]
+        for dim, grid in zip(dims, grids):
+            index[dim] = _reflect(index[dim] + grid, arrays.shape[dim])
+        neighbours = arrays[tuple(index)]
+        rank = neighbours.shape[1] // 2
+        medians[start : start + batch] = np.partition(neighbours, rank, axis=1)[:, rank]
+    # tomopy compares in single precision
+    values = arrays[coords].astype(np.float32)
+    replace = (values - medians.astype(np.float32)).astype(np.float64) >= dif
+    arrays[tuple(c[replace] for c in coords)] = medians[replace]
+    return int(np.count_nonzero(replace))
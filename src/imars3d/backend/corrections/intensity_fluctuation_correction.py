@@ -2,13 +2,12 @@
 # -*- coding: utf-8 -*-
 """iMars3D's intensity fluctuation correction module."""
 import logging
-from imars3d.backend.util.functions import clamp_max_workers, calculate_chunksize
+from imars3d.backend.util.functions import clamp_max_workers
 import numpy as np
 import param
 import tomopy
 from skimage import feature
-from multiprocessing.managers import SharedMemoryManager
-from tqdm.contrib.concurrent import process_map
+from imars3d.backend.util.shared import map_slices
 from functools import partial
 
 logger = logging.getLogger(__name__)
@@ -79,32 +78,13 @@ class intensity_fluctuation_correction(param.ParameterizedFunction):
         # process
         if air_pixels < 0:
             # auto air region detection
-            with SharedMemoryManager() as smm:
-                # create the shared memory
-                shm = smm.SharedMemory(ct.nbytes)
-                # create a numpy array point to the shared memory
-                shm_arrays = np.ndarray(
-                    ct.shape,
-                    dtype=ct.dtype,
-                    buffer=shm.buf,
-                )
-                # copy data
-                np.copyto(shm_arrays, ct)
-                # map the multiprocessing calls
-                kwargs = {
-                    "max_workers": max_workers,
-                    "chunksize": calculate_chunksize(ct.shape[0], max_workers),
-                    "desc": "intensity_fluctuation_correction",
-                }
-                if tqdm_class:
-                    kwargs["tqdm_class"] = tqdm_class
-                rst = process_map(
-                    partial(intensity_fluctuation_correction_skimage, sigma=sigma),
-                    [img for img in shm_arrays],
-                    **kwargs,
-                )
-            #
-            return np.array(rst)
+            return map_slices(
+                partial(intensity_fluctuation_correction_skimage, sigma=sigma),
+                ct,
+                max_workers=max_workers,
+                desc="intensity_fluctuation_correction",
+                tqdm_class=tqdm_class,
+            )
         else:
             # use tomopy process
             return tomopy.normalize_bg(ct, air=air_pixels, ncore=max_workers)
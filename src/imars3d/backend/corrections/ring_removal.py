@@ -3,16 +3,16 @@
 """iMars3D's ring artifact correction module."""
 import logging
 import param
-from imars3d.backend.util.functions import clamp_max_workers, calculate_chunksize
+from imars3d.backend.util.functions import calculate_chunksize, clamp_max_workers
 import scipy
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from tqdm.auto import tqdm
 
 try:
     import bm3d_streak_removal as bm3dsr
 except ImportError:
     bm3dsr = None
-from multiprocessing.managers import SharedMemoryManager
-from tqdm.contrib.concurrent import process_map
 from functools import partial
 
 logger = logging.getLogger(__name__)
@@ -220,42 +220,21 @@ class remove_ring_artifact(param.ParameterizedFunction):
         # sanity check
         if arrays.ndim != 3:
             raise ValueError("This correction can only be used for a stack, i.e. a 3D image.")
-        # NOTE:
-        # additional work is needed to avoid duplicating arrays in memory
         max_workers = clamp_max_workers(max_workers)
-        # use shared memory to reduce memory footprint
-        with SharedMemoryManager() as smm:
-            # create the shared memory
-            shm = smm.SharedMemory(arrays.nbytes)
-            # create a numpy array point to the shared memory
-            shm_arrays = np.ndarray(
-                arrays.shape,
-                dtype=arrays.dtype,
-                buffer=shm.buf,
-            )
-            # copy the data to the shared memory
-            np.copyto(shm_arrays, arrays)
-            # invoke mp via tqdm wrapper
-            kwargs = {
-                "max_workers": max_workers,
-                "chunksize": calculate_chunksize(arrays.shape[1], max_workers),
-                "desc": "Removing ring artifact",
-            }
-            if tqdm_class:
-                kwargs["tqdm_class"] = tqdm_class
-            rst = process_map(
-                partial(
-                    _remove_ring_artifact_Ketcham,
-                    kernel_size=kernel_size,
-                    sub_division=sub_division,
-                    correction_range=correction_range,
-                ),
-                [shm_arrays[:, sino_idx, :] for sino_idx in range(shm_arrays.shape[1])],
-                **kwargs,
-            )
-        rst = np.array(rst)
-        for i in range(arrays.shape[1]):
-            arrays[:, i, :] = rst[i]
+        # blocks of sinograms are corrected in place by threads, numpy and scipy.ndimage release the GIL
+        num_rows = arrays.shape[1]
+        rows_block = calculate_chunksize(num_rows, max_workers)
+        blocks = [arrays[:, lo : lo + rows_block, :] for lo in range(0, num_rows, rows_block)]
+        correct = partial(
+            _remove_ring_artifact_Ketcham_batch,
+            kernel_size=kernel_size,
+            sub_division=sub_division,
+            correction_range=correction_range,
+        )
+        progress = tqdm if tqdm_class is None else tqdm_class
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for _ in progress(pool.map(correct, blocks), total=len(blocks), desc="Removing ring artifact"):
+                pass
         return arrays
 
 
@@ -341,3 +320,45 @@ def _remove_ring_artifact_Ketcham(
     # use median to select the most probable correction ratio from all sub-sinograms
     corr_raio = np.median(corr_ratios, axis=0)
     return sinogram * corr_raio[np.newaxis, :]
+
+
+def _remove_ring_artifact_Ketcham_batch(
+    sinograms: np.ndarray,
+    kernel_size: int = 5,
+    sub_division: int = 10,
+    correction_range: tuple = (0.9, 1.1),
+) -> np.ndarray:
+    """Ketcham's correction of a slab of sinograms ``(n_angles, rows, width)``, in place.
+
+    Same as applying ``_remove_ring_artifact_Ketcham`` to every floating point sinogram
+    ``sinograms[:, i, :]``, but the sums, median smoothing and ratios are computed for all the
+    rows at once. Integer sinograms are summed in float64, instead of truncating the ratios.
+
+    Returns
+    -------
+        The corrected slab, i.e. ``sinograms`` itself.
+    """
+    # sanity check
+    if sinograms.ndim != 3:
+        raise ValueError("This correction can only be used for a slab of sinograms, i.e. a 3D image.")
+    if kernel_size % 2 == 0:
+        raise ValueError("Each element of kernel_size should be odd.")
+    # sub-divide the sinograms into smaller sections
+    edges = np.linspace(0, sinograms.shape[0], sub_division + 1).astype(int)
+    # the ratios of integer counts are computed in floating point, from sums exact in float64
+    dtype = np.result_type(sinograms.dtype, np.float32) if sinograms.dtype.kind == "f" else np.float64
+    sum_over_angle = np.stack(
+        [sinograms[bottom:top].sum(axis=0, dtype=dtype) for bottom, top in zip(edges[:-1], edges[1:])]
+    )
+    # avoid divide by zero issue when dealing with emission type sinogram
+    sum_over_angle[sum_over_angle == 0] = 1
+    # same as scipy.signal.medfilt along the detector columns
+    sum_over_angle_smoothed = scipy.ndimage.median_filter(sum_over_angle, size=(1, 1, kernel_size), mode="constant")
+    # correction ratio away from both ends, capped within the specified range
+    corr_ratios = np.ones_like(sum_over_angle)
+    interior = (slice(None), slice(None), slice(kernel_size, -kernel_size))
+    corr_ratios[interior] = sum_over_angle_smoothed[interior] / sum_over_angle[interior]
+    np.clip(corr_ratios, correction_range[0], correction_range[1], out=corr_ratios)
+    # use median to select the most probable correction ratio from all sub-sinograms
+    corr_ratio = np.median(corr_ratios, axis=0)
+    return np.multiply(sinograms, corr_ratio[np.newaxis], out=sinograms, casting="unsafe")
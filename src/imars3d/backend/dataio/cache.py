@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""On-disk caches of decoded image stacks and task results for iMars3D."""
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import threading
+import numpy as np
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+# setup module level logger
+logger = logging.getLogger(__name__)
+
+
+def file_signature(filelist: List[str], **options) -> str:
+    """
+    Compute a key that changes whenever any of the files, or the way they are read, changes.
+
+    Parameters
+    ----------
+    filelist:
+        list of files, in the order they are stacked.
+    options:
+        any additional (JSON serializable) setting that affects the decoded result.
+
+    Returns
+    -------
+        hex digest built from the path, size and modification time of every file.
+    """
+    digest = hashlib.sha256()
+    for filename in filelist:
+        try:
+            stat = os.stat(filename)
+            size, mtime = stat.st_size, stat.st_mtime_ns
+        except OSError:
+            size, mtime = -1, -1
+        digest.update(json.dumps([str(filename), size, mtime]).encode())
+    digest.update(json.dumps(options, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+class StackCache:
+    """
+    Least-recently-used cache of image stacks stored as ``.npy`` files.
+
+    Every entry consists of ``<key>.npy`` holding the stack and ``<key>.mask.npy`` holding
+    the mask of the files that were successfully loaded. Hits are returned as copy-on-write
+    memory maps, so modifying a cached stack in memory never alters the cache.
+
+    Parameters
+    ----------
+    cache_dir:
+        directory holding the cache, created if needed.
+    max_bytes:
+        the least recently used entries are evicted once the cache grows beyond this size.
+    """
+
+    def __init__(self, cache_dir: Union[str, Path], max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def _stack_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.npy"
+
+    def _mask_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.mask.npy"
+
+    def partial_path(self, key: str) -> Path:
+        """Return the file to write a stack to before it is committed with :meth:`commit`."""
+        return self.cache_dir / f"{key}.{os.getpid()}.partial"
+
+    def get(self, key: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Look up a stack.
+
+        Returns
+        -------
+            (stack, mask) if the key is cached, None otherwise.
+        """
+        stack_path, mask_path = self._stack_path(key), self._mask_path(key)
+        if not (stack_path.exists() and mask_path.exists()):
+            return None
+        try:
+            stack = np.load(str(stack_path), mmap_mode="c")
+            mask = np.load(str(mask_path))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding unreadable cache entry {stack_path}: {e}")
+            self._remove(key)
+            return None
+        # mark the entry as recently used
+        os.utime(stack_path)
+        logger.info(f"Cache hit {stack_path}")
+        return stack[: np.count_nonzero(mask)], mask
+
+    def commit(self, key: str, stack: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        """
+        Add a stack written to :meth:`partial_path` to the cache.
+
+        Parameters
+        ----------
+        key:
+            key of the entry.
+        stack:
+            the memory mapped stack backed by :meth:`partial_path`.
+        mask:
+            mask of the successfully loaded files, the valid images are at the front of the stack.
+
+        Returns
+        -------
+            the cached stack, reopened as a copy-on-write memory map.
+        """
+        if isinstance(stack, np.memmap):
+            stack.flush()
+        np.save(str(self._mask_path(key)), mask)
+        os.replace(self.partial_path(key), self._stack_path(key))
+        self.evict(keep=key)
+        return np.load(str(self._stack_path(key)), mmap_mode="c")[: np.count_nonzero(mask)]
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """Remove the least recently used entries until the cache fits within ``max_bytes``."""
+        entries = sorted(
+            (path for path in self.cache_dir.glob("*.npy") if not path.name.endswith(".mask.npy")),
+            key=lambda path: path.stat().st_mtime,
+        )
+        sizes = {path.stem: path.stat().st_size + self._mask_size(path.stem) for path in entries}
+        total = sum(sizes.values())
+        for path in entries:
+            if total <= self.max_bytes:
+                break
+            if path.stem == keep:
+                continue
+            logger.info(f"Evicting {path} from cache")
+            self._remove(path.stem)
+            total -= sizes[path.stem]
+
+    def _mask_size(self, key: str) -> int:
+        mask_path = self._mask_path(key)
+        return mask_path.stat().st_size if mask_path.exists() else 0
+
+    def _remove(self, key: str) -> None:
+        for path in (self._stack_path(key), self._mask_path(key)):
+            path.unlink(missing_ok=True)
+
+
+class MasterImageCache:
+    """
+    Master open beam and dark current images, i.e. reduced to a single image, shared across scans.
+
+    Every entry consists of ``<key>.npy`` holding the 2D image and ``<key>.json`` describing how
+    it was obtained (number of files, reduction, instrument metadata). The images are small, so
+    entries are never evicted.
+
+    Parameters
+    ----------
+    cache_dir:
+        directory holding the master images, created if needed.
+    """
+
+    def __init__(self, cache_dir: Union[str, Path]):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """
+        Look up a master image.
+
+        Returns
+        -------
+            the image if the key is cached, None otherwise.
+        """
+        image_path = self.cache_dir / f"{key}.npy"
+        if not image_path.exists():
+            return None
+        try:
+            image = np.load(str(image_path))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding unreadable master image {image_path}: {e}")
+            image_path.unlink(missing_ok=True)
+            return None
+        logger.info(f"Using master image {image_path}")
+        return image
+
+    def put(self, key: str, image: np.ndarray, description: dict) -> None:
+        """
+        Store a master image.
+
+        Parameters
+        ----------
+        key:
+            key of the entry.
+        image:
+            the master image.
+        description:
+            JSON serializable description of the image, stored next to it.
+        """
+        image_path = self.cache_dir / f"{key}.npy"
+        # write to a private file first, so that concurrent reductions never see a partial image
+        partial_path = self.cache_dir / f"{key}.{os.getpid()}.partial"
+        with open(partial_path, "wb") as f:
+            np.save(f, image)
+        with open(self.cache_dir / f"{key}.json", "w") as f:
+            json.dump(description, f, indent=2, default=str)
+        os.replace(partial_path, image_path)
+        logger.info(f"Saved master image {image_path}")
+
+
+class TaskResultCache:
+    """
+    Least-recently-used cache of the outputs of workflow tasks.
+
+    Every entry is a directory ``<key>/`` holding one ``<index>.npy`` file per array output,
+    one ``<index>.pkl`` file per other output, and ``entry.json`` describing the outputs.
+    Entries are written to a private directory first and renamed once complete, and array
+    outputs are returned as copy-on-write memory maps, so a task modifying a replayed array
+    in place never alters the cache.
+
+    Parameters
+    ----------
+    cache_dir:
+        directory holding the cache, created if needed.
+    max_bytes:
+        the least recently used entries are evicted once the cache grows beyond this size.
+    """
+
+    def __init__(self, cache_dir: Union[str, Path], max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def get(self, key: str) -> Optional[list]:
+        """
+        Look up the outputs of a task.
+
+        Returns
+        -------
+            the list of outputs if the key is cached, None otherwise.
+        """
+        entry_dir = self.cache_dir / key
+        manifest = entry_dir / "entry.json"
+        if not manifest.exists():
+            return None
+        try:
+            with open(manifest) as f:
+                description = json.load(f)
+            outputs = []
+            for idx, kind in enumerate(description["outputs"]):
+                if kind == "array":
+                    outputs.append(np.load(str(entry_dir / f"{idx}.npy"), mmap_mode="c"))
+                else:
+                    with open(entry_dir / f"{idx}.pkl", "rb") as f:
+                        outputs.append(pickle.load(f))
+        except (OSError, ValueError, KeyError, pickle.UnpicklingError) as e:
+            logger.warning(f"Discarding unreadable cache entry {entry_dir}: {e}")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return None
+        # mark the entry as recently used
+        os.utime(manifest)
+        logger.info(f"Cache hit {entry_dir} for task {description.get('task', '')}")
+        return outputs
+
+    def put(self, key: str, outputs: list, description: dict) -> bool:
+        """
+        Store the outputs of a task.
+
+        Parameters
+        ----------
+        key:
+            key of the entry.
+        outputs:
+            the outputs of the task, arrays are stored as ``.npy`` files and any other picklable value is pickled.
+        description:
+            JSON serializable description of the task, stored in ``entry.json``.
+
+        Returns
+        -------
+            True if the outputs were stored, False if they are too large or cannot be serialized.
+        """
+        nbytes = sum(output.nbytes for output in outputs if isinstance(output, np.ndarray))
+        if nbytes > self.max_bytes:
+            logger.info(
+                f"Not caching the outputs of task {description.get('task', '')}, {nbytes} bytes exceed the cache size"
+            )
+            return False
+        entry_dir = self.cache_dir / key
+        partial_dir = self.cache_dir / f"{key}.{os.getpid()}.{threading.get_ident()}.partial"
+        partial_dir.mkdir(parents=True, exist_ok=True)
+        kinds = []
+        try:
+            for idx, output in enumerate(outputs):
+                if isinstance(output, np.ndarray):
+                    np.save(str(partial_dir / f"{idx}.npy"), output)
+                    kinds.append("array")
+                else:
+                    with open(partial_dir / f"{idx}.pkl", "wb") as f:
+                        pickle.dump(output, f)
+                    kinds.append("pickle")
+            # the manifest is written last, an entry without it is incomplete
+            with open(partial_dir / "entry.json", "w") as f:
+                json.dump(dict(description, outputs=kinds), f, indent=2, default=str)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(partial_dir, entry_dir)
+        except (OSError, TypeError, AttributeError, pickle.PicklingError) as e:
+            logger.warning(f"Not caching the outputs of task {description.get('task', '')}: {e}")
+            shutil.rmtree(partial_dir, ignore_errors=True)
+            return False
+        self.evict(keep=key)
+        return True
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """Remove the least recently used entries until the cache fits within ``max_bytes``."""
+        entries = sorted(
+            (path.parent for path in self.cache_dir.glob("*/entry.json") if not path.parent.name.endswith(".partial")),
+            key=lambda path: (path / "entry.json").stat().st_mtime,
+        )
+        sizes = {path.name: sum(item.stat().st_size for item in path.iterdir()) for path in entries}
+        total = sum(sizes.values())
+        for path in entries:
+            if total <= self.max_bytes:
+                break
+            if path.name == keep:
+                continue
+            logger.info(f"Evicting {path} from cache")
+            shutil.rmtree(path, ignore_errors=True)
+            total -= sizes[path.name]
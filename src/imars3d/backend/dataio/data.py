@@ -2,23 +2,42 @@
 """Data handling for iMars3D."""
 
 # package imports
-from imars3d.backend.dataio.metadata import MetaData
+from imars3d.backend.dataio.cache import MasterImageCache, StackCache, file_signature
+from imars3d.backend.dataio.writer import submit_write
+from imars3d.backend.dataio.metadata import (
+    DARK_CURRENT_TAGS,
+    INSTRUMENT_TAGS,
+    ROTATION_ANGLE_TAG,
+    header_values,
+    match_headers,
+    scan_tiff_headers,
+)
 from imars3d.backend.util.functions import clamp_max_workers, to_time_str, calculate_chunksize
+from imars3d.backend.util.pool import pool_imap
 
 # third party imports
+import h5py
 import numpy as np
 import param
 import tifffile
 from tqdm.auto import tqdm
-from tqdm.contrib.concurrent import process_map
+
+try:
+    import numcodecs
+    import zarr
+except ImportError:
+    zarr = None
 
 # standard imports
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 from fnmatch import fnmatchcase
 import itertools
 import logging
 from pathlib import Path
 import re
+import zlib
 from typing import Callable, List, Optional, Tuple, Union
 
 # ignore warnings generated by importing dxchange
@@ -33,6 +52,8 @@ FlexPath = Union[str, Path]
 
 # setup module level logger
 logger = logging.getLogger(__name__)
+# slices compressed ahead of the HDF5 writer, per thread, bounding the memory of the pending chunks
+_HDF5_SLICES_PER_WORKER = 4
 # METADATA_DICT = {
 #     65026: "ManufacturerStr:Andor",  # [ct, ob, dc]
 #     65027: "ExposureTime:70.000000",  # [ct, ob, dc]
@@ -103,6 +124,28 @@ class load_data(param.ParameterizedFunction):
         maximum number of processes allowed during loading, default to use a single core.
     tqdm_class: panel.widgets.Tqdm
         Class to be used for rendering tqdm progress
+    memmap_dir: Optional[str]
+        directory for on-disk memory maps backing the loaded stacks, default is to load into RAM.
+    executor: str
+        backend for parallel loading when max_workers > 1, one of "serial", "thread" (default) or "process".
+    roi: Optional[List[int]]
+        [left, right, top, bottom] limits to crop ct, ob and dc to while reading, default is the full image.
+    bin_factor: int
+        spatial binning factor applied to ct, ob and dc while reading, default is 1 (no binning).
+    angle_stride: int
+        only load every Nth radiograph (and its rotation angle), default is 1 (all radiographs).
+    cache_dir: Optional[str]
+        directory, e.g. the working directory, in which decoded stacks are cached for later calls, default is no cache.
+    cache_max_gb: float
+        size limit of the cache in GB, least recently used stacks are evicted beyond it.
+    reduction: str
+        "none" (default) to return the full ob and dc stacks, or "median" / "clipped_mean" to
+        reduce them to a single image each while loading.
+    clip_sigma: float
+        clipping threshold, in standard deviations, of the "clipped_mean" reduction.
+    master_dir: Optional[str]
+        directory, e.g. the working directory, in which the reduced ob and dc are kept as master
+        images and reused by later scans sharing the same ob and dc files, default is no reuse.
 
     Returns
     -------
@@ -123,8 +166,29 @@ class load_data(param.ParameterizedFunction):
         data loader will attempt to read the metadata embedded in the first ct file to find obs
         and dcs with similar metadata.
 
+        When roi is given, only the region of interest is read from disk, which is equivalent
+        to, but cheaper than, cropping ct, ob and dc with ``morph.crop.crop`` after loading.
+
+        For quick preview reductions, bin_factor and angle_stride reduce the data while it is
+        being read, i.e. the full resolution stack is never held in memory. The binning is
+        applied after cropping to roi, and the returned rotation angles match the kept radiographs.
+
+        With reduction set, ob and dc are returned as 2D images. They are read block of rows by
+        block of rows across all files, so that the full ob and dc stacks are never held in
+        memory. The "median" reduction is exact, the "clipped_mean" reduction averages the values
+        within clip_sigma standard deviations of the median of every pixel.
+
+        With master_dir set, ob and dc are always reduced, with the median unless another
+        reduction is given. Master images are keyed by the ob (or dc) file list, the reduction
+        settings and the instrument metadata (exposure time, slits), so every scan of an
+        experiment sharing the same ob and dc skips loading them after the first one.
+
+        With cache_dir set, a repeated call on unchanged files opens the previously decoded
+        stacks as copy-on-write memory maps instead of decoding the files again.
+
         Currently, we are using a forgiving reader to load the image where a corrupted file
-        will not block reading other data.
+        will not block reading other data. The rotation angles of skipped radiographs are
+        dropped as well so that they stay aligned with the radiograph stack.
 
         The rotation angles are extracted from the filenames if possible, otherwise from the
         metadata embedded in the tiff files. If both failed, the angle will be set to None.
@@ -150,6 +214,55 @@ class load_data(param.ParameterizedFunction):
         doc="Maximum number of processes allowed during loading",
     )
     tqdm_class = param.ClassSelector(class_=object, doc="Progress bar to render with")
+    memmap_dir = param.String(
+        default=None,
+        doc="Directory for on-disk memory maps backing the loaded stacks, default is to load into RAM",
+    )
+    executor = param.Selector(
+        default="thread",
+        objects=["serial", "thread", "process"],
+        doc="Backend for parallel loading when max_workers > 1",
+    )
+    roi = param.List(
+        default=None,
+        item_type=int,
+        bounds=(4, 4),
+        doc="[left, right, top, bottom] limits to crop ct, ob and dc to while reading, default is the full image",
+    )
+    bin_factor = param.Integer(
+        default=1,
+        bounds=(1, None),
+        doc="Spatial binning factor applied to ct, ob and dc while reading, default is 1 (no binning)",
+    )
+    angle_stride = param.Integer(
+        default=1,
+        bounds=(1, None),
+        doc="Only load every Nth radiograph (and its rotation angle), default is 1 (all radiographs)",
+    )
+    cache_dir = param.String(
+        default=None,
+        doc="Directory, e.g. the working directory, in which decoded stacks are cached, default is no cache",
+    )
+    cache_max_gb = param.Number(
+        default=50.0,
+        bounds=(0, None),
+        doc="Size limit of the cache in GB, least recently used stacks are evicted beyond it",
+    )
+    reduction = param.Selector(
+        default="none",
+        objects=["none", "median", "clipped_mean"],
+        doc="Reduce ob and dc to a single image each while loading, default is to return the full stacks",
+    )
+    clip_sigma = param.Number(
+        default=3.0,
+        bounds=(0, None),
+        inclusive_bounds=(False, True),
+        doc="Clipping threshold, in standard deviations, of the clipped_mean reduction",
+    )
+    master_dir = param.String(
+        default=None,
+        doc="Directory, e.g. the working directory, in which reduced ob and dc are reused across scans",
+    )
 
     def __call__(self, **params):
         """Parse inputs and perform multiple dispatch."""
@@ -164,7 +277,8 @@ class load_data(param.ParameterizedFunction):
         # multiple dispatch
         # NOTE:
         #    use set to simplify call signature checking
-        sigs = set([k.split("_")[-1] for k in params.keys() if "fnmatch" not in k])
+        sigs = set([k.split("_")[-1] for k in params.keys() if k.split("_")[0] in ("ct", "ob", "dc")])
+        sigs.discard("fnmatch")
         ref = {"files", "dir"}
 
         if ("ct_dir" in params.keys()) and ("ob_files" in params.keys()):
@@ -188,7 +302,7 @@ class load_data(param.ParameterizedFunction):
             ob_files = ob_files[0]
             dc_files = dc_files[0]
 
-            ct, ob, dc = _load_by_file_list(
+            ct, ob, dc, ct_mask = _load_by_file_list(
                 ct_files=ct_files,
                 ob_files=ob_files,
                 dc_files=dc_files,  # it is okay to skip dc
@@ -197,6 +311,16 @@ class load_data(param.ParameterizedFunction):
                 dc_fnmatch=params.get("dc_fnmatch", "*"),
                 max_workers=self.max_workers,
                 tqdm_class=params.tqdm_class,
+                memmap_dir=params.memmap_dir,
+                executor=params.executor,
+                roi=params.roi,
+                bin_factor=params.bin_factor,
+                angle_stride=params.angle_stride,
+                cache_dir=params.cache_dir,
+                cache_max_gb=params.cache_max_gb,
+                reduction=params.reduction,
+                clip_sigma=params.clip_sigma,
+                master_dir=params.master_dir,
             )
 
         elif ("ct_files" in params.keys()) and ("ob_dir" in params.keys()):
@@ -205,7 +329,7 @@ class load_data(param.ParameterizedFunction):
 
         elif sigs.intersection(ref) == {"files"}:
             logger.debug("Load by file list")
-            ct, ob, dc = _load_by_file_list(
+            ct, ob, dc, ct_mask = _load_by_file_list(
                 ct_files=params.get("ct_files"),
                 ob_files=params.get("ob_files"),
                 dc_files=params.get("dc_files", []),  # it is okay to skip dc
@@ -214,6 +338,16 @@ class load_data(param.ParameterizedFunction):
                 dc_fnmatch=params.get("dc_fnmatch", "*"),
                 max_workers=self.max_workers,
                 tqdm_class=params.tqdm_class,
+                memmap_dir=params.memmap_dir,
+                executor=params.executor,
+                roi=params.roi,
+                bin_factor=params.bin_factor,
+                angle_stride=params.angle_stride,
+                cache_dir=params.cache_dir,
+                cache_max_gb=params.cache_max_gb,
+                reduction=params.reduction,
+                clip_sigma=params.clip_sigma,
+                master_dir=params.master_dir,
             )
             ct_files = params.get("ct_files")
         elif sigs.intersection(ref) == {"dir"}:
@@ -225,8 +359,9 @@ class load_data(param.ParameterizedFunction):
                 ct_fnmatch=params.get("ct_fnmatch", "*"),  # incase None got leaked here
                 ob_fnmatch=params.get("ob_fnmatch", "*"),
                 dc_fnmatch=params.get("dc_fnmatch", "*"),
+                max_workers=self.max_workers,
             )
-            ct, ob, dc = _load_by_file_list(
+            ct, ob, dc, ct_mask = _load_by_file_list(
                 ct_files=ct_files,
                 ob_files=ob_files,
                 dc_files=dc_files,
@@ -235,6 +370,16 @@ class load_data(param.ParameterizedFunction):
                 dc_fnmatch=params.get("dc_fnmatch", "*"),
                 max_workers=self.max_workers,
                 tqdm_class=params.tqdm_class,
+                memmap_dir=params.memmap_dir,
+                executor=params.executor,
+                roi=params.roi,
+                bin_factor=params.bin_factor,
+                angle_stride=params.angle_stride,
+                cache_dir=params.cache_dir,
+                cache_max_gb=params.cache_max_gb,
+                reduction=params.reduction,
+                clip_sigma=params.clip_sigma,
+                master_dir=params.master_dir,
             )
         else:
             logger.warning("No valid signature found, need to specify either files or dir")
@@ -243,7 +388,10 @@ class load_data(param.ParameterizedFunction):
         # extracting rotational angles from
         # 1. filename
         # 2. metadata (only possible for Tiff)
-        rot_angles = _extract_rotation_angles(ct_files)
+        rot_angles = _extract_rotation_angles(ct_files, max_workers=self.max_workers)
+        if rot_angles is not None:
+            # keep the angles aligned with the radiographs that were actually loaded
+            rot_angles = rot_angles[ct_mask]
 
         # return everything
         return ct, ob, dc, rot_angles
@@ -276,7 +424,217 @@ def _forgiving_reader(
 
 
 # use _func to avoid sphinx pulling it into docs
-def _load_images(filelist: List[str], desc: str, max_workers: int, tqdm_class) -> np.ndarray:
+def _read_tiff_roi(filename: str, roi: Tuple[int], out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Read the region of interest from a 2D tiff without decoding the rest of the image.
+
+    Parameters
+    ----------
+    filename:
+        input filename
+    roi:
+        (left, right, top, bottom) limits, following the convention of ``morph.crop.crop``
+    out:
+        optional output buffer of the cropped shape
+
+    Returns
+    -------
+        cropped image
+
+    Notes
+    -----
+        Uncompressed strips are read row by row using the strip offsets, compressed strips
+        and tiles are only decoded when they overlap with the region of interest.
+        Any other layout falls back to reading the whole image.
+    """
+    with tifffile.TiffFile(filename) as tif:
+        page = tif.pages.first
+        if page.ndim != 2 or page.samplesperpixel != 1 or page.dtype is None:
+            return _crop_frame(page.asarray(), roi, out)
+        height, width = page.shape
+        left, right, _ = slice(roi[0], roi[1]).indices(width)
+        top, bottom, _ = slice(roi[2], roi[3]).indices(height)
+        if out is None:
+            out = np.empty((max(bottom - top, 0), max(right - left, 0)), dtype=page.dtype)
+        chunk_height, chunk_width = page.chunks[-2:]
+        _, num_chunks_x = page.chunked[-2:]
+        fh = tif.filehandle
+        itemsize = page.dtype.itemsize
+        raw_rows = (
+            not page.is_tiled
+            and page.compression == 1
+            and page.predictor == 1
+            and page.fillorder == 1
+            and page.bitspersample == 8 * itemsize
+        )
+        for chunk_y in range(top // chunk_height, -(-bottom // chunk_height)):
+            y0 = chunk_y * chunk_height
+            row_start, row_stop = max(top, y0), min(bottom, y0 + chunk_height)
+            if raw_rows:
+                # rows of an uncompressed strip can be addressed directly
+                fh.seek(page.dataoffsets[chunk_y] + (row_start - y0) * width * itemsize)
+                rows = np.frombuffer(
+                    fh.read((row_stop - row_start) * width * itemsize),
+                    dtype=page.dtype.newbyteorder(tif.byteorder),
+                ).reshape(row_stop - row_start, width)
+                out[row_start - top : row_stop - top] = rows[:, left:right]
+                continue
+            for chunk_x in range(left // chunk_width, -(-right // chunk_width)):
+                x0 = chunk_x * chunk_width
+                col_start, col_stop = max(left, x0), min(right, x0 + chunk_width)
+                index = chunk_y * num_chunks_x + chunk_x
+                fh.seek(page.dataoffsets[index])
+                segment, _, _ = page.decode(fh.read(page.databytecounts[index]), index, jpegtables=page.jpegtables)
+                target = out[row_start - top : row_stop - top, col_start - left : col_stop - left]
+                if segment is None:
+                    # sparse file, missing segments are filled with zeros
+                    target[...] = 0
+                else:
+                    target[...] = segment[0, row_start - y0 : row_stop - y0, col_start - x0 : col_stop - x0, 0]
+        return out
+
+
+# use _func to avoid sphinx pulling it into docs
+def _crop_frame(frame: np.ndarray, roi: Tuple[int], out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Crop a 2D image to (left, right, top, bottom), optionally into a given buffer."""
+    left, right, top, bottom = roi
+    if out is None:
+        return frame[top:bottom, left:right]
+    out[...] = frame[top:bottom, left:right]
+    return out
+
+
+# use _func to avoid sphinx pulling it into docs
+def _bin_frame(frame: np.ndarray, bin_factor: int) -> np.ndarray:
+    """
+    Bin a 2D image by averaging non-overlapping ``bin_factor`` x ``bin_factor`` blocks.
+
+    Trailing rows and columns that do not fill a complete block are dropped, and the
+    binned image keeps the data type of the input.
+    """
+    height, width = frame.shape[0] // bin_factor, frame.shape[1] // bin_factor
+    blocks = frame[: height * bin_factor, : width * bin_factor].reshape(height, bin_factor, width, bin_factor)
+    binned = blocks.mean(axis=(1, 3), dtype=np.float32)
+    if np.issubdtype(frame.dtype, np.integer):
+        np.rint(binned, out=binned)
+    return binned.astype(frame.dtype, copy=False)
+
+
+# use _func to avoid sphinx pulling it into docs
+def _read_transformed(
+    filename: str,
+    reader: Callable,
+    roi: Optional[Tuple[int]] = None,
+    bin_factor: int = 1,
+) -> np.ndarray:
+    """Read an image with the given reader, then crop it to (left, right, top, bottom) and bin it."""
+    frame = reader(filename)
+    if roi is not None:
+        frame = _crop_frame(frame, roi)
+    if bin_factor > 1:
+        frame = _bin_frame(frame, bin_factor)
+    return frame
+
+
+# use _func to avoid sphinx pulling it into docs
+def _read_into_slot(
+    filename: str,
+    reader: Callable,
+    stack: np.ndarray,
+    idx: int,
+    decode_inplace: bool = False,
+) -> bool:
+    """
+    Decode one image into its slot of the preallocated stack.
+
+    Parameters
+    ----------
+    filename:
+        input filename
+    reader:
+        callable reader function that consumes the filename
+    stack:
+        preallocated image stack, axis=0 is the image number axis
+    idx:
+        index of the slot to fill
+    decode_inplace:
+        if True, the reader accepts ``out=`` and decodes directly into the slot
+
+    Returns
+    -------
+        True if the slot was successfully filled, False otherwise.
+    """
+    if decode_inplace:
+        try:
+            reader(filename, out=stack[idx])
+            return True
+        except Exception as e:
+            logger.error(f"While reading {filename}, the following error occurred: {e}")
+            return False
+    return _store_frame(stack, idx, _forgiving_reader(filename, reader), filename)
+
+
+# use _func to avoid sphinx pulling it into docs
+def _store_frame(stack: np.ndarray, idx: int, frame: Optional[np.ndarray], filename: str) -> bool:
+    """Copy a decoded frame into its slot, rejecting frames with a mismatched shape."""
+    if frame is None:
+        return False
+    if frame.shape != stack.shape[1:]:
+        logger.error(f"Image shape {frame.shape} of {filename} does not match the stack {stack.shape[1:]}, skipping.")
+        return False
+    stack[idx] = frame
+    return True
+
+
+# use _func to avoid sphinx pulling it into docs
+def _allocate_stack(shape: Tuple[int], dtype: np.dtype, memmap_file: Optional[FlexPath] = None) -> np.ndarray:
+    """
+    Allocate the output buffer for an image stack.
+
+    Parameters
+    ----------
+    shape:
+        shape of the stack, i.e. (n_images, height, width)
+    dtype:
+        data type of the stack
+    memmap_file:
+        if given, the stack is backed by an on-disk ``.npy`` memory map at this location
+
+    Returns
+    -------
+        Uninitialized image stack.
+    """
+    if memmap_file is None:
+        return np.empty(shape, dtype=dtype)
+    memmap_file = Path(memmap_file)
+    memmap_file.parent.mkdir(parents=True, exist_ok=True)
+    logger.info(f"Backing image stack with memory map {memmap_file}")
+    return np.lib.format.open_memmap(str(memmap_file), mode="w+", dtype=dtype, shape=shape)
+
+
+# use _func to avoid sphinx pulling it into docs
+def _compact_stack(stack: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Shift the valid images to the front of the stack in place and return a view of them."""
+    valid_idx = np.flatnonzero(mask)
+    for dst, src in enumerate(valid_idx):
+        if dst != src:
+            stack[dst] = stack[src]
+    return stack[: valid_idx.size]
+
+
+# use _func to avoid sphinx pulling it into docs
+def _load_images(
+    filelist: List[str],
+    desc: str,
+    max_workers: int,
+    tqdm_class=None,
+    memmap_file: Optional[FlexPath] = None,
+    return_mask: bool = False,
+    executor: str = "thread",
+    roi: Optional[Tuple[int]] = None,
+    bin_factor: int = 1,
+    cache: Optional[StackCache] = None,
+) -> Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
     """
     Load image data via dxchange.
 
@@ -290,11 +648,40 @@ def _load_images(filelist: List[str], desc: str, max_workers: int, tqdm_class) -
         Maximum number of processes allowed during loading.
     tqdm_class: panel.widgets.Tqdm
         Class to be used for rendering tqdm progress
+    memmap_file:
+        If given, the stack is assembled in an on-disk ``.npy`` memory map instead of RAM.
+    return_mask:
+        If True, also return the boolean mask of successfully loaded files.
+    executor:
+        Backend used when ``max_workers > 1``, one of "serial", "thread" or "process".
+    roi:
+        Optional (left, right, top, bottom) limits, only this region of every image is read.
+    bin_factor:
+        Spatial binning factor applied to every image after cropping, 1 means no binning.
+    cache:
+        If given, the stack is looked up in, or added to, this on-disk cache. The key covers
+        the path, size and modification time of every file, so a changed file invalidates it.
 
     Returns
     -------
-        Image array stack.
+        Image array stack, and the mask over ``filelist`` if ``return_mask`` is True.
+
+    Notes
+    -----
+        The stack is preallocated from the first readable image and every file is decoded
+        into its own slot, so only one copy of the stack exists at any time.
+        Files that cannot be read, or whose shape does not match the first image, are
+        skipped and marked False in the mask.
+
+        The "thread" executor decodes straight into the shared stack as tifffile releases
+        the GIL while decoding, whereas the "process" executor has to pickle every decoded
+        image back to the parent process. See ``scripts/benchmark_load_data.py`` for
+        measuring the crossover point on a given machine.
     """
+    if executor not in ("serial", "thread", "process"):
+        logger.error(f"Unsupported executor: {executor}")
+        raise ValueError(f"Unsupported executor: {executor}")
+
     # figure out the file type and select corresponding reader from dxchange
     file_ext = Path(filelist[0]).suffix.lower()
     if file_ext in (".tif", ".tiff"):
@@ -309,35 +696,266 @@ def _load_images(filelist: List[str], desc: str, max_workers: int, tqdm_class) -
         #       The `memmap` option is removed until we have a better understanding of the
         #       discrepancy.
         # reader = partial(tifffile.imread, out="memmap")
-        reader = tifffile.imread
+        reader = tifffile.imread if roi is None else partial(_read_tiff_roi, roi=tuple(roi))
+        decode_inplace = True
     elif file_ext == ".fits":
-        reader = dxchange.read_fits
+        reader = dxchange.read_fits if roi is None else partial(_read_transformed, reader=dxchange.read_fits, roi=roi)
+        decode_inplace = False
     else:
         logger.error(f"Unsupported file type: {file_ext}")
         raise ValueError("Unsupported file type.")
-
-    # NOTE: For regular dataset, single thread reading is actually faster
-    #       as the overhead of multiprocessing will overshadow the benefits.
-    if max_workers == 1:
-        progress_bar = tqdm if tqdm_class is None else tqdm_class
+    if bin_factor > 1:
+        # bin every image right after decoding so that the full resolution stack never exists
+        reader = partial(_read_transformed, reader=reader, bin_factor=bin_factor)
+        decode_inplace = False
+
+    if cache is not None:
+        key = file_signature(filelist, roi=roi, bin_factor=bin_factor)
+        cached = cache.get(key)
+        if cached is not None:
+            logger.info(f"Loaded {desc} stack from cache")
+            return cached if return_mask else cached[0]
+        # decode straight into the cache file
+        memmap_file = cache.partial_path(key)
+
+    mask = np.zeros(len(filelist), dtype=bool)
+    # the first readable image defines the shape and dtype of the stack
+    first = None
+    for first_idx, filename in enumerate(filelist):
+        first = _forgiving_reader(filename, reader)
+        if first is not None:
+            break
+    if first is None:
+        logger.error(f"None of the {len(filelist)} {desc} files could be read.")
+        return (np.array([]), mask) if return_mask else np.array([])
+    stack = _allocate_stack((len(filelist),) + first.shape, first.dtype, memmap_file)
+    mask[first_idx] = _store_frame(stack, first_idx, first, filelist[first_idx])
+    del first
+    remaining = range(first_idx + 1, len(filelist))
+
+    progress_bar = tqdm if tqdm_class is None else tqdm_class
+    # NOTE: For regular dataset, single thread reading is faster than multiprocessing
+    #       as the overhead of pickling the images will overshadow the benefits.
+    if max_workers == 1 or executor == "serial":
         # single thread reading
-        rst = [_forgiving_reader(f, reader) for f in progress_bar(filelist, desc=desc)]
+        for i in progress_bar(remaining, desc=desc):
+            mask[i] = _read_into_slot(filelist[i], reader, stack, i, decode_inplace)
+    elif executor == "thread":
+        # multi-thread reading, every thread decodes into its own slot of the shared stack
+        # NOTE: scripts/benchmark_load_data.py with 48 2048x2048 uint16 tiffs on a single
+        #       core sandbox (best of 2, max_workers=4), i.e. the worst case for threads:
+        #                       | Executor | raw (s) | zlib (s) |
+        #                       |----------|---------|----------|
+        #                       | serial   | 0.18    | 3.74     |
+        #                       | thread   | 0.19    | 3.89     |
+        #                       | process  | 1.61    | 5.46     |
+        #       Threads cost next to nothing when they cannot help, so they are the
+        #       default; re-run the script on the analysis nodes to find the crossover.
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            loaded = pool.map(
+                lambda i: _read_into_slot(filelist[i], reader, stack, i, decode_inplace),
+                remaining,
+            )
+            for i, is_loaded in zip(remaining, progress_bar(loaded, total=len(remaining), desc=desc)):
+                mask[i] = is_loaded
     else:
-        # multi-thread reading
-        # NOTE: the benefits of multi-threading is only visible when
+        # multi-process reading
+        # NOTE: the benefits of multi-processing is only visible when
         #       - the file list is really long
         #       - there are a lot of cores available
-        kwargs = {
-            "max_workers": max_workers,
-            "chunksize": calculate_chunksize(len(filelist), max_workers),
-            "desc": desc,
-        }
-        rst = process_map(partial(_forgiving_reader, reader=reader), filelist, **kwargs)
-
-    # return the results
+        #       the frames are consumed as they arrive so that the full list of
+        #       decoded frames is never held in memory next to the stack.
+        frames = pool_imap(
+            partial(_forgiving_reader, reader=reader),
+            [filelist[i] for i in remaining],
+            max_workers=max_workers,
+            chunksize=calculate_chunksize(len(remaining), max_workers),
+        )
+        for i, frame in zip(remaining, progress_bar(frames, total=len(remaining), desc=desc)):
+            mask[i] = _store_frame(stack, i, frame, filelist[i])
+
     # NOTE: there is no need to convert to float at this point, and it will save
     #       a lot of memory and time if the conversion is done after cropping.
-    return np.array([me for me in rst if me is not None])
+    if not mask.all():
+        logger.warning(f"Skipped {np.count_nonzero(~mask)} of {len(filelist)} {desc} files.")
+        stack = _compact_stack(stack, mask)
+    if cache is not None:
+        stack = cache.commit(key, stack, mask)
+    return (stack, mask) if return_mask else stack
+
+
+# use _func to avoid sphinx pulling it into docs
+def _reduce_stack(stack: np.ndarray, method: str = "median", clip_sigma: float = 3.0) -> np.ndarray:
+    """
+    Reduce a stack of images to a single image along axis 0.
+
+    Parameters
+    ----------
+    stack:
+        image stack, axis=0 is the image number axis.
+    method:
+        "median", or "clipped_mean" for the mean of the values within ``clip_sigma``
+        standard deviations of the median.
+    clip_sigma:
+        clipping threshold of the "clipped_mean" method.
+
+    Returns
+    -------
+        reduced 2D image as float32.
+    """
+    if method == "median":
+        return np.median(stack, axis=0).astype(np.float32)
+    if method == "clipped_mean":
+        stack = stack.astype(np.float32, copy=False)
+        median = np.median(stack, axis=0)
+        keep = np.abs(stack - median) <= clip_sigma * stack.std(axis=0)
+        count = keep.sum(axis=0)
+        mean = np.where(keep, stack, 0).sum(axis=0) / np.maximum(count, 1)
+        # pixels without any value within the threshold fall back to the median
+        return np.where(count > 0, mean, median).astype(np.float32)
+    logger.error(f"Unsupported reduction: {method}")
+    raise ValueError(f"Unsupported reduction: {method}")
+
+
+# use _func to avoid sphinx pulling it into docs
+def _reduce_images(
+    filelist: List[str],
+    desc: str,
+    max_workers: int,
+    tqdm_class=None,
+    method: str = "median",
+    clip_sigma: float = 3.0,
+    roi: Optional[Tuple[int]] = None,
+    bin_factor: int = 1,
+    block_bytes: int = 256 * 1024**2,
+) -> np.ndarray:
+    """
+    Reduce a set of images to a single image without loading the whole stack.
+
+    Parameters
+    ----------
+    filelist:
+        List of images filenames/path.
+    desc:
+        Description for progress bar.
+    max_workers:
+        Number of threads reading the files of each block.
+    tqdm_class: panel.widgets.Tqdm
+        Class to be used for rendering tqdm progress
+    method:
+        Reduction, "median" or "clipped_mean", see ``_reduce_stack``.
+    clip_sigma:
+        Clipping threshold of the "clipped_mean" reduction.
+    roi:
+        Optional (left, right, top, bottom) limits, only this region of every image is read.
+    bin_factor:
+        Spatial binning factor applied to every image after cropping, 1 means no binning.
+    block_bytes:
+        Upper bound on the size of a block of rows read across all files.
+
+    Returns
+    -------
+        Reduced 2D image as float32.
+
+    Notes
+    -----
+        Tiff files are read one block of rows at a time across all the files, and every block
+        is reduced before the next one is read, so the peak memory is bounded by ``block_bytes``
+        instead of the size of the stack. Other formats are loaded in full, then reduced.
+        Files that cannot be read are skipped from the first failing block on.
+    """
+    file_ext = Path(filelist[0]).suffix.lower()
+    shape = None
+    if file_ext in (".tif", ".tiff"):
+        # the geometry of the first readable image defines the blocks
+        for filename in filelist:
+            try:
+                with tifffile.TiffFile(filename) as tif:
+                    shape, dtype = tif.pages.first.shape, tif.pages.first.dtype
+                break
+            except Exception as e:
+                logger.error(f"While reading {filename}, the following error occurred: {e}")
+    if shape is None or len(shape) != 2 or dtype is None:
+        # no block reading possible, reduce the loaded stack instead
+        stack = _load_images(filelist, desc, max_workers, tqdm_class, roi=roi, bin_factor=bin_factor)
+        return stack if stack.size == 0 else _reduce_stack(stack, method, clip_sigma)
+
+    height, width = shape
+    left, right, top, bottom = (0, width, 0, height) if roi is None else roi
+    left, right, _ = slice(left, right).indices(width)
+    top, bottom, _ = slice(top, bottom).indices(height)
+    # binning drops the trailing rows and columns that do not fill a complete bin
+    out_height = (bottom - top) // bin_factor
+    block_rows = max(1, block_bytes // (len(filelist) * (right - left) * dtype.itemsize * bin_factor))
+    reduced = np.empty((out_height, (right - left) // bin_factor), dtype=np.float32)
+    buffer = np.empty((len(filelist), min(block_rows, out_height) * bin_factor, right - left), dtype=dtype)
+    valid = np.ones(len(filelist), dtype=bool)
+
+    def read_block(idx, block_roi, block):
+        if not valid[idx]:
+            return False
+        try:
+            _read_tiff_roi(filelist[idx], block_roi, out=block[idx])
+            return True
+        except Exception as e:
+            logger.error(f"While reading {filelist[idx]}, the following error occurred: {e}")
+            return False
+
+    progress_bar = tqdm if tqdm_class is None else tqdm_class
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for row in progress_bar(range(0, out_height, block_rows), desc=desc):
+            stop = min(row + block_rows, out_height)
+            block_roi = (left, right, top + row * bin_factor, top + stop * bin_factor)
+            block = buffer[:, : (stop - row) * bin_factor]
+            valid &= list(pool.map(partial(read_block, block_roi=block_roi, block=block), range(len(filelist))))
+            if not valid.any():
+                logger.error(f"None of the {len(filelist)} {desc} files could be read.")
+                return np.array([])
+            frames = block[valid]
+            if bin_factor > 1:
+                frames = np.stack([_bin_frame(frame, bin_factor) for frame in frames])
+            reduced[row:stop] = _reduce_stack(frames, method, clip_sigma)
+    if not valid.all():
+        logger.warning(f"Skipped {np.count_nonzero(~valid)} of {len(filelist)} {desc} files.")
+    return reduced
+
+
+# use _func to avoid sphinx pulling it into docs
+def _load_master_image(filelist: List[str], cache: MasterImageCache, **reduce_kwargs) -> np.ndarray:
+    """
+    Look up the master image of a set of files, reducing and storing it on a miss.
+
+    Parameters
+    ----------
+    filelist:
+        List of images filenames/path.
+    cache:
+        Master image cache.
+    reduce_kwargs:
+        Keyword arguments of ``_reduce_images``, they are part of the key.
+
+    Returns
+    -------
+        Reduced 2D image as float32.
+
+    Notes
+    -----
+        The key covers the path, size and modification time of every file, the reduction
+        settings and the instrument metadata of the first file. Only the first header is read,
+        as any change to the other files already changes their modification time.
+    """
+    options = {k: v for k, v in reduce_kwargs.items() if k not in ("desc", "max_workers", "tqdm_class")}
+    headers = scan_tiff_headers(filelist[:1], tags=INSTRUMENT_TAGS)
+    metadata = {tag: str(headers[tag][0]) for tag in map(str, INSTRUMENT_TAGS)}
+    key = file_signature(filelist, metadata=metadata, **options)
+    image = cache.get(key)
+    if image is not None:
+        return image
+    image = _reduce_images(filelist=filelist, **reduce_kwargs)
+    if image.size > 0:
+        description = dict(num_files=len(filelist), first_file=filelist[0], metadata=metadata, **options)
+        cache.put(key, image, description)
+    return image
 
 
 # use _func to avoid sphinx pulling it into docs
@@ -350,6 +968,16 @@ def _load_by_file_list(
     dc_fnmatch: Optional[str] = "*",
     max_workers: int = 0,
     tqdm_class=None,
+    memmap_dir: Optional[FlexPath] = None,
+    executor: str = "thread",
+    roi: Optional[Tuple[int]] = None,
+    bin_factor: int = 1,
+    angle_stride: int = 1,
+    cache_dir: Optional[FlexPath] = None,
+    cache_max_gb: float = 50.0,
+    reduction: str = "none",
+    clip_sigma: float = 3.0,
+    master_dir: Optional[FlexPath] = None,
 ) -> Tuple[np.ndarray]:
     """
     Use provided list of files to load images into memory.
@@ -373,10 +1001,34 @@ def _load_by_file_list(
         use as many as possible.
     tqdm_class: panel.widgets.Tqdm
         Class to be used for rendering tqdm progress
+    memmap_dir:
+        If given, the stacks are assembled in on-disk ``ct.npy``, ``ob.npy`` and ``dc.npy``
+        memory maps inside this directory.
+    executor:
+        Backend for parallel loading, one of "serial", "thread" or "process".
+    roi:
+        Optional (left, right, top, bottom) limits applied to ct, ob and dc while reading.
+    bin_factor:
+        Spatial binning factor applied to ct, ob and dc while reading.
+    angle_stride:
+        Only every Nth selected ct file is loaded.
+    cache_dir:
+        If given, decoded stacks are cached in the ``load_data_cache`` subdirectory.
+    cache_max_gb:
+        Size limit of the cache in GB, the least recently used stacks are evicted beyond it.
+    reduction:
+        "none" to load the full ob and dc stacks, "median" or "clipped_mean" to reduce them
+        to a single 2D image each while loading.
+    clip_sigma:
+        Clipping threshold, in standard deviations, of the "clipped_mean" reduction.
+    master_dir:
+        If given, ob and dc are reduced (median by default) and kept as master images in the
+        ``master_flats`` subdirectory, from which later calls on the same files load them.
 
     Returns
     -------
-        ct, ob, dc
+        ct, ob, dc, ct_mask
+            where ct_mask flags the entries of ct_files that ended up in the ct stack.
     """
     # empty list is not allowed
     if ct_files == []:
@@ -389,33 +1041,59 @@ def _load_by_file_list(
         logger.warning("dc_files is [].")
 
     max_workers = clamp_max_workers(max_workers)
+    cache = None if cache_dir is None else StackCache(Path(cache_dir) / "load_data_cache", int(cache_max_gb * 1e9))
+    common = dict(
+        max_workers=max_workers, tqdm_class=tqdm_class, executor=executor, roi=roi, bin_factor=bin_factor, cache=cache
+    )
+
+    def memmap_file(desc):
+        return None if memmap_dir is None else Path(memmap_dir) / f"{desc}.npy"
+
     # explicit list is the most straight forward solution
     # -- radiograph
-    ct = _load_images(
-        filelist=[ctf for ctf in ct_files if fnmatchcase(ctf, ct_fnmatch)],
+    ct_selected = np.array([fnmatchcase(ctf, ct_fnmatch) for ctf in ct_files], dtype=bool)
+    if angle_stride > 1:
+        selected_idx = np.flatnonzero(ct_selected)
+        ct_selected[selected_idx] = False
+        ct_selected[selected_idx[::angle_stride]] = True
+    ct, ct_loaded = _load_images(
+        filelist=[ctf for ctf, selected in zip(ct_files, ct_selected) if selected],
         desc="ct",
-        max_workers=max_workers,
-        tqdm_class=tqdm_class,
+        memmap_file=memmap_file("ct"),
+        return_mask=True,
+        **common,
     )
+    ct_mask = ct_selected.copy()
+    ct_mask[ct_selected] = ct_loaded
+    master_cache = None if master_dir is None else MasterImageCache(Path(master_dir) / "master_flats")
+    # master images are always reduced, with the median by default as in normalization
+    method = "median" if reduction == "none" else reduction
+
+    def load_flats(filelist, desc):
+        if reduction == "none" and master_cache is None:
+            return _load_images(filelist=filelist, desc=desc, memmap_file=memmap_file(desc), **common)
+        reduce_kwargs = dict(
+            desc=desc,
+            max_workers=max_workers,
+            tqdm_class=tqdm_class,
+            method=method,
+            clip_sigma=clip_sigma,
+            roi=roi,
+            bin_factor=bin_factor,
+        )
+        if master_cache is None:
+            return _reduce_images(filelist=filelist, **reduce_kwargs)
+        return _load_master_image(filelist=filelist, cache=master_cache, **reduce_kwargs)
+
     # -- open beam
-    ob = _load_images(
-        filelist=[obf for obf in ob_files if fnmatchcase(obf, ob_fnmatch)],
-        desc="ob",
-        max_workers=max_workers,
-        tqdm_class=tqdm_class,
-    )
+    ob = load_flats([obf for obf in ob_files if fnmatchcase(obf, ob_fnmatch)], "ob")
     # -- dark current
     if dc_files == []:
         dc = None
     else:
-        dc = _load_images(
-            filelist=[dcf for dcf in dc_files if fnmatchcase(dcf, dc_fnmatch)],
-            desc="dc",
-            max_workers=max_workers,
-            tqdm_class=tqdm_class,
-        )
+        dc = load_flats([dcf for dcf in dc_files if fnmatchcase(dcf, dc_fnmatch)], "dc")
     #
-    return ct, ob, dc
+    return ct, ob, dc, ct_mask
 
 
 def _get_filelist_by_dir(
@@ -425,6 +1103,7 @@ def _get_filelist_by_dir(
     ct_fnmatch: Optional[str] = "*",
     ob_fnmatch: Optional[str] = "*",
     dc_fnmatch: Optional[str] = "*",
+    max_workers: int = 1,
 ) -> Tuple[List[str], List[str], List[str]]:
     """
     Generate list of files from given directory and fnmatch for ct, ob, and dc.
@@ -443,6 +1122,8 @@ def _get_filelist_by_dir(
         fnmatch for selecting ob files from ob_dir.
     dc_fnmatch:
         fnmatch for selecting dc files from dc_dir.
+    max_workers:
+        number of threads used to read the metadata of the candidate ob and dc files.
 
     Returns
     -------
@@ -451,7 +1132,9 @@ def _get_filelist_by_dir(
     Notes
     -----
         If ob_fnmatch is set to None, the data loader will attempt to read the metadata
-        embedded in the ct file to find obs with similar metadata.
+        embedded in the ct file to find obs with similar metadata. The headers of all the
+        candidates are read in a single pass, see
+        :func:`~imars3d.backend.dataio.metadata.scan_tiff_headers`.
     """
     # sanity check
     ##########
@@ -503,20 +1186,27 @@ def _get_filelist_by_dir(
     except StopIteration:
         logger.warning("ct_files is [].")
         ct_ref = None
-    metadata_ref = None if ct_ref is None else MetaData(filename=str(ct_ref), datatype="ct")
     ext_ref = None if ct_ref is None else ct_ref.suffix
 
+    # header of the reference ct, only read when the ob or dc are found by metadata
+    header_ref = None
+    if ct_ref is not None and (ob_fnmatch is None or (dc_dir is not None and dc_fnmatch is None)):
+        if ext_ref.lower() in (".fits", ".fit"):
+            logger.error("FITS file is not supported yet.")
+            raise ValueError(f'Suffix="{ext_ref}" is not currently supported')
+        header_ref = scan_tiff_headers([ct_ref])[0]
+
     # gather the ob_files
     if ob_fnmatch is None:
         if ct_ref is None:
             logger.warning("ob_files is [].")
             ob_files = []
         else:
-            ob_files = list()
-            for open_beam_dir in open_beam_dirs:
-                obfs = open_beam_dir.glob(f"*{ext_ref}")
-                # remove files that do not match the metadata of ct_ref
-                ob_files += [f for f in obfs if metadata_ref.match(other_filename=str(f), other_datatype="ob")]
+            # remove files that do not match the metadata of ct_ref
+            headers = scan_tiff_headers(
+                itertools.chain(*[obd.glob(f"*{ext_ref}") for obd in open_beam_dirs]), max_workers=max_workers
+            )
+            ob_files = list(headers["filename"][match_headers(headers, header_ref, INSTRUMENT_TAGS)])
     else:
         ob_files = list(itertools.chain(*[list(obd.glob(ob_fnmatch)) for obd in open_beam_dirs]))
 
@@ -529,11 +1219,11 @@ def _get_filelist_by_dir(
                 logger.warning("dc_files is [].")
                 dc_files = []
             else:
-                dc_files = list()
-                for dark_field_dir in dark_field_dirs:
-                    dcfs = dark_field_dir.glob(f"*{ext_ref}")
-                    # remove files that do not match the metadata of ct_ref
-                    dc_files += [f for f in dcfs if metadata_ref.match(other_filename=str(f), other_datatype="dc")]
+                # remove files that do not match the metadata of ct_ref
+                headers = scan_tiff_headers(
+                    itertools.chain(*[dcd.glob(f"*{ext_ref}") for dcd in dark_field_dirs]), max_workers=max_workers
+                )
+                dc_files = list(headers["filename"][match_headers(headers, header_ref, DARK_CURRENT_TAGS)])
         else:
             dc_files = list(itertools.chain(*[list(dcf.glob(dc_fnmatch)) for dcf in dark_field_dirs]))
 
@@ -547,7 +1237,8 @@ def _get_filelist_by_dir(
 
 def _extract_rotation_angles(
     filelist: List[str],
-    metadata_idx: int = 65039,
+    metadata_idx: int = ROTATION_ANGLE_TAG,
+    max_workers: int = 1,
 ) -> Optional[np.ndarray]:
     """
     Extract rotation angles in degrees from filename or metadata.
@@ -558,6 +1249,8 @@ def _extract_rotation_angles(
         List of files to extract rotation angles from.
     metadata_idx:
         Index of metadata to extract rotation angle from, default is 65039.
+    max_workers:
+        number of threads used to read the metadata of the files without angle in their name.
 
     Returns
     -------
@@ -569,43 +1262,34 @@ def _extract_rotation_angles(
         logger.error("filelist is [].")
         raise ValueError("filelist cannot be empty list.")
 
-    # process one file at a time
-    rotation_angles = []
-    for filename in filelist:
-        file_ext = Path(filename).suffix.lower()
-        angle = None
-        if file_ext == ".tiff":
-            # first, let's try to extract the angle from the filename
-            angle = extract_rotation_angle_from_filename(filename)
-            if angle is None:
-                # if failed, try to extract from metadata
-                angle = extract_rotation_angle_from_tiff_metadata(filename, metadata_idx)
-            if angle is None:
-                # if failed, log a warning and move on
-                logger.warning(f"Failed to extract rotation angle from {filename}.")
-        elif file_ext in (".tif", ".fits"):
-            # for tif and fits, we can only extract from filename as the metadata is not reliable
-            angle = extract_rotation_angle_from_filename(filename)
-            if angle is None:
-                # if failed, log a warning and move on
-                logger.warning(f"Failed to extract rotation angle from {filename}.")
-        else:
+    file_exts = [Path(filename).suffix.lower() for filename in filelist]
+    for file_ext in file_exts:
+        if file_ext not in (".tiff", ".tif", ".fits"):
             # if the file type is not supported, raise value error
             logger.error(f"Unsupported file type: {file_ext}")
             raise ValueError(f"Unsupported file type: {file_ext}")
 
-        rotation_angles.append(angle)
+    # first, let's try to extract the angles from the filenames
+    rotation_angles = np.array([extract_rotation_angle_from_filename(filename) for filename in filelist], dtype=float)
+    # if failed, try to extract from metadata, which is only reliable for tiff
+    from_header = [i for i, file_ext in enumerate(file_exts) if file_ext == ".tiff" and np.isnan(rotation_angles[i])]
+    if from_header:
+        headers = scan_tiff_headers([filelist[i] for i in from_header], tags=[metadata_idx], max_workers=max_workers)
+        rotation_angles[from_header] = header_values(headers, metadata_idx)
 
     # this means we have a list of None
-    if all(angle is None for angle in rotation_angles):
+    missing = np.isnan(rotation_angles)
+    if missing.all():
         logger.warning("Failed to extract any rotation angles.")
         return None
 
     # warn users if some angles are missing
-    if any(angle is None for angle in rotation_angles):
+    if missing.any():
+        for i in np.flatnonzero(missing):
+            logger.warning(f"Failed to extract rotation angle from {filelist[i]}.")
         logger.warning("Some rotation angles are missing. You will see nan in the rotation angles array.")
 
-    return np.array(rotation_angles, dtype=float)
+    return rotation_angles
 
 
 def extract_rotation_angle_from_filename(filename: str) -> Optional[float]:
@@ -659,25 +1343,141 @@ def extract_rotation_angle_from_tiff_metadata(filename: str, metadata_idx: int =
         # img = tifffile.TiffFile("test_with_metadata_0.tiff")
         # img.pages[0].tags[65039].value
         # >> 'RotationActual:0.579840'
-        return float(tifffile.TiffFile(filename).pages[0].tags[metadata_idx].value.split(":")[-1])
+        with tifffile.TiffFile(filename) as tiff:
+            return float(tiff.pages[0].tags[metadata_idx].value.split(":")[-1])
     except Exception:
         return None
 
 
-def _save_data(filename: Path, data: np.ndarray, rot_angles: np.ndarray = None) -> None:
+def _save_data(
+    filename: Path,
+    data: np.ndarray,
+    rot_angles: np.ndarray = None,
+    file_format: str = "tiff",
+    rot_center: Optional[float] = None,
+    compression_level: int = 0,
+    max_workers: int = 1,
+) -> None:
     if data is None:
         raise ValueError("Failed to supply data")
-    logger.info(f'saving tiffs to "{filename.parent}"')
 
     # make sure the directory exists
     if not filename.parent.exists():
         filename.parent.mkdir(parents=True)
-    # save the stack of tiffs
-    dxchange.write_tiff_stack(data, fname=str(filename))
 
-    # save the angles as a numpy object
+    if file_format == "tiff":
+        logger.info(f'saving tiffs to "{filename.parent}"')
+        # save the stack of tiffs
+        dxchange.write_tiff_stack(data, fname=str(filename))
+        # save the angles as a numpy object
+        if rot_angles is not None:
+            np.save(file=filename.parent / "rot_angles.npy", arr=rot_angles)
+    elif file_format == "hdf5":
+        _save_hdf5(filename.with_suffix(".h5"), data, rot_angles, rot_center, compression_level, max_workers)
+    elif file_format == "zarr":
+        _save_zarr(filename.with_suffix(".zarr"), data, rot_angles, rot_center, compression_level, max_workers)
+    else:
+        logger.error(f"Unsupported file format: {file_format}")
+        raise ValueError(f"Unsupported file format: {file_format}")
+
+
+# use _func to avoid sphinx pulling it into docs
+def _save_hdf5(
+    filename: Path,
+    data: np.ndarray,
+    rot_angles: Optional[np.ndarray] = None,
+    rot_center: Optional[float] = None,
+    compression_level: int = 0,
+    max_workers: int = 1,
+) -> None:
+    """
+    Save a stack to an HDF5 file with one chunk per slice.
+
+    The stack is stored in the ``data`` dataset, with the rotation center as an attribute.
+    The rotation angles are stored in the ``rot_angles`` dataset, as attributes are limited
+    to 64 kB in HDF5.
+
+    Notes
+    -----
+        h5py serializes all calls into the HDF5 library, including the compression filters.
+        Instead, the slices are deflated by a pool of threads, as zlib releases the GIL, and
+        the compressed chunks are written as is with ``write_direct_chunk``. The file is
+        identical to one written with ``compression="gzip"``. At most a few slices per thread
+        are compressed ahead of the writer, so a slow file system does not pile up compressed
+        chunks in memory.
+    """
+    logger.info(f'saving hdf5 to "{filename}"')
+    data = np.asarray(data)
+    with h5py.File(filename, "w") as h5file:
+        dataset = h5file.create_dataset(
+            "data",
+            shape=data.shape,
+            dtype=data.dtype,
+            chunks=(1,) + data.shape[1:],
+            compression="gzip" if compression_level > 0 else None,
+            compression_opts=compression_level if compression_level > 0 else None,
+        )
+        if compression_level > 0:
+
+            def compress_slice(idx):
+                return zlib.compress(np.ascontiguousarray(data[idx]), compression_level)
+
+            window = _HDF5_SLICES_PER_WORKER * max(1, max_workers)
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                pending = deque()
+                for idx in range(len(data)):
+                    pending.append((idx, pool.submit(compress_slice, idx)))
+                    # write the oldest slices, in order, once the window is full or all are submitted
+                    while pending and (len(pending) >= window or idx == len(data) - 1):
+                        written, chunk = pending.popleft()
+                        dataset.id.write_direct_chunk((written,) + (0,) * (data.ndim - 1), chunk.result())
+        else:
+            dataset[...] = data
+        if rot_center is not None:
+            dataset.attrs["rot_center"] = float(rot_center)
+        if rot_angles is not None:
+            h5file.create_dataset("rot_angles", data=rot_angles)
+
+
+# use _func to avoid sphinx pulling it into docs
+def _save_zarr(
+    filename: Path,
+    data: np.ndarray,
+    rot_angles: Optional[np.ndarray] = None,
+    rot_center: Optional[float] = None,
+    compression_level: int = 0,
+    max_workers: int = 1,
+) -> None:
+    """
+    Save a stack to a Zarr group with one chunk per slice.
+
+    The stack is stored in the ``data`` array, with the rotation angles and rotation center as
+    attributes. Every chunk is its own file, so the slices are compressed and written by a pool
+    of threads.
+    """
+    if zarr is None:
+        logger.error("To save as zarr, make sure to install the zarr package.")
+        raise RuntimeError("zarr not installed, please install with pip install zarr")
+    logger.info(f'saving zarr to "{filename}"')
+    data = np.asarray(data)
+    group = zarr.open_group(str(filename), mode="w")
+    array = group.create_dataset(
+        "data",
+        shape=data.shape,
+        dtype=data.dtype,
+        chunks=(1,) + data.shape[1:],
+        compressor=numcodecs.Zlib(level=compression_level) if compression_level > 0 else None,
+    )
+
+    def write_slice(idx):
+        array[idx] = data[idx]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        list(pool.map(write_slice, range(len(data))))
+    if rot_center is not None:
+        array.attrs["rot_center"] = float(rot_center)
     if rot_angles is not None:
-        np.save(file=filename.parent / "rot_angles.npy", arr=rot_angles)
+        array.attrs["rot_angles"] = np.asarray(rot_angles, dtype=float).tolist()
 
 
 class save_data(param.ParameterizedFunction):
@@ -687,6 +1487,8 @@ class save_data(param.ParameterizedFunction):
     The filenames will be
     ``<outputbase>/<name>_YYYYMMDDhhmm/<name>_####.tiff``
     where a canonical ``outputbase`` is ``/HFIR/CG1D/IPTS-23788/shared/processed_data/``.
+    The hdf5 and zarr formats write a single ``<name>.h5`` or ``<name>.zarr`` instead, chunked
+    by slice, with the rotation angles and rotation center stored alongside the data.
 
     Parameters
     ----------
@@ -699,16 +1501,44 @@ class save_data(param.ParameterizedFunction):
         Used to name file of output, defaults to ``save_data``
     rot_angles: Array
         Optional for writing out the array of rotational (omega) angles
+    format: str
+        "tiff" (default) for one tiff per slice, "hdf5" for ``<name>.h5`` or "zarr" for ``<name>.zarr``
+    rot_center: float
+        Optional rotation center stored as attribute by the hdf5 and zarr formats, NaN (default) if unknown
+    compression_level: int
+        deflate level of the hdf5 and zarr formats, from 0 (default, uncompressed) to 9
+    max_workers: int
+        number of threads compressing and writing the slices in the hdf5 and zarr formats
+    background: bool
+        if True, return immediately and write in the background writer thread, default is False
 
     Returns
     -------
-        The directory the files were actually saved in
+        The directory the files were actually saved in, or a ``concurrent.futures.Future``
+        resolving to it when writing in the background.
+
+    Notes
+    -----
+        While written in the background, data and rot_angles are read-only, so that modifying
+        them in place raises instead of altering the output. ``WorkflowEngineAuto.run`` waits
+        for the background writes before returning.
     """
 
     data = param.Array(doc="Data to save", precedence=1)
     outputbase = param.Foldername(default="/tmp/", doc="radiograph directory")
     name = param.String(default="save_data", doc="name for the radiograph")
     rot_angles = param.Array(doc="Collection of omega angles")
+    format = param.Selector(default="tiff", objects=["tiff", "hdf5", "zarr"], doc="output file format")
+    rot_center = param.Number(default=float("nan"), doc="rotation center stored by the hdf5 and zarr formats")
+    compression_level = param.Integer(
+        default=0, bounds=(0, 9), doc="deflate level of the hdf5 and zarr formats, 0 means uncompressed"
+    )
+    max_workers = param.Integer(
+        default=0,
+        bounds=(0, None),
+        doc="Maximum number of threads compressing and writing the slices in the hdf5 and zarr formats",
+    )
+    background = param.Boolean(default=False, doc="Return immediately and write in a background thread")
 
     def __call__(self, **params):
         """Parse inputs and perform multiple dispatch."""
@@ -724,10 +1554,22 @@ class save_data(param.ParameterizedFunction):
 
         save_dir = Path(params.outputbase) / f"{params.name}_{to_time_str()}"
 
-        # save the data as tiffs
-        _save_data(filename=save_dir / params.name, data=params.data, rot_angles=params.rot_angles)
+        # save the data, possibly in the background
+        def write():
+            _save_data(
+                filename=save_dir / params.name,
+                data=params.data,
+                rot_angles=params.rot_angles,
+                file_format=params.format,
+                rot_center=None if np.isnan(params.rot_center) else params.rot_center,
+                compression_level=params.compression_level,
+                max_workers=clamp_max_workers(params.max_workers),
+            )
+            return save_dir
 
-        return save_dir
+        if params.background:
+            return submit_write(write, readonly=[params.data, params.rot_angles])
+        return write()
 
 
 class save_checkpoint(param.ParameterizedFunction):
@@ -737,6 +1579,7 @@ class save_checkpoint(param.ParameterizedFunction):
     The filenames will be
     ``<outputbase>/<name>_chkpt_YYYYMMDDhhmm/<name>_####.tiff``
     where a canonical ``outputbase`` is ``/HFIR/CG1D/IPTS-23788/shared/processed_data/``.
+    The hdf5 and zarr formats write a single ``<name>.h5`` or ``<name>.zarr`` instead.
 
     Parameters
     ----------
@@ -749,10 +1592,27 @@ class save_checkpoint(param.ParameterizedFunction):
         Used to name file of output, defaults to output_{datetime}
     rot_angles: Array
         Optional for writing out the array of rotational (omega) angles
+    format: str
+        "tiff" (default) for one tiff per slice, "hdf5" for ``<name>.h5`` or "zarr" for ``<name>.zarr``
+    rot_center: float
+        Optional rotation center stored as attribute by the hdf5 and zarr formats, NaN (default) if unknown
+    compression_level: int
+        deflate level of the hdf5 and zarr formats, from 0 (default, uncompressed) to 9
+    max_workers: int
+        number of threads compressing and writing the slices in the hdf5 and zarr formats
+    background: bool
+        if True, return immediately and write in the background writer thread, default is False
 
     Returns
     -------
-        The directory the files were actually saved in
+        The directory the files were actually saved in, or a ``concurrent.futures.Future``
+        resolving to it when writing in the background.
+
+    Notes
+    -----
+        While written in the background, data and rot_angles are read-only, so that modifying
+        them in place raises instead of altering the output. ``WorkflowEngineAuto.run`` waits
+        for the background writes before returning.
     """
 
     data = param.Array(doc="Data to save", precedence=1)
@@ -760,6 +1620,17 @@ class save_checkpoint(param.ParameterizedFunction):
 
     name = param.String(default="*", doc="name for the checkpoint")
     rot_angles = param.Array(doc="Collection of rotational (omega) angles")
+    format = param.Selector(default="tiff", objects=["tiff", "hdf5", "zarr"], doc="output file format")
+    rot_center = param.Number(default=float("nan"), doc="rotation center stored by the hdf5 and zarr formats")
+    compression_level = param.Integer(
+        default=0, bounds=(0, 9), doc="deflate level of the hdf5 and zarr formats, 0 means uncompressed"
+    )
+    max_workers = param.Integer(
+        default=0,
+        bounds=(0, None),
+        doc="Maximum number of threads compressing and writing the slices in the hdf5 and zarr formats",
+    )
+    background = param.Boolean(default=False, doc="Return immediately and write in a background thread")
 
     def __call__(self, **params):
         """Parse inputs and perform multiple dispatch."""
@@ -772,7 +1643,19 @@ class save_checkpoint(param.ParameterizedFunction):
 
         save_dir = params.outputbase / f"{params.name}_chkpt_{to_time_str()}"
 
-        # save the data as tiffs
-        _save_data(filename=save_dir / params.name, data=params.data, rot_angles=params.rot_angles)
+        # save the data, possibly in the background
+        def write():
+            _save_data(
+                filename=save_dir / params.name,
+                data=params.data,
+                rot_angles=params.rot_angles,
+                file_format=params.format,
+                rot_center=None if np.isnan(params.rot_center) else params.rot_center,
+                compression_level=params.compression_level,
+                max_workers=clamp_max_workers(params.max_workers),
+            )
+            return save_dir
 
-        return save_dir
+        if params.background:
+            return submit_write(write, readonly=[params.data, params.rot_angles])
+        return write()
@@ -4,12 +4,30 @@ import logging
 import numpy as np
 import param
 import tifffile
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
+from typing import Iterable, Optional, Tuple
 
 
 # setup module level logger
 logger = logging.getLogger(__name__)
 
+#: private tiff tags describing the instrument configuration, compared when matching files
+INSTRUMENT_TAGS = (
+    65026,  # "ManufacturerStr:Andor"
+    65027,  # "ExposureTime:70.000000"
+    65066,  # "MotSlitVT.RBV:10.000000"
+    65068,  # "MotSlitHR.RBV:10.000000"
+    65070,  # "MotSlitHL.RBV:20.000000"
+)
+#: subset of the instrument tags relevant for dark current files (no slits)
+DARK_CURRENT_TAGS = (65026, 65027)
+#: private tiff tag holding the rotation angle, e.g. "RotationActual:0.579840"
+ROTATION_ANGLE_TAG = 65039
+#: every private tag read by :func:`scan_tiff_headers` by default
+HEADER_TAGS = INSTRUMENT_TAGS + (ROTATION_ANGLE_TAG,)
+
 
 class MetaData(param.Parameterized):
     """Metadata extracted from given file."""
@@ -125,3 +143,149 @@ def _extract_metadata_from_tiff(
             pass
         metadata[k] = v
     return metadata
+
+
+def scan_tiff_headers(
+    filelist: Iterable[str],
+    tags: Iterable[int] = HEADER_TAGS,
+    max_workers: int = 1,
+) -> np.ndarray:
+    """
+    Read the private tags of many tiff files into a table.
+
+    Every file is opened exactly once, and the files are read concurrently when
+    ``max_workers`` is larger than one.
+
+    Parameters
+    ----------
+    filelist :
+        tiff files to scan.
+    tags :
+        private tags to read.
+    max_workers :
+        number of threads used to read the headers.
+
+    Returns
+    -------
+    table :
+        structured array with one row per file, a ``filename`` field, a boolean ``readable``
+        field, False for the files that could not be read as tiff, and one string field per
+        tag named after the tag number, e.g. ``table["65027"]``. The fields hold the value of
+        the tag (the text after the colon), or an empty string if the tag, or the file, could
+        not be read.
+    """
+    filelist = list(map(str, filelist))
+    # duplicated tags would give duplicated field names
+    tags = tuple(dict.fromkeys(tags))
+    reader = partial(_read_tiff_tags, tags=tags)
+    if max_workers > 1 and len(filelist) > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            headers = list(executor.map(reader, filelist))
+    else:
+        headers = [reader(filename) for filename in filelist]
+    rows = [
+        (filename,) + (("",) * len(tags) if values is None else values) for filename, values in zip(filelist, headers)
+    ]
+    # size every column after its longest entry to keep the table compact
+    names = ["filename"] + [str(tag) for tag in tags]
+    dtype = [(name, f"U{max([len(row[i]) for row in rows], default=1) or 1}") for i, name in enumerate(names)]
+    # the files that could not be read at all
+    dtype.insert(1, ("readable", bool))
+    rows = [row[:1] + (values is not None,) + row[1:] for row, values in zip(rows, headers)]
+    return np.array(rows, dtype=dtype)
+
+
+def header_values(table: np.ndarray, tag: int) -> np.ndarray:
+    """
+    Convert a column of a header table to floats.
+
+    Parameters
+    ----------
+    table :
+        table returned by :func:`scan_tiff_headers`.
+    tag :
+        tag to convert.
+
+    Returns
+    -------
+    values :
+        the values of the tag, NaN where the tag is missing or not numeric.
+    """
+    column = table[str(tag)]
+    try:
+        return column.astype(float)
+    except ValueError:
+        # some entries are empty or not numbers, convert one by one
+        values = np.full(column.shape, np.nan)
+        for i, value in enumerate(column):
+            try:
+                values[i] = float(value)
+            except ValueError:
+                pass
+        return values
+
+
+def match_headers(
+    table: np.ndarray,
+    reference: np.void,
+    tags: Iterable[int] = INSTRUMENT_TAGS,
+    relative_tolerance: float = 0.01,
+) -> np.ndarray:
+    """
+    Find the files of a header table whose metadata match a reference.
+
+    Follows the same rules as :class:`MetaData`: numeric values are compared within a
+    relative tolerance, other values must be equal, and only the tags present in both
+    the reference and the file are compared. As :class:`MetaData` cannot be built for
+    them, the files that could not be read never match, and are reported with a warning.
+
+    Parameters
+    ----------
+    table :
+        table returned by :func:`scan_tiff_headers`.
+    reference :
+        row of a header table to compare against.
+    tags :
+        tags to compare.
+    relative_tolerance :
+        relative tolerance for comparing numeric values.
+
+    Returns
+    -------
+    mask :
+        boolean array, True for the files matching the reference.
+
+    Raises
+    ------
+    ValueError
+        if the reference file could not be read.
+    """
+    if not reference["readable"]:
+        raise ValueError(f"Failed to read the header of the reference {reference['filename']}")
+    unreadable = ~table["readable"]
+    if np.any(unreadable):
+        logger.warning(f"Ignoring the files that could not be read: {list(table['filename'][unreadable])}")
+    mask = ~unreadable
+    for tag in map(str, tags):
+        ref = reference[tag]
+        if not ref:
+            continue
+        try:
+            is_match = np.isclose(header_values(table, tag), float(ref), rtol=relative_tolerance)
+        except ValueError:
+            is_match = table[tag] == ref
+        # a tag absent from a readable file is not compared
+        mask &= is_match | (table[tag] == "")
+    return mask
+
+
+# use _func to avoid sphinx pulling it into docs
+def _read_tiff_tags(filename: str, tags: Tuple[int]) -> Optional[Tuple[str]]:
+    """Read the given tags from the first page of a tiff file, empty strings if missing, None if unreadable."""
+    try:
+        with tifffile.TiffFile(filename) as tiff:
+            page_tags = tiff.pages[0].tags
+            return tuple(str(page_tags[tag].value).split(":")[-1] if tag in page_tags else "" for tag in tags)
+    except Exception as e:
+        logger.debug(f"Failed to read the header of {filename}: {e}")
+        return None
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Background writer for iMars3D outputs."""
+import logging
+import threading
+import numpy as np
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, List, Optional, Sequence
+
+# setup module level logger
+logger = logging.getLogger(__name__)
+
+# a single thread drains the writes in submission order
+_executor: Optional[ThreadPoolExecutor] = None
+_pending: List[Future] = []
+_lock = threading.Lock()
+
+
+def submit_write(func: Callable[[], Any], readonly: Sequence[Optional[np.ndarray]] = ()) -> Future:
+    """
+    Run a write function in the background writer thread.
+
+    Parameters
+    ----------
+    func:
+        function performing the write, its return value becomes the result of the handle.
+    readonly:
+        arrays being written, they are made read-only until the write completes so that
+        in-place modifications fail loudly instead of corrupting the output.
+
+    Returns
+    -------
+        handle of the write, ``handle.result()`` blocks until the write completes.
+    """
+    global _executor
+    arrays = [array for array in readonly if isinstance(array, np.ndarray)]
+    writeable = [array.flags.writeable for array in arrays]
+    for array in arrays:
+        array.flags.writeable = False
+
+    def write():
+        try:
+            return func()
+        except Exception as e:
+            logger.error(f"Background write failed: {e}")
+            raise
+        finally:
+            # release the arrays before the handle is marked as done
+            for array, flag in zip(arrays, writeable):
+                array.flags.writeable = flag
+
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="imars3d-writer")
+        future = _executor.submit(write)
+        _pending.append(future)
+    return future
+
+
+def wait_for_pending_writes(timeout: Optional[float] = None) -> List[Future]:
+    """
+    Block until all the writes submitted so far are complete.
+
+    Parameters
+    ----------
+    timeout:
+        maximum number of seconds to wait, default is to wait for as long as needed.
+
+    Returns
+    -------
+        the handles of the completed writes, failed writes raise when calling ``result()``.
+    """
+    with _lock:
+        pending = list(_pending)
+    done, _ = wait(pending, timeout=timeout)
+    with _lock:
+        for future in done:
+            _pending.remove(future)
+    return [future for future in pending if future in done]
@@ -5,9 +5,8 @@ import logging
 import numpy as np
 
 import param
-from imars3d.backend.util.functions import clamp_max_workers, calculate_chunksize
-from multiprocessing.managers import SharedMemoryManager
-from tqdm.contrib.concurrent import process_map
+from imars3d.backend.util.functions import clamp_max_workers
+from imars3d.backend.util.shared import map_slice_groups
 from tomopy.recon.rotation import find_center_pc
 from imars3d.backend.diagnostics.tilt import find_180_deg_pairs_idx
 
@@ -123,29 +122,13 @@ class find_rotation_center(param.ParameterizedFunction):
 
         # process
         max_workers = clamp_max_workers(max_workers)
-        # use shared memory model and tqdm wrapper for multiprocessing to reduce
-        # runtime memory footprint
-        with SharedMemoryManager() as smm:
-            # create the shared memory
-            shm = smm.SharedMemory(arrays.nbytes)
-            # create a numpy array point to the shared memory
-            shm_arrays = np.ndarray(
-                arrays.shape,
-                dtype=arrays.dtype,
-                buffer=shm.buf,
-            )
-            # copy data
-            np.copyto(shm_arrays, arrays)
-            # map the multiprocessing calls
-            kwargs = {
-                "max_workers": max_workers,
-                "chunksize": calculate_chunksize(len(idx_low), max_workers),
-                "desc": "Finding rotation center",
-            }
-            if tqdm_class:
-                kwargs["tqdm_class"] = tqdm_class
-            rst = process_map(
-                find_center_pc, [shm_arrays[il] for il in idx_low], [shm_arrays[ih] for ih in idx_hgh], **kwargs
-            )
+        rst = map_slice_groups(
+            find_center_pc,
+            arrays,
+            zip(idx_low, idx_hgh),
+            max_workers=max_workers,
+            desc="Finding rotation center",
+            tqdm_class=tqdm_class,
+        )
         # use the median value
         return (np.median(rst),)
@@ -3,8 +3,7 @@
 """iMars3D's tilt correction module."""
 import logging
 import param
-import multiprocessing
-from imars3d.backend.util.functions import clamp_max_workers, calculate_chunksize
+from imars3d.backend.util.functions import astype_result, clamp_max_workers, output_target, result_dtype
 import numpy as np
 from typing import Tuple, Union, Optional
 from functools import partial
@@ -12,8 +11,7 @@ from scipy.optimize import minimize_scalar
 from scipy.optimize import OptimizeResult
 from skimage.transform import rotate
 from skimage.registration import phase_cross_correlation
-from multiprocessing.managers import SharedMemoryManager
-from tqdm.contrib.concurrent import process_map
+from imars3d.backend.util.shared import map_slice_groups, map_slices
 
 logger = logging.getLogger(__name__)
 
@@ -327,32 +325,19 @@ class tilt_correction(param.ParameterizedFunction):
         logger.debug(f"len(idx_highrange) = {len(idx_highrange)}")
 
         # step 2: calculate tilt angle per 180 deg pair
-        with SharedMemoryManager() as smm:
-            # create shared memory
-            shm = smm.SharedMemory(params.arrays.nbytes)
-            shm_arrays = np.ndarray(params.arrays.shape, dtype=params.arrays.dtype, buffer=shm.buf)
-
-            np.copyto(shm_arrays, params.arrays)
-
-            kwargs = {
-                "max_workers": self.max_workers,
-                "chunksize": calculate_chunksize(len(idx_lowrange), self.max_workers),
-                "desc": "Calculating tilt correction",
-            }
-            if params.tqdm_class:
-                kwargs["tqdm_class"] = params.tqdm_class
-
-            rst = process_map(
-                partial(
-                    calculate_tilt,
-                    low_bound=params.low_bound,
-                    high_bound=params.high_bound,
-                    center=params.center,
-                ),
-                [shm_arrays[il] for il in idx_lowrange],
-                [shm_arrays[ih] for ih in idx_highrange],
-                **kwargs,
-            )
+        rst = map_slice_groups(
+            partial(
+                calculate_tilt,
+                low_bound=params.low_bound,
+                high_bound=params.high_bound,
+                center=params.center,
+            ),
+            params.arrays,
+            zip(idx_lowrange, idx_highrange),
+            max_workers=self.max_workers,
+            desc="Calculating tilt correction",
+            tqdm_class=params.tqdm_class,
+        )
         # extract the tilt angles from the optimization results
         tilts = np.array([result.x for result in rst])
         # use the average of the found tilt angles
@@ -392,6 +377,12 @@ class apply_tilt_correction(param.ParameterizedFunction):
         Number of cores to use for parallel median filtering, default is 0, which means using all available cores.
     tqdm_class: panel.widgets.Tqdm
         Class to be used for rendering tqdm progress
+    inplace: bool
+        Write the result into arrays instead of a new array.
+    out: np.ndarray
+        Array to write the result into instead of a new array.
+    dtype: str
+        Floating point data type of the result when it is a new array, float32 by default.
 
     Returns
     -------
@@ -415,6 +406,9 @@ class apply_tilt_correction(param.ParameterizedFunction):
         doc="Number of cores to use for parallel median filtering, default is 0, which means using all available cores.",
     )
     tqdm_class = param.ClassSelector(class_=object, doc="Progress bar to render with")
+    inplace = param.Boolean(default=False, doc="Write the result into arrays instead of a new array.")
+    out = param.Array(default=None, doc="Array to write the result into instead of a new array.")
+    dtype = param.String(default="float32", doc="Floating point data type of the result when it is a new array.")
 
     def __call__(self, **params):
         """Parse input and perform tilt correction with given tilt angle."""
@@ -425,35 +419,34 @@ class apply_tilt_correction(param.ParameterizedFunction):
         params = param.ParamOverrides(self, params)
 
         # type validation is done, now replacing max_worker with an actual integer
-        self.max_workers = multiprocessing.cpu_count() if params.max_workers == 0 else params.max_workers
+        self.max_workers = clamp_max_workers(params.max_workers)
         logger.debug(f"max_worker={self.max_workers}")
 
+        dtype = result_dtype(params.arrays, params.dtype)
+        target = output_target(params.arrays, params.inplace, params.out, dtype)
+        # skimage interpolates in double precision, the images are converted one at a time
+        rotate_image = astype_result(
+            partial(rotate, angle=-params.tilt, resize=False, preserve_range=True, center=params.center),
+            dtype if target is None else target.dtype,
+        )
         corrected_array = None
         # dimensionality check
         if params.arrays.ndim == 2:
             logger.info(f"2D image detected, applying tilt correction with tilt = {params.tilt:.3f} deg")
-            corrected_array = rotate(
-                params.arrays, -params.tilt, resize=False, preserve_range=True, center=params.center
-            )
+            corrected_array = rotate_image(params.arrays)
+            if target is not None:
+                target[...] = corrected_array
+                corrected_array = target
         elif params.arrays.ndim == 3:
             logger.info(f"3D array detected, applying tilt correction with tilt = {params.tilt:.3f} deg")
-            with SharedMemoryManager() as smm:
-                shm = smm.SharedMemory(params.arrays.nbytes)
-                shm_arrays = np.ndarray(params.arrays.shape, dtype=params.arrays.dtype, buffer=shm.buf)
-                np.copyto(shm_arrays, params.arrays)
-                kwargs = {
-                    "max_workers": self.max_workers,
-                    "chunksize": calculate_chunksize(params.arrays.shape[0], self.max_workers),
-                    "desc": "Applying tilt corr",
-                }
-                if params.tqdm_class:
-                    kwargs["tqdm_class"] = params.tqdm_class
-                rst = process_map(
-                    partial(rotate, angle=-params.tilt, resize=False, preserve_range=True, center=params.center),
-                    [shm_arrays[idx] for idx in range(params.arrays.shape[0])],
-                    **kwargs,
-                )
-            corrected_array = np.array(rst)
+            corrected_array = map_slices(
+                rotate_image,
+                params.arrays,
+                out=target,
+                max_workers=self.max_workers,
+                desc="Applying tilt corr",
+                tqdm_class=params.tqdm_class,
+            )
         else:
             logger.error(f"Input array must be 2D or 3D, got {params.arrays.ndim}D")
             raise ValueError(f"Input array must be 2D or 3D, got {params.arrays.ndim}D")
@@ -3,7 +3,8 @@
 """iMars3D normalization module."""
 
 # package imports
-from imars3d.backend.util.functions import clamp_max_workers
+from imars3d.backend.corrections.beam_hardening import _beam_hardening_block, _check_beam_hardening
+from imars3d.backend.util.functions import clamp_max_workers, output_target, result_dtype
 
 # third party imports
 import numpy as np
@@ -11,11 +12,16 @@ import param
 from tomopy.prep.normalize import minus_log as tm_minus_log
 
 # standard imports
+from concurrent.futures import ThreadPoolExecutor
 import logging
+from typing import Optional
 
 
 logger = logging.getLogger(__name__)
 
+# size of the blocks of images processed by fused_normalization, small enough to stay in the processor cache
+_BLOCK_BYTES = 16 * 1024**2
+
 
 class normalization(param.ParameterizedFunction):
     """
@@ -26,11 +32,19 @@ class normalization(param.ParameterizedFunction):
     arrays:
         3D array of images, the first dimension is the rotation angle omega.
     flats:
-        3D array of flat field images (aka flat field, open beam), axis=0 is the image number axis.
+        3D array of flat field images (aka flat field, open beam), axis=0 is the image number axis,
+        or a single 2D image already reduced, e.g. by ``load_data(reduction="median")``.
     darks:
-        3D array of dark field images, axis=0 is the image number axis.
+        3D array of dark field images, axis=0 is the image number axis, or a single 2D image
+        already reduced.
     max_workers:
         number of cores to use for parallel processing, default is 0, which means using all available cores.
+    inplace:
+        write the result into arrays, which must be of a floating point type, instead of a new array.
+    out:
+        array to write the result into instead of a new array.
+    dtype:
+        floating point data type of the result when it is a new array, float32 by default.
 
     Returns
     -------
@@ -39,14 +53,20 @@ class normalization(param.ParameterizedFunction):
 
     arrays = param.Array(doc="3D array of images, the first dimension is the rotation angle omega.", default=None)
     flats = param.Array(
-        doc="3D array of flat field images (aka flat field, open beam), axis=0 is the image number axis.", default=None
+        doc="3D array of flat field images (aka flat field, open beam), axis=0 is the image number axis, or 2D image.",
+        default=None,
+    )
+    darks = param.Array(
+        doc="3D array of optional dark field images, axis=0 is the image number axis, or 2D image.", default=None
     )
-    darks = param.Array(doc="3D array of optional dark field images, axis=0 is the image number axis.", default=None)
     max_workers = param.Integer(
         default=0,
         bounds=(0, None),
         doc="Maximum number of processes allowed during execution",
     )
+    inplace = param.Boolean(default=False, doc="write the result into arrays instead of a new array")
+    out = param.Array(default=None, doc="array to write the result into instead of a new array")
+    dtype = param.String(default="float32", doc="floating point data type of the result when it is a new array")
 
     def __call__(self, **params):
         """Perform normalization via numpy."""
@@ -59,20 +79,22 @@ class normalization(param.ParameterizedFunction):
         self.max_workers = clamp_max_workers(params.max_workers)
         logger.debug(f"max_worker={self.max_workers}")
 
-        # process flats (formerly known as open beam, white field)
-        self.flats = np.median(params.flats, axis=0)
-
-        # process darks (formerly known as black field)
-        if params.darks is None:
-            self.darks = np.zeros_like(self.flats)
-        else:
-            self.darks = np.median(params.darks, axis=0)
+        # process flats (formerly known as open beam, white field) and darks (formerly known as black field)
+        self.flats, self.darks, _bg = _flats_darks_background(params.flats, params.darks)
 
         # apply normalization
-        _bg = self.flats - self.darks
-        _bg[_bg <= 0] = 1e-6
-        params.arrays = params.arrays - self.darks
-        arrays_normalized = np.true_divide(params.arrays, _bg, dtype=np.float32)
+        dtype = result_dtype(params.arrays, params.dtype)
+        if not np.issubdtype(dtype, np.floating):
+            raise ValueError(f"Normalized images cannot be of type {dtype}")
+        arrays_normalized = output_target(params.arrays, params.inplace, params.out, dtype)
+        if arrays_normalized is None:
+            arrays_normalized = np.empty(params.arrays.shape, dtype=dtype)
+        # a block of images at a time, to only hold a block of the difference in double precision
+        arrays = params.arrays[np.newaxis] if params.arrays.ndim == 2 else params.arrays
+        output = arrays_normalized[np.newaxis] if arrays_normalized.ndim == 2 else arrays_normalized
+        block = max(1, _BLOCK_BYTES // max(1, 8 * arrays[0].size))
+        for start in range(0, len(arrays), block):
+            _normalize_block(arrays[start : start + block], self.darks, _bg, output[start : start + block])
 
         # return
         logger.info("FINISHED Executing Filter: Normalization")
@@ -80,6 +102,37 @@ class normalization(param.ParameterizedFunction):
         return arrays_normalized
 
 
+# use _func to avoid sphinx pulling it into docs
+def _median_image(arrays: np.ndarray) -> np.ndarray:
+    """Median along the image number axis, 2D images are assumed to be reduced already."""
+    if arrays.ndim == 2:
+        return arrays
+    return np.median(arrays, axis=0)
+
+
+# use _func to avoid sphinx pulling it into docs
+def _flats_darks_background(flats: np.ndarray, darks: Optional[np.ndarray]) -> tuple:
+    """Median flat and dark images, and the background the images are divided by."""
+    flats = _median_image(flats)
+    darks = np.zeros_like(flats) if darks is None else _median_image(darks)
+    background = flats - darks
+    background[background <= 0] = 1e-6
+    return flats, darks, background
+
+
+# use _func to avoid sphinx pulling it into docs
+def _normalize_block(arrays: np.ndarray, darks: np.ndarray, background: np.ndarray, out: np.ndarray) -> None:
+    """Normalize a block of images into ``out``, the difference to the darks is computed in double precision."""
+    np.true_divide(arrays - darks, background, out=out, dtype=out.dtype)
+
+
+# use _func to avoid sphinx pulling it into docs
+def _check_minus_log(arrays: np.ndarray) -> None:
+    """Raise the error of ``minus_log`` for arrays with elements equal or smaller than zero."""
+    if not np.all(arrays > 0.0):
+        raise ValueError("'minus_log' cannot be applied to arrays containing elements equal or smaller than zero")
+
+
 class minus_log(param.ParameterizedFunction):
     r"""Computation of the minus natural log of a given array.
 
@@ -120,8 +173,109 @@ class minus_log(param.ParameterizedFunction):
         # type validation is done, now replacing max_worker with an actual integer
         self.max_workers = clamp_max_workers(params.max_workers)
         logger.debug(f"max_worker={self.max_workers}")
-        if not np.all(params.arrays > 0.0):
-            raise ValueError("'minus_log' cannot be applied to arrays containing elements equal or smaller than zero")
+        _check_minus_log(params.arrays)
         arrays_normalized = tm_minus_log(params.arrays, ncore=self.max_workers)
         logger.info("FINISHED Executing Filter: minus_log")
         return arrays_normalized
+
+
+class fused_normalization(param.ParameterizedFunction):
+    """
+    Normalize, clip, correct for beam hardening and take the minus log in a single pass.
+
+    Computes ``-log((arrays - darks) / (flats - darks))``, with the optional beam hardening
+    response curve of ``beam_hardening_correction`` applied before the log. The stack is processed
+    by blocks of images written straight into the float32 output with in-place arithmetic, instead
+    of one full-size array and one sweep of the stack per step. Without clipping, the results and
+    errors are those of ``normalization``, ``beam_hardening_correction`` and ``minus_log`` run one
+    after the other, so ``WorkflowEngineAuto`` replaces consecutive tasks of these by this function.
+
+    Parameters
+    ----------
+    arrays:
+        3D array of images, the first dimension is the rotation angle omega, or a single 2D image.
+    flats:
+        3D array of flat field images, or a single 2D image already reduced.
+    darks:
+        3D array of optional dark field images, or a single 2D image already reduced.
+    clip_min:
+        if positive, the normalized values are clipped to this minimum before taking the log,
+        default is 0, which means no clipping.
+    beam_hardening:
+        whether to apply the beam hardening correction to the normalized images.
+    q:
+        beam hardening correction parameter, must be positive.
+    n:
+        beam hardening correction parameter, must be larger than or equal to 2.
+    opt:
+        if True, beam hardening correction biased towards 1.0, else biased towards 0.0.
+    minus_log:
+        whether to take the minus log of the normalized images.
+    max_workers:
+        number of threads processing the blocks, default is 0, which means using all available cores.
+
+    Returns
+    -------
+        float32 array of images with the shape of ``arrays``.
+    """
+
+    arrays = param.Array(doc="3D array of images, the first dimension is the rotation angle omega.", default=None)
+    flats = param.Array(
+        doc="3D array of flat field images, axis=0 is the image number axis, or 2D image.", default=None
+    )
+    darks = param.Array(doc="3D array of optional dark field images, or 2D image.", default=None)
+    clip_min = param.Number(default=0.0, bounds=(0, None), doc="Minimum of the normalized values, 0 for no clipping")
+    beam_hardening = param.Boolean(default=False, doc="Apply the beam hardening correction")
+    q = param.Number(default=0.005, bounds=(0, None), doc="The beam hardening correction parameter.")
+    n = param.Number(default=20.0, bounds=(1, None), doc="The beam hardening correction parameter.")
+    opt = param.Boolean(default=True, doc="If True, beam hardening correction biased towards 1.0")
+    minus_log = param.Boolean(default=True, doc="Take the minus log of the normalized images")
+    max_workers = param.Integer(
+        default=0,
+        bounds=(0, None),
+        doc="Maximum number of threads allowed during execution",
+    )
+
+    def __call__(self, **params):
+        """Perform the fused normalization via in-place numpy arithmetic."""
+        logger.info("Executing Filter: Fused Normalization")
+        # type*bounds check via Parameter
+        _ = self.instance(**params)
+        # sanitize arguments
+        params = param.ParamOverrides(self, params)
+        self.max_workers = clamp_max_workers(params.max_workers)
+        logger.debug(f"max_worker={self.max_workers}")
+
+        # a single image is processed as a stack of one image
+        arrays = params.arrays[np.newaxis] if params.arrays.ndim == 2 else params.arrays
+        # same background and arithmetic as normalization
+        _, darks, background = _flats_darks_background(params.flats, params.darks)
+        output = np.empty(arrays.shape, dtype=np.float32)
+
+        image_bytes = max(1, output[0].nbytes) if len(output) else 1
+        block = max(1, _BLOCK_BYTES // image_bytes)
+
+        def process(start):
+            out = output[start : start + block]
+            _normalize_block(arrays[start : start + block], darks, background, out)
+            if params.clip_min > 0:
+                np.maximum(out, params.clip_min, out=out)
+            if params.beam_hardening:
+                _check_beam_hardening(out, params.n)
+                _beam_hardening_block(out, params.q, params.n, params.opt)
+            if not params.minus_log:
+                return True
+            # the log is only taken if the whole stack is positive, see the check below
+            positive = bool(np.all(out > 0.0))
+            if positive:
+                np.log(out, out=out)
+                np.negative(out, out=out)
+            return positive
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            positive = all(list(pool.map(process, range(0, len(output), block))))
+        if not positive:
+            # same error as minus_log on the normalized stack
+            _check_minus_log(output)
+        logger.info("FINISHED Executing Filter: Fused Normalization")
+        return output.reshape(params.arrays.shape)
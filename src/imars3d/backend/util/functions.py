@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
 """Util for imars3d."""
 
+# third party imports
+import numpy as np
+
 # standard imports
 from datetime import datetime
+from functools import partial
 import logging
 import multiprocessing
 import resource
-from typing import Optional, Union
+from typing import Callable, Optional, Tuple, Union
 
 
 logger = logging.getLogger(__name__)
@@ -63,6 +67,111 @@ def calculate_chunksize(num_elements: int, max_workers: Optional[int] = None, sc
     return chunksize
 
 
+def result_dtype(arrays: np.ndarray, dtype: str) -> np.dtype:
+    """Data type of the result of a filter, following its ``dtype`` parameter.
+
+    Parameters
+    ----------
+    arrays:
+        The input of the filter
+    dtype:
+        Name of a numpy data type, or "same" for the data type of ``arrays``
+
+    Returns
+    -------
+        The data type
+    """
+    return arrays.dtype if dtype == "same" else np.dtype(dtype)
+
+
+def output_target(
+    arrays: np.ndarray,
+    inplace: bool = False,
+    out: Optional[np.ndarray] = None,
+    dtype: Union[str, np.dtype] = "same",
+    shape: Optional[Tuple[int, ...]] = None,
+) -> Optional[np.ndarray]:
+    """Array a filter writes its result into, following its ``inplace`` and ``out`` parameters.
+
+    Parameters
+    ----------
+    arrays:
+        The input of the filter
+    inplace:
+        Whether to write the result into ``arrays``
+    out:
+        Array to write the result into
+    dtype:
+        Data type of the values computed by the filter, they must fit the target without a change of kind,
+        e.g. floating point results cannot be written into integer arrays
+    shape:
+        Shape of the result, that of ``arrays`` by default
+
+    Returns
+    -------
+        ``arrays``, ``out``, or None when the result is a new array
+    """
+    if inplace and out is not None:
+        raise ValueError("Either filter in place or give an output array, not both")
+    target = arrays if inplace else out
+    if target is None:
+        return None
+    if not target.flags.writeable:
+        raise ValueError("Cannot write the result into a read-only array")
+    shape = arrays.shape if shape is None else tuple(shape)
+    if target.shape != shape:
+        raise ValueError(f"Output array of shape {target.shape} given for a result of shape {shape}")
+    dtype = result_dtype(arrays, dtype)
+    if not np.can_cast(dtype, target.dtype, casting="same_kind"):
+        raise ValueError(f"Cannot write {dtype} results into an array of {target.dtype}")
+    return target
+
+
+def store_result(result: np.ndarray, target: Optional[np.ndarray], dtype: Union[str, np.dtype]) -> np.ndarray:
+    """Return the result of a filter as it is requested.
+
+    Parameters
+    ----------
+    result:
+        The result computed by the filter
+    target:
+        Array to write the result into, see ``output_target``, or None to return the result itself
+    dtype:
+        Data type of the result when ``target`` is None
+
+    Returns
+    -------
+        ``target`` holding the result, or the result converted to ``dtype``
+    """
+    if target is None:
+        return np.asarray(result).astype(dtype, copy=False)
+    if result is not target:
+        np.copyto(target, result, casting="unsafe")
+    return target
+
+
+def astype_result(func: Callable, dtype: Union[str, np.dtype]) -> Callable:
+    """Wrap a function so that its result is converted to a data type, e.g. to map it with ``map_slices``.
+
+    Parameters
+    ----------
+    func:
+        Picklable function returning an array
+    dtype:
+        Data type of the result
+
+    Returns
+    -------
+        Picklable function
+    """
+    return partial(_astype_result, func, np.dtype(dtype))
+
+
+# use _func to avoid sphinx pulling it into docs
+def _astype_result(func: Callable, dtype: np.dtype, *args, **kwargs) -> np.ndarray:
+    return np.asarray(func(*args, **kwargs)).astype(dtype, copy=False)
+
+
 def to_time_str(value: datetime = datetime.now()) -> str:
     """
     Convert the supplied datetime to a formatted string.
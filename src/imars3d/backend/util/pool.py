@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""Process pool shared by the parallel filters of the backend.
+
+Starting worker processes and importing the filters in them costs about as much as a
+small filter, so all the filters map their work over a single pool of processes. The
+pool is started on first use, or ahead of time with ``warm_pool``, and stays up until
+``shutdown_pool`` is called (the workflow engine calls it at the end of a run) or the
+interpreter exits.
+"""
+# package imports
+from imars3d.backend.util.functions import clamp_max_workers
+
+# third-party imports
+from tqdm.auto import tqdm
+
+# standard imports
+import atexit
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import importlib
+import logging
+import os
+import threading
+from typing import Callable, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_size = 0
+_pool_pid: Optional[int] = None
+
+
+def get_pool(max_workers: int = 0) -> ProcessPoolExecutor:
+    r"""The shared process pool, started with ``clamp_max_workers(max_workers)`` processes if needed.
+
+    A pool smaller than requested is replaced by a larger one, the number of processes
+    used by a map is capped by its own ``max_workers`` (see ``pool_imap``). The replaced
+    pool is shut down without waiting, its workers exit once the chunks already submitted
+    to it are done, and the maps running on it submit their next chunks to the new pool.
+
+    Parameters
+    ----------
+    max_workers:
+        number of processes needed, 0 means using all available cores.
+    """
+    global _pool, _pool_size, _pool_pid
+    size = clamp_max_workers(max_workers)
+    with _lock:
+        if _pool is not None and _pool_pid != os.getpid():
+            # inherited from the parent process, its workers belong to the parent
+            _pool, _pool_size = None, 0
+        if _pool is None or _pool_size < size:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            logger.debug(f"Starting the worker pool with {size} processes")
+            _pool, _pool_size, _pool_pid = ProcessPoolExecutor(max_workers=size), size, os.getpid()
+        return _pool
+
+
+def warm_pool(max_workers: int = 0, modules: Iterable[str] = ("imars3d.backend",)) -> int:
+    r"""Start the worker processes of the shared pool and import ``modules`` in them.
+
+    Parameters
+    ----------
+    max_workers:
+        number of processes to start, 0 means using all available cores.
+    modules:
+        modules imported by every worker, so that the first filter does not pay for it.
+
+    Returns
+    -------
+        The number of processes of the pool.
+    """
+    pool = get_pool(max_workers)
+    size = _pool_size
+    for module in modules:
+        list(pool.map(_import, [module] * size))
+    logger.info(f"Started the worker pool with {size} processes")
+    return size
+
+
+def shutdown_pool(wait: bool = True) -> None:
+    r"""Stop the worker processes of the shared pool, the next map starts a new pool.
+
+    Parameters
+    ----------
+    wait:
+        wait for the running maps to finish and the processes to exit.
+    """
+    global _pool, _pool_size
+    with _lock:
+        pool, _pool, _pool_size = _pool, None, 0
+    if pool is None or _pool_pid != os.getpid():
+        return
+    pool.shutdown(wait=wait, cancel_futures=not wait)
+    logger.debug("Stopped the worker pool")
+
+
+# use _func to avoid sphinx pulling it into docs
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    """Shut down a broken pool, the next map starts a new pool if it was the shared one."""
+    global _pool, _pool_size
+    with _lock:
+        if _pool is pool:
+            _pool, _pool_size = None, 0
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(shutdown_pool)
+
+
+def worker_pids() -> List[int]:
+    r"""Process ids of the running workers of the shared pool.
+
+    Returns
+    -------
+        The process ids, empty if no pool was started by this process.
+    """
+    with _lock:
+        if _pool_pid != os.getpid():
+            return []
+        # the executor only exposes its processes as a private attribute
+        return sorted(getattr(_pool, "_processes", None) or {})
+
+
+# use _func to avoid sphinx pulling it into docs
+def _import(module: str) -> None:
+    importlib.import_module(module)
+
+
+# use _func to avoid sphinx pulling it into docs
+def _apply_chunk(func: Callable, chunk: list) -> list:
+    return [func(*args) for args in chunk]
+
+
+def pool_imap(
+    func: Callable,
+    *iterables: Iterable,
+    max_workers: int = 0,
+    chunksize: int = 1,
+) -> Iterator:
+    r"""Lazy, ordered ``map(func, *iterables)`` running on the shared process pool.
+
+    At most ``max_workers`` chunks of ``chunksize`` items are in flight at any time, so a
+    filter never uses more processes than asked for even when the pool is larger, and
+    the results are consumed as they arrive instead of being collected first.
+
+    Parameters
+    ----------
+    func:
+        picklable function, e.g. a module-level function or a ``functools.partial`` of one.
+    iterables:
+        arguments of ``func``, consumed in parallel as with ``map``.
+    max_workers:
+        maximum number of processes working on this map, 0 means using all available cores.
+    chunksize:
+        number of items sent to a process at once.
+
+    Returns
+    -------
+        Iterator over the results, in the order of the arguments.
+    """
+    window = clamp_max_workers(max_workers)
+    items = list(zip(*iterables))
+    chunks = [items[i : i + chunksize] for i in range(0, len(items), max(1, chunksize))]
+    pool = get_pool(window)
+    futures: dict = dict()
+    results: dict = dict()
+    submitted, done_chunks = 0, 0
+    try:
+        while done_chunks < len(chunks):
+            while submitted < len(chunks) and len(futures) < window:
+                try:
+                    future = pool.submit(_apply_chunk, func, chunks[submitted])
+                except BrokenProcessPool:
+                    _discard_pool(pool)
+                    raise
+                except RuntimeError:
+                    # the pool was replaced by a larger one and shut down, see get_pool
+                    pool = get_pool(window)
+                    continue
+                futures[future] = (submitted, pool)
+                submitted += 1
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                idx, owner = futures.pop(future)
+                try:
+                    results[idx] = future.result()
+                except BrokenProcessPool:
+                    # a worker died (e.g. killed for using too much memory), only this pool is
+                    # discarded as other filters may be mapping on the shared one
+                    _discard_pool(owner)
+                    raise
+            while done_chunks in results:
+                yield from results.pop(done_chunks)
+                done_chunks += 1
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def pool_map(
+    func: Callable,
+    *iterables: Iterable,
+    max_workers: int = 0,
+    chunksize: int = 1,
+    desc: Optional[str] = None,
+    tqdm_class=None,
+) -> list:
+    r"""Drop-in replacement of ``tqdm.contrib.concurrent.process_map`` running on the shared process pool.
+
+    Parameters
+    ----------
+    func:
+        picklable function, e.g. a module-level function or a ``functools.partial`` of one.
+    iterables:
+        arguments of ``func``, consumed in parallel as with ``map``.
+    max_workers:
+        maximum number of processes working on this map, 0 means using all available cores.
+    chunksize:
+        number of items sent to a process at once.
+    desc:
+        description of the progress bar.
+    tqdm_class: panel.widgets.Tqdm
+        Class to be used for rendering tqdm progress, ``tqdm.auto.tqdm`` by default.
+
+    Returns
+    -------
+        The list of results, in the order of the arguments.
+    """
+    total = min(len(iterable) for iterable in iterables) if all(hasattr(it, "__len__") for it in iterables) else None
+    progress = tqdm if tqdm_class is None else tqdm_class
+    results = pool_imap(func, *iterables, max_workers=max_workers, chunksize=chunksize)
+    return list(progress(results, total=total, desc=desc))
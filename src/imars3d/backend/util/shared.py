@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""Zero-copy parallel maps over the slices of a stack.
+
+The stack and the result are shared with the worker processes through memory-mapped
+files in ``/dev/shm`` (the same RAM-backed file system ``multiprocessing.shared_memory``
+uses), the workers attach to them by file name and only receive the indices of the
+slices to process, instead of pickling every slice there and every result back.
+
+A stack that is already memory-mapped from a file, e.g. loaded with ``memmap_file``,
+is attached to directly and is not copied at all.
+"""
+# package imports
+from imars3d.backend.util.functions import calculate_chunksize, clamp_max_workers
+from imars3d.backend.util.pool import pool_imap
+
+# third-party imports
+import numpy as np
+from tqdm.auto import tqdm
+
+# standard imports
+from collections import namedtuple
+from contextlib import ExitStack, contextmanager
+from functools import partial
+import logging
+import mmap
+import os
+import tempfile
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# RAM-backed directory for the blocks shared with the workers, the temporary directory where there is none
+_SHARED_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+_Block = namedtuple("_Block", ["filename", "offset", "shape", "dtype"])
+
+
+# use _func to avoid sphinx pulling it into docs
+def _file_block(array: np.ndarray, writable: bool = False) -> Optional[_Block]:
+    r"""Description of an array memory-mapped from a file the workers can attach to, None if there is none."""
+    modes = ("r+", "w+") if writable else ("r", "r+", "w+")
+    if (
+        isinstance(array, np.memmap)
+        and isinstance(array.base, mmap.mmap)  # the whole mapping, not a view of it
+        and array.mode in modes  # copy-on-write changes are private to this process
+        and array.flags.c_contiguous
+        and array.filename
+    ):
+        return _Block(array.filename, array.offset, array.shape, array.dtype.str)
+    return None
+
+
+# use _func to avoid sphinx pulling it into docs
+@contextmanager
+def _shared_block(shape: Tuple[int, ...], dtype: np.dtype) -> Iterator[Tuple[np.ndarray, _Block]]:
+    r"""Array in a RAM-backed file shared with the workers, the file is removed on exit but the array stays valid."""
+    fd, filename = tempfile.mkstemp(prefix="imars3d-", suffix=".bin", dir=_SHARED_DIR)
+    os.close(fd)
+    try:
+        dtype = np.dtype(dtype)
+        array = np.memmap(filename, dtype=dtype, mode="w+", shape=shape)
+        yield array, _Block(filename, 0, shape, dtype.str)
+    finally:
+        os.unlink(filename)
+
+
+# use _func to avoid sphinx pulling it into docs
+def _attach(block: _Block, mode: str) -> np.memmap:
+    return np.memmap(block.filename, dtype=block.dtype, mode=mode, offset=block.offset, shape=block.shape)
+
+
+# use _func to avoid sphinx pulling it into docs
+def _take(array: np.ndarray, axis: int, index: int) -> np.ndarray:
+    return array[(slice(None),) * axis + (index,)]
+
+
+# use _func to avoid sphinx pulling it into docs
+def _copy_of(array: np.ndarray, axis: int, index: int) -> np.ndarray:
+    # the functions get a slice of their own, as they did when the slices were pickled to the workers
+    return np.array(_take(array, axis, index))
+
+
+# use _func to avoid sphinx pulling it into docs
+def _map_chunk(func: Callable, source: _Block, target: Optional[_Block], axis: int, groups: List[tuple]) -> list:
+    # copy-on-write, a function modifying its input does not change the stack
+    arrays = np.asarray(_attach(source, "c"))
+    if target is None:
+        return [func(*(_take(arrays, axis, i) for i in group)) for group in groups]
+    out = _attach(target, "r+")
+    for (i,) in groups:
+        _take(out, axis, i)[...] = func(_take(arrays, axis, i))
+    return [None] * len(groups)
+
+
+# use _func to avoid sphinx pulling it into docs
+def _run(
+    func: Callable,
+    arrays: np.ndarray,
+    groups: List[tuple],
+    axis: int,
+    target: Optional[_Block],
+    max_workers: int,
+    chunksize: Optional[int],
+) -> Iterator:
+    r"""Results of ``func`` over the groups of slices, computed by the shared pool."""
+    with ExitStack() as stack:
+        source = _file_block(arrays)
+        if source is None:
+            shared, source = stack.enter_context(_shared_block(arrays.shape, arrays.dtype))
+            np.copyto(shared, arrays)
+            del shared
+        chunksize = chunksize or calculate_chunksize(len(groups), max_workers)
+        chunks = [groups[i : i + chunksize] for i in range(0, len(groups), chunksize)]
+        for results in pool_imap(
+            partial(_map_chunk, func, source, target, axis), chunks, max_workers=max_workers, chunksize=1
+        ):
+            yield from results
+
+
+def map_slices(
+    func: Callable,
+    arrays: np.ndarray,
+    axis: int = 0,
+    out: Optional[np.ndarray] = None,
+    max_workers: int = 0,
+    chunksize: Optional[int] = None,
+    desc: Optional[str] = None,
+    tqdm_class=None,
+) -> np.ndarray:
+    r"""Apply a function to every slice of a stack along an axis, in parallel on the shared pool.
+
+    The workers write the result of every slice straight into the output. The shape and
+    dtype of the output are those of the result of ``func`` on the first slice, which is
+    computed in this process.
+
+    Parameters
+    ----------
+    func:
+        picklable function of a slice returning an array, e.g. a ``functools.partial`` of a module-level function.
+    arrays:
+        the stack.
+    axis:
+        axis of the slices, e.g. 0 for images and 1 for sinograms.
+    out:
+        where to write the results, can be ``arrays`` itself, a new array by default.
+    max_workers:
+        maximum number of processes, 0 means using all available cores.
+    chunksize:
+        number of slices sent to a process at once, see ``calculate_chunksize`` by default.
+    desc:
+        description of the progress bar.
+    tqdm_class: panel.widgets.Tqdm
+        Class to be used for rendering tqdm progress, ``tqdm.auto.tqdm`` by default.
+
+    Returns
+    -------
+        The stack of results, ``out`` if given.
+    """
+    num_slices = arrays.shape[axis]
+    if num_slices == 0:
+        raise ValueError("Cannot map a function over an empty stack")
+    max_workers = clamp_max_workers(max_workers)
+    progress = tqdm if tqdm_class is None else tqdm_class
+    first = np.asarray(func(_copy_of(arrays, axis, 0)))
+    shape = first.shape[:axis] + (num_slices,) + first.shape[axis:]
+    if out is not None and out.shape != shape:
+        raise ValueError(f"Output of shape {out.shape} given for results of shape {shape}")
+    if max_workers == 1 or num_slices == 1:
+        out = np.empty(shape, dtype=first.dtype) if out is None else out
+        _take(out, axis, 0)[...] = first
+        for i in progress(range(1, num_slices), total=num_slices, initial=1, desc=desc):
+            _take(out, axis, i)[...] = func(_copy_of(arrays, axis, i))
+        return out
+    with ExitStack() as stack:
+        target = None if out is None else _file_block(out, writable=True)
+        if target is None:
+            result, target = stack.enter_context(_shared_block(shape, first.dtype if out is None else out.dtype))
+        else:
+            result = out
+        _take(result, axis, 0)[...] = first
+        groups = [(i,) for i in range(1, num_slices)]
+        results = _run(func, arrays, groups, axis, target, max_workers, chunksize)
+        for _ in progress(results, total=num_slices, initial=1, desc=desc):
+            pass
+        if out is None:
+            # the mapping outlives the removed file
+            return np.asarray(result)
+        if result is not out:
+            np.copyto(out, result)
+        return out
+
+
+def map_slice_groups(
+    func: Callable,
+    arrays: np.ndarray,
+    groups: Iterable[Sequence[int]],
+    axis: int = 0,
+    max_workers: int = 0,
+    chunksize: Optional[int] = None,
+    desc: Optional[str] = None,
+    tqdm_class=None,
+) -> list:
+    r"""Call a function on groups of slices of a stack, e.g. pairs of opposite projections, in parallel on the shared pool.
+
+    Parameters
+    ----------
+    func:
+        picklable function taking the slices of a group as positional arguments, its results should be small.
+    arrays:
+        the stack.
+    groups:
+        indices of the slices of every group, e.g. ``zip(idx_low, idx_high)``.
+    axis:
+        axis of the slices.
+    max_workers:
+        maximum number of processes, 0 means using all available cores.
+    chunksize:
+        number of groups sent to a process at once, see ``calculate_chunksize`` by default.
+    desc:
+        description of the progress bar.
+    tqdm_class: panel.widgets.Tqdm
+        Class to be used for rendering tqdm progress, ``tqdm.auto.tqdm`` by default.
+
+    Returns
+    -------
+        The list of results, in the order of the groups.
+    """
+    groups = [tuple(int(i) for i in group) for group in groups]
+    max_workers = clamp_max_workers(max_workers)
+    progress = tqdm if tqdm_class is None else tqdm_class
+    if max_workers == 1 or len(groups) <= 1:
+        results = (func(*(_copy_of(arrays, axis, i) for i in group)) for group in groups)
+    else:
+        results = _run(func, arrays, groups, axis, None, max_workers, chunksize)
+    return list(progress(results, total=len(groups), desc=desc))
@@ -1,19 +1,73 @@
 #!/usr/bin/env python3
 """Workflow engine for imars3d."""
 # package imports
+from imars3d.backend.dataio.cache import TaskResultCache
+from imars3d.backend.dataio.writer import wait_for_pending_writes
+from imars3d.backend.util.pool import shutdown_pool
 from imars3d.backend.workflow import validate
+from imars3d.backend.workflow.estimate import estimate_workflow
+from imars3d.backend.workflow.profiler import TaskProfiler, describe
+from imars3d.backend.workflow.snapshot import RegistrySnapshot
+from imars3d.backend.workflow.streaming import SEPARABLE_FUNCTIONS, row_axis, slab_range, static_params, take_rows
 
 # third-party imports
+import numpy as np
+
 import param as libparam
 
 # standard imports
-from collections import namedtuple
+from collections import defaultdict, namedtuple
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from copy import deepcopy
 from enum import Enum
+from functools import lru_cache
+import hashlib
 import importlib
-from typing import Any, Optional
+import json
+import os
+from typing import Any, Iterable, List, Optional, Set, Tuple
 from pathlib import Path
 import logging
 
+logger = logging.getLogger(__name__)
+
+
+# use _func to avoid sphinx pulling it into docs
+def _path_signature(value: Any) -> Any:
+    r"""Replace the paths to existing files and directories by their size and modification time.
+
+    Directories are replaced by the signature of their entries (not recursively), so adding or
+    modifying a file in a directory of images changes the signature of the directory.
+    """
+    if isinstance(value, (list, tuple)):
+        return [_path_signature(item) for item in value]
+    if not isinstance(value, (str, Path)) or not os.path.exists(value):
+        return value
+    if os.path.isdir(value):
+        return [str(value), sorted(_path_signature(entry.path) for entry in os.scandir(value) if entry.is_file())]
+    stat = os.stat(value)
+    return [str(value), stat.st_size, stat.st_mtime_ns]
+
+
+# use _func to avoid sphinx pulling it into docs
+@lru_cache(maxsize=None)
+def _function_version(function_str: str) -> str:
+    r"""Digest of the imars3d version and of the source of the module defining a task function."""
+    digest = hashlib.sha256(str(importlib.import_module("imars3d").__version__).encode())
+    module = importlib.import_module(".".join(function_str.split(".")[:-1]))
+    try:
+        digest.update(Path(module.__file__).read_bytes())
+    except (OSError, TypeError):  # e.g. compiled extension or namespace module
+        pass
+    return digest.hexdigest()
+
+
+# use _func to avoid sphinx pulling it into docs
+def _digest(*items: Any) -> str:
+    r"""Digest of JSON serializable items."""
+    return hashlib.sha256(json.dumps(items, sort_keys=True, default=repr).encode()).hexdigest()
+
 
 class WorkflowEngineExitCodes(Enum):
     r"""Exit codes to be used with workflow engine errors."""
@@ -21,6 +75,7 @@ class WorkflowEngineExitCodes(Enum):
     SUCCESS = 0
     ERROR_GENERAL = 1
     ERROR_VALIDATION = 2
+    ERROR_MEMORY = 3
 
 
 class WorkflowEngineError(RuntimeError):
@@ -107,7 +162,14 @@ class WorkflowEngine:
         outputs = dict(function=f, paramdict=f.param.params(), params_independent=independent)
         return namedtuple("TaskFuncionInstrospection", outputs.keys())(**outputs)
 
-    def _resolve_inputs(self, task_inputs: dict, paramdict: dict) -> dict:
+    def _registry_value(self, key: str) -> Any:
+        r"""Value stored in the registry, waiting for it if it is still being written in the background."""
+        value = self._registry[key]
+        if isinstance(value, Future):
+            value = self._registry[key] = value.result()
+        return value
+
+    def _resolve_inputs(self, task_inputs: dict, paramdict: dict, visible: Optional[Set[str]] = None) -> dict:
         r"""Populate the required parameters missing from the task's `inputs` entry with the contents of the registry.
 
         Parameters
@@ -116,12 +178,15 @@ class WorkflowEngine:
             the "inputs" entry in the JSON configuration file for the task being evaluated.
         paramdict
             dictionary of `name: instance` parameters for the task being evaluated
+        visible
+            if given, only these registry keys are considered to be in the registry
 
         Returns
         -------
         dict
             all necessary inputs for the function to be evaluated
         """
+        registry = self._registry.keys() if visible is None else visible
         inputs = dict()
         for pname, param in paramdict.items():
             if pname == "name":  # not an actual input parameter, just an attribute of the function
@@ -130,18 +195,59 @@ class WorkflowEngine:
                 val = task_inputs[pname]
                 if isinstance(val, str):  # Examples: `"array": "ct"`, `"exec_mode": "f"`
                     if isinstance(param, (libparam.Foldername, libparam.String)):
-                        if val in self._registry:  # val is a reference to a value stored in the registry
-                            inputs[pname] = self._registry[val]  # Example: "savedir": "outputdir"
+                        if val in registry:  # val is a reference to a value stored in the registry
+                            inputs[pname] = self._registry_value(val)  # Example: "savedir": "outputdir"
                         else:  # val is an explicit value
                             inputs[pname] = val  # Example: "ct_dir": "/home/path/to/ctdir/"
                     else:  # must be a reference to a value stored in the registry
-                        inputs[pname] = self._registry[val]  # Example: "array": "ct"
+                        inputs[pname] = self._registry_value(val)  # Example: "array": "ct"
                 else:
                     inputs[pname] = val  # Example: "rot_center": 0.0
-            elif pname in self._registry:  # implicit
-                inputs[pname] = self._registry[pname]
+            elif pname in registry:  # implicit
+                inputs[pname] = self._registry_value(pname)
         return inputs
 
+    @staticmethod
+    def _input_source(pname: str, task_inputs: dict, registry: Set[str]) -> Optional[str]:
+        r"""Registry key a task parameter is read from, following the same rules as ``_resolve_inputs``.
+
+        Returns
+        -------
+        str
+            the registry key, or None if the parameter is set explicitly or not set at all.
+        """
+        if pname in task_inputs:
+            val = task_inputs[pname]
+            return val if isinstance(val, str) and val in registry else None
+        return pname if pname in registry else None
+
+    @staticmethod
+    def _task_reads(task_inputs: dict, paramdict: dict, registry: Set[str]) -> Set[str]:
+        r"""Registry keys read by a task, following the same rules as ``_resolve_inputs``.
+
+        Parameters
+        ----------
+        task_inputs
+            the "inputs" entry in the JSON configuration file for the task being evaluated.
+        paramdict
+            dictionary of `name: instance` parameters for the task being evaluated
+        registry
+            the registry keys set or computed before the task
+
+        Returns
+        -------
+        set
+            the registry keys the task reads
+        """
+        reads = set()
+        for pname in paramdict:
+            if pname == "name":
+                continue
+            source = WorkflowEngine._input_source(pname, task_inputs, registry)
+            if source is not None:
+                reads.add(source)
+        return reads
+
 
 class WorkflowEngineAuto(WorkflowEngine):
     """Used for running fully specified workflow."""
@@ -149,16 +255,66 @@ class WorkflowEngineAuto(WorkflowEngine):
     config = validate.JSONValid()
     load_data_function = "imars3d.backend.dataio.data.load_data"
     save_data_function = "imars3d.backend.dataio.data.save_data"
+    crop_function = "imars3d.backend.morph.crop.crop"
+    normalization_function = "imars3d.backend.preparation.normalization.normalization"
+    beam_hardening_function = "imars3d.backend.corrections.beam_hardening.beam_hardening_correction"
+    minus_log_function = "imars3d.backend.preparation.normalization.minus_log"
+    fused_normalization_function = "imars3d.backend.preparation.normalization.fused_normalization"
 
-    def __init__(self, config: validate.JsonInputTypes) -> None:
+    schedulers = ("sequential", "dag")
+    config_entries = (
+        "name",
+        "tasks",
+        "keep",
+        "memoize",
+        "streaming",
+    )  # configuration entries that are not registry values
+    # tasks with side effects are always executed
+    uncached_functions = (save_data_function, "imars3d.backend.dataio.data.save_checkpoint")
+
+    def __init__(
+        self,
+        config: validate.JsonInputTypes,
+        scheduler: str = "sequential",
+        max_workers: int = 2,
+        profile: bool = False,
+        trace: bool = False,
+        snapshot: bool = False,
+        resume: bool = False,
+    ) -> None:
         r"""Initialize the workflow engine.
 
         Parameters
         ----------
         config
             JSON configuration for reconstruction-reduction
+        scheduler
+            "sequential" runs the tasks in the order of the configuration, "dag" runs the tasks
+            as soon as the tasks they depend on are done, possibly concurrently.
+        max_workers
+            maximum number of tasks running concurrently with the "dag" scheduler.
+        profile
+            record the time and memory used by every task, see ``profile_paths``.
+        trace
+            also write the profile as Chrome trace events, implies ``profile``.
+        snapshot
+            save the registry values after every task, so that a failed run can be resumed, see ``snapshot_dir``.
+        resume
+            skip the tasks completed by a previous run of the same configuration, implies ``snapshot``.
         """
+        if scheduler not in self.schedulers:
+            raise ValueError(f"Unknown scheduler {scheduler}, expected one of {', '.join(self.schedulers)}")
         self.config: dict = config  # validated JSON configuration file
+        self.scheduler = scheduler
+        self.max_workers = max(1, max_workers)
+        self.profile = profile or trace
+        self.trace = trace
+        self.profiler: Optional[TaskProfiler] = None
+        self.snapshot = snapshot or resume
+        self.resume = resume
+        self._snapshot: Optional[RegistrySnapshot] = None
+        self._task_cache: Optional[TaskResultCache] = None
+        self._digests: dict = dict()  # content digest of every registry value, when memoizing tasks
         super().__init__()
 
     def _verify_loadsave_bookend(self) -> None:
@@ -197,6 +353,8 @@ class WorkflowEngineAuto(WorkflowEngine):
                 continue  # not an actual input parameter, just an attribute of the function
             if pname == "tqdm_class":
                 continue  # parameter for connecting progress bars to the gui
+            if pname == "out":
+                continue  # optional array the filters write their result into
             if param.default is not None:  # the parameter has a default value
                 continue  # irrelevant if parameter value is missing
             if pname in task.get("inputs", {}):  # parameter explicitly set
@@ -223,7 +381,7 @@ class WorkflowEngineAuto(WorkflowEngine):
             one or more global inputs are not the output(s) of any previous task(s).
         """
         # registry stores parameters that have already been set or computed. Initialize with metadata
-        registry = set([x for x in self.config if x not in ("name", "tasks")])
+        registry = set([x for x in self.config if x not in self.config_entries])
 
         # Workflow must be bookended with a load and save task.
         self._verify_loadsave_bookend()
@@ -238,8 +396,635 @@ class WorkflowEngineAuto(WorkflowEngine):
                 self._validate_outputs(task["outputs"])
                 registry.update(set(task["outputs"]))
 
+    def _push_down_crop(self, tasks: list) -> list:
+        r"""Fold the constant-limit crop tasks that directly follow the load task into its ``roi`` input.
+
+        The fold only happens when every image stack returned by the load task (ct, ob and dc)
+        is cropped in place, i.e. under the same name, with the same explicit limits, before any
+        other task uses it. Loading only the region of interest then gives the same registry
+        as loading the full images and cropping them afterwards.
+
+        Parameters
+        ----------
+        tasks
+            the "tasks" entry of the JSON configuration.
+
+        Returns
+        -------
+        list
+            the tasks to execute, the input list is not modified.
+        """
+        if not tasks or tasks[0]["function"] != self.load_data_function:
+            return tasks
+        load_task = tasks[0]
+        if "roi" in load_task.get("inputs", {}) or load_task.get("inputs", {}).get("bin_factor", 1) != 1:
+            return tasks  # crop limits refer to binned images when binning on load
+        images = load_task.get("outputs", [])[:3]  # ct, ob, dc
+        crop_limit, cropped = None, []
+        for task in tasks[1:]:
+            inputs = task.get("inputs", {})
+            if task["function"] != self.crop_function or "arrays" not in inputs or "crop_limit" not in inputs:
+                break
+            array, limits = inputs["arrays"], inputs["crop_limit"]
+            if not isinstance(limits, list) or -1 in limits:
+                break  # automatic bounds detection needs the full image
+            if array not in images or array in cropped or task.get("outputs", []) != [array]:
+                break
+            if crop_limit is not None and limits != crop_limit:
+                break
+            crop_limit = limits
+            cropped.append(array)
+        if not images or sorted(cropped) != sorted(images):
+            return tasks
+        load_task = deepcopy(load_task)
+        load_task.setdefault("inputs", {})["roi"] = list(crop_limit)
+        logger.info(f"Cropping {', '.join(cropped)} to {crop_limit} while loading in task {load_task['name']}")
+        return [load_task] + tasks[1 + len(cropped) :]
+
+    def _fuse_pointwise(self, tasks: list) -> list:
+        r"""Replace consecutive normalization, beam hardening and minus_log tasks by a single fused task.
+
+        A normalization task followed by a beam hardening task, a minus_log task or both, each
+        transforming the output of the previous one in place, i.e. under the same name, is run as
+        one ``fused_normalization`` task. The stack is then swept once, and a single output array
+        is allocated, instead of one sweep and one array per task. The parameters of the beam
+        hardening task must be set explicitly or left to their defaults, and the normalization must
+        not choose the array or data type of its result.
+
+        Parameters
+        ----------
+        tasks
+            the tasks to execute.
+
+        Returns
+        -------
+        list
+            the tasks to execute, the input list is not modified.
+        """
+        fused, idx = [], 0
+        while idx < len(tasks):
+            task = tasks[idx]
+            if (
+                task["function"] != self.normalization_function
+                or len(task.get("outputs", [])) != 1
+                or {"inplace", "out", "dtype"} & set(task.get("inputs", {}))
+            ):
+                fused.append(task)
+                idx += 1
+                continue
+            name = task["outputs"][0]
+            inputs = dict(task.get("inputs", {}))
+            chain = [task]
+            for function, options in (
+                (self.beam_hardening_function, ("q", "n", "opt")),
+                (self.minus_log_function, ()),
+            ):
+                if idx + len(chain) >= len(tasks):
+                    break
+                candidate = tasks[idx + len(chain)]
+                candidate_inputs = candidate.get("inputs", {})
+                if (
+                    candidate["function"] != function
+                    or candidate_inputs.get("arrays") != name
+                    or candidate.get("outputs", []) != [name]
+                    or set(candidate_inputs) - {"arrays", "max_workers", *options}
+                    or any(isinstance(candidate_inputs.get(option), str) for option in options)
+                ):
+                    continue
+                if function == self.beam_hardening_function:
+                    inputs["beam_hardening"] = True
+                    inputs.update(
+                        {option: candidate_inputs[option] for option in options if option in candidate_inputs}
+                    )
+                chain.append(candidate)
+            if len(chain) == 1:
+                fused.append(task)
+                idx += 1
+                continue
+            inputs["minus_log"] = chain[-1]["function"] == self.minus_log_function
+            names = " + ".join(link["name"] for link in chain)
+            logger.info(f"Fusing tasks {names} into a single pass")
+            fused.append(
+                {"name": names, "function": self.fused_normalization_function, "inputs": inputs, "outputs": [name]}
+            )
+            idx += len(chain)
+        return fused
+
+    def _task_dependencies(self, tasks: list) -> Tuple[List[Set[str]], List[Set[int]]]:
+        r"""Compute the registry keys read by every task and the tasks every task depends on.
+
+        A task depends on the last preceding task writing any of the keys it reads or writes,
+        and on the preceding tasks reading any of the keys it overwrites. Running the tasks in
+        any order compatible with these dependencies gives the same registry as running them
+        in the order of the configuration.
+
+        Parameters
+        ----------
+        tasks
+            the tasks to execute.
+
+        Returns
+        -------
+        tuple
+            (reads, dependencies), the registry keys read by every task, and the indices of the
+            tasks every task depends on.
+        """
+        registry = set(self._registry)
+        last_writer = dict()
+        readers = defaultdict(set)  # readers of the current value of every key
+        reads, dependencies = [], []
+        for idx, task in enumerate(tasks):
+            peek = self._instrospect_task_function(task["function"])
+            task_reads = self._task_reads(task.get("inputs", {}), peek.paramdict, registry)
+            task_writes = set(task.get("outputs", []))
+            depends = {last_writer[key] for key in task_reads | task_writes if key in last_writer}
+            for key in task_writes:
+                depends |= readers[key]
+            depends.discard(idx)
+            for key in task_reads:
+                readers[key].add(idx)
+            for key in task_writes:
+                last_writer[key] = idx
+                readers[key] = set()
+            registry |= task_writes
+            reads.append(task_reads)
+            dependencies.append(depends)
+        return reads, dependencies
+
+    def _task_key(self, task: dict, paramdict: dict, inputs: dict, visible: Optional[Set[str]] = None) -> str:
+        r"""Content address of the outputs of a task.
+
+        The key is a digest of the task function and its version, of the explicit inputs, of the
+        digests of the registry values read by the task, and of the size and modification time of
+        the files and directories passed as paths. The digest of a task output is derived from the
+        key of the task, so arrays are never hashed.
+
+        Parameters
+        ----------
+        task
+            the task being evaluated.
+        paramdict
+            dictionary of `name: instance` parameters for the task being evaluated
+        inputs
+            the resolved inputs of the task, see ``_resolve_inputs``.
+        visible
+            if given, only these registry keys are considered to be in the registry
+
+        Returns
+        -------
+        str
+            hex digest identifying the outputs of the task
+        """
+        registry = self._registry.keys() if visible is None else visible
+        task_inputs = task.get("inputs", {})
+        entries = []
+        for pname in sorted(inputs):
+            source = self._input_source(pname, task_inputs, registry)
+            param, value = paramdict[pname], inputs[pname]
+            paths = isinstance(param, libparam.Path) or (
+                isinstance(param, libparam.List) and all(isinstance(item, str) for item in value or [])
+            )
+            if paths:  # the files may have changed since the value was set
+                entries.append([pname, _path_signature(value)])
+            elif source is not None:
+                entries.append([pname, self._digests[source]])
+            else:
+                entries.append([pname, value])
+        return _digest(task["function"], _function_version(task["function"]), entries)
+
+    def _memoized(self, task: dict) -> bool:
+        r"""Whether the outputs of a task are looked up in, and stored to, the task cache."""
+        return (
+            self._task_cache is not None
+            and bool(task.get("outputs", []))
+            and task["function"] not in self.uncached_functions
+        )
+
+    def _run_task(self, task: dict, visible: Optional[Set[str]] = None) -> Tuple[Optional[str], Any]:
+        r"""Resolve the inputs of a task and execute it, or replay its outputs from the task cache.
+
+        Returns
+        -------
+        tuple
+            (key, outputs), the content address of the task (None unless memoizing task results)
+            and the outputs of its function.
+        """
+        peek = self._instrospect_task_function(task["function"])
+        inputs = self._resolve_inputs(task.get("inputs", {}), peek.paramdict, visible)
+        profile = nullcontext(dict()) if self.profiler is None else self.profiler.profile(task, inputs)
+        with profile as record:
+            key, outputs, record["cached"] = self._execute_task(task, peek, inputs, visible)
+            if self.profiler is not None and task.get("outputs", []):
+                validated = self._validate_outputs(task["outputs"], outputs) or []
+                record["outputs"] = {name: describe(value) for name, value in zip(task["outputs"], validated)}
+        return key, outputs
+
+    def _execute_task(self, task: dict, peek: namedtuple, inputs: dict, visible: Optional[Set[str]]) -> tuple:
+        r"""Execute a task, or replay its outputs from the task cache.
+
+        Returns
+        -------
+        tuple
+            (key, outputs, cached), the content address of the task, the outputs of its function,
+            and whether they were replayed from the task cache.
+        """
+        if self._task_cache is None:
+            return None, peek.function(**inputs), False
+        key = self._task_key(task, peek.paramdict, inputs, visible)
+        if self._memoized(task):
+            outputs = self._task_cache.get(key)
+            if outputs is not None:
+                logger.info(f"Replaying task {task['name']} from the cache")
+                return key, outputs, True
+        outputs = peek.function(**inputs)
+        if self._memoized(task):
+            validated = self._validate_outputs(task["outputs"], outputs)
+            if validated is not None:
+                self._task_cache.put(key, list(validated), {"task": task["name"], "function": task["function"]})
+        return key, outputs, False
+
+    def _store_outputs(self, task: dict, outputs: Any, key: Optional[str] = None) -> None:
+        r"""Register the outputs of a task, and their digests if the content address of the task is given."""
+        if task.get("outputs", []):
+            outputs = self._validate_outputs(task["outputs"], outputs)
+            self._registry.update(dict(zip(task["outputs"], outputs)))
+            if key is not None:
+                self._digests.update({name: _digest(key, idx) for idx, name in enumerate(task["outputs"])})
+
+    def _dead_values(self, tasks: list, reads: List[Set[str]]) -> List[Tuple[str, Set[int]]]:
+        r"""Liveness analysis of the task outputs stored in the registry.
+
+        Every value written by a task is dead once all the tasks reading it are done, unless its
+        key is listed in the "keep" entry of the configuration. Values that are never read, such
+        as the directory returned by the save task, are results and stay in the registry.
+
+        Parameters
+        ----------
+        tasks
+            the tasks to execute.
+        reads
+            the registry keys read by every task, see ``_task_dependencies``.
+
+        Returns
+        -------
+        list
+            (key, readers) pairs, the value of the key can be dropped once all the readers are done.
+        """
+        keep = set(self.config.get("keep", []))
+        values = []  # (key, readers) of every value written by a task
+        current = dict()  # index in values of the current value of every key
+        for idx, task in enumerate(tasks):
+            for key in reads[idx]:
+                if key in current:
+                    values[current[key]][1].add(idx)
+            for key in task.get("outputs", []):
+                current[key] = len(values)
+                values.append((key, set()))
+        # a reader that also writes the key replaces the value anyway
+        return [
+            (key, readers)
+            for key, readers in values
+            if readers and key not in keep and not any(key in tasks[idx].get("outputs", []) for idx in readers)
+        ]
+
+    def _release_dead_values(self, idx: int, dead_values: List[Tuple[str, Set[int]]]) -> None:
+        r"""Drop the registry values whose last reader is the task that just completed."""
+        for key, readers in dead_values:
+            if idx in readers:
+                readers.discard(idx)
+                if not readers:
+                    logger.debug(f"Releasing {key} from the registry")
+                    self._registry.pop(key, None)
+
+    def _run_dag(
+        self,
+        tasks: list,
+        reads: List[Set[str]],
+        dependencies: List[Set[int]],
+        dead_values: list,
+        indices: Optional[List[int]] = None,
+    ) -> None:
+        r"""Execute the tasks as soon as their dependencies are done, running up to ``max_workers`` at once.
+
+        The inputs of a task are resolved when it is submitted, from the registry keys it reads
+        only, and its outputs are registered by the calling thread once it is done. If ``indices``
+        is given, only these tasks are executed, the other tasks are considered done.
+        """
+        pending = list(range(len(tasks))) if indices is None else list(indices)
+        done, running = set(range(len(tasks))) - set(pending), dict()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="imars3d-task") as pool:
+            while pending or running:
+                for idx in [idx for idx in pending if dependencies[idx] <= done]:
+                    if len(running) >= self.max_workers:
+                        break
+                    pending.remove(idx)
+                    logger.debug(f"Starting task {tasks[idx]['name']}")
+                    running[pool.submit(self._run_task, tasks[idx], reads[idx])] = idx
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    idx = running.pop(future)
+                    key, outputs = future.result()
+                    self._store_outputs(tasks[idx], outputs, key)
+                    self._complete_tasks(tasks, [idx], dead_values)
+                    done.add(idx)
+                    logger.debug(f"Finished task {tasks[idx]['name']}")
+
+    def _run_tasks(
+        self,
+        tasks: list,
+        reads: List[Set[str]],
+        dependencies: List[Set[int]],
+        dead_values: list,
+        indices: Iterable[int],
+    ) -> None:
+        r"""Execute some of the tasks, in order, with the scheduler of the engine."""
+        if self.scheduler == "dag":
+            self._run_dag(tasks, reads, dependencies, dead_values, list(indices))
+        else:
+            for idx in indices:
+                key, outputs = self._run_task(tasks[idx])
+                self._store_outputs(tasks[idx], outputs, key)
+                self._complete_tasks(tasks, [idx], dead_values)
+
+    def _complete_tasks(self, tasks: list, indices: List[int], dead_values: list) -> None:
+        r"""Release the values no longer needed once tasks are done, and save the values they wrote to the snapshot.
+
+        Values still being written in the background are waited for before they are saved.
+        """
+        for idx in indices:
+            self._release_dead_values(idx, dead_values)
+        if self._snapshot is None:
+            return
+        written = {key for idx in indices for key in tasks[idx].get("outputs", []) if key in self._registry}
+        self._snapshot.record(
+            self.config,
+            [(idx, tasks[idx]["name"]) for idx in indices],
+            {key: self._registry_value(key) for key in written},
+            set(self._registry),
+            self._digests if self._task_cache is not None else None,
+        )
+
+    def _restore_snapshot(self, tasks: list, dead_values: list) -> Set[int]:
+        r"""Restore the registry from the snapshot of a previous run, see ``snapshot_dir``.
+
+        Returns
+        -------
+        set
+            the indices of the tasks completed by the previous run, they are not executed again.
+        """
+        self._snapshot = RegistrySnapshot(self.snapshot_dir, _digest(self.config))
+        restored = self._snapshot.load() if self.resume else None
+        if restored is None:
+            self._snapshot.clear()
+            return set()
+        completed = {idx for idx, name in self._snapshot.completed if idx < len(tasks) and tasks[idx]["name"] == name}
+        self._registry.update(restored)
+        self._digests.update(self._snapshot.digests)
+        for idx in sorted(completed):
+            self._release_dead_values(idx, dead_values)
+        pending = [task["name"] for idx, task in enumerate(tasks) if idx not in completed]
+        logger.info(f"Resuming from the snapshot in {self.snapshot_dir}, remaining tasks: {', '.join(pending)}")
+        return completed
+
+    def _separable_tail(self, tasks: list) -> List[int]:
+        r"""Indices of the longest run of row-separable tasks directly preceding the save tasks ending the workflow.
+
+        See ``SEPARABLE_FUNCTIONS``. A task needing the whole stack, e.g. ``find_rotation_center``,
+        ends the run, so it should come before the filters to stream.
+        """
+        end = len(tasks)
+        while end > 0 and tasks[end - 1]["function"] in (self.save_data_function,) + self.uncached_functions:
+            end -= 1
+        registry = set(x for x in self.config if x not in self.config_entries)
+        for task in tasks:
+            registry |= set(task.get("outputs", []))
+        start = end
+        while start > 0:
+            task = tasks[start - 1]
+            separable = SEPARABLE_FUNCTIONS.get(task["function"])
+            if separable is None or task["function"] == self.load_data_function:
+                break
+            paramdict = self._instrospect_task_function(task["function"]).paramdict
+            if separable.halo(static_params(task, paramdict, registry.__contains__)) is None:
+                break
+            start -= 1
+        return list(range(start, end))
+
+    def _streaming_tasks(self, tasks: list, reads: List[Set[str]]) -> List[int]:
+        r"""Indices of the tasks to run slab by slab in the streaming mode, see ``_separable_tail``.
+
+        Parameters
+        ----------
+        tasks
+            the tasks to execute.
+        reads
+            the registry keys read by every task, see ``_task_dependencies``.
+
+        Returns
+        -------
+        list
+            the indices of the streamed tasks, empty if the configuration has no "streaming" entry.
+        """
+        if "streaming" not in self.config:
+            return []
+        streamed = self._separable_tail(tasks)
+        if not streamed:
+            logger.warning("Streaming requested, but the tasks before the save tasks are not row-separable")
+        else:
+            names = ", ".join(tasks[idx]["name"] for idx in streamed)
+            logger.info(f"Streaming tasks {names} by slabs of {self.config['streaming']['slab_rows']} rows")
+        return streamed
+
+    def _run_streaming(self, tasks: list, streamed: List[int], reads: List[Set[str]], dead_values: list) -> None:
+        r"""Execute row-separable tasks one slab of detector rows at a time.
+
+        The rows of every slab are extended by the halo rows needed by the filters with a kernel
+        (the sum of the halos of the task and of the streamed tasks after it), and the halo rows
+        are dropped from the outputs of every task. The arrays read from the registry are copied
+        slab by slab, so they can be memory maps (see ``load_data(memmap_dir=...)``), and the final
+        values of the keys read after the streamed tasks, listed in "keep" or never read are
+        assembled into ``.npy`` memory maps in ``<workingdir>/streaming``. Peak memory is then
+        bounded by the size of a slab rather than the size of the stack. The streamed tasks are
+        not memoized.
+
+        Parameters
+        ----------
+        tasks
+            the tasks to execute.
+        streamed
+            the indices of the tasks to stream, see ``_streaming_tasks``.
+        reads
+            the registry keys read by every task, see ``_task_dependencies``.
+        dead_values
+            the registry values to drop after their last use, see ``_dead_values``.
+        """
+        slab_rows = self.config["streaming"]["slab_rows"]
+        registry = set(self._registry)
+        plans = []  # (task, paramdict, separable, halo) of every streamed task
+        for idx in streamed:
+            task = tasks[idx]
+            peek = self._instrospect_task_function(task["function"])
+            separable = SEPARABLE_FUNCTIONS[task["function"]]
+            halo = separable.halo(static_params(task, peek.paramdict, registry.__contains__))
+            plans.append((task, peek, separable, halo))
+            registry |= set(task.get("outputs", []))
+        # halo rows needed before every task, and after the last one
+        halos = [sum(plan[3] for plan in plans[i:]) for i in range(len(plans) + 1)]
+        # registry values sliced by the streamed tasks, and the number of detector rows
+        sources = dict()
+        written = set()
+        for idx, (task, peek, separable, _) in zip(streamed, plans):
+            for pname in separable.sliced_inputs:
+                source = self._input_source(pname, task.get("inputs", {}), self._registry.keys() | written)
+                if source is not None and source not in written:
+                    value = self._registry_value(source)
+                    if isinstance(value, np.ndarray):
+                        sources[source] = (value, row_axis(value))
+            written |= set(task.get("outputs", []))
+        num_rows = {value.shape[axis] for value, axis in sources.values()}
+        if len(num_rows) != 1:
+            raise WorkflowEngineError(f"The streamed arrays {', '.join(sources)} have different numbers of rows")
+        num_rows = num_rows.pop()
+        # keys whose final value is needed after the streamed tasks
+        keep = set(self.config.get("keep", []))
+        later_reads = set().union(*reads[streamed[-1] + 1 :])
+        final_writer = {key: idx for idx in streamed for key in tasks[idx].get("outputs", [])}
+        assembled = {
+            key
+            for key, writer in final_writer.items()
+            if key in keep or key in later_reads or not any(key in reads[idx] for idx in streamed if idx > writer)
+        }
+        outputs_dir = Path(self.config["workingdir"]) / "streaming"
+        results = dict()
+        for start in range(0, num_rows, slab_rows):
+            stop = min(start + slab_rows, num_rows)
+            logger.debug(f"Streaming rows {start}:{stop}")
+            # slab values: key -> (value, axis of the rows, first row), axis is None for other values
+            values = {key: (value, axis, 0) for key, (value, axis) in sources.items()}
+            for i, (task, peek, separable, _) in enumerate(plans):
+                lo, hi = slab_range(start, stop, halos[i], num_rows)
+                inputs = self._resolve_slab_inputs(task, peek.paramdict, values, separable, lo, hi)
+                slab_task = dict(task, name=f"{task['name']}[{lo}:{hi}]")
+                profile = nullcontext(dict()) if self.profiler is None else self.profiler.profile(slab_task, inputs)
+                with profile:
+                    outputs = peek.function(**inputs)
+                if not task.get("outputs", []):
+                    continue
+                outputs = self._validate_outputs(task["outputs"], outputs)
+                out_lo, out_hi = slab_range(start, stop, halos[i + 1], num_rows)
+                for key, output in zip(task["outputs"], outputs):
+                    if isinstance(output, np.ndarray):
+                        output = take_rows(output, separable.output_axis, out_lo - lo, out_hi - lo)
+                        values[key] = (output, separable.output_axis, out_lo)
+                    else:
+                        values[key] = (output, None, 0)
+            for key in assembled:
+                value, axis, first = values[key]
+                if axis is None:
+                    results[key] = value
+                    continue
+                rows = take_rows(value, axis, start - first, stop - first)
+                if key not in results:
+                    shape = list(rows.shape)
+                    shape[axis] = num_rows
+                    outputs_dir.mkdir(parents=True, exist_ok=True)
+                    results[key] = np.lib.format.open_memmap(
+                        str(outputs_dir / f"{key}.npy"), mode="w+", dtype=rows.dtype, shape=tuple(shape)
+                    )
+                take_rows(results[key], axis, start, stop)[...] = rows
+        for key, value in results.items():
+            if isinstance(value, np.memmap):
+                value.flush()
+            self._registry[key] = value
+        for key in set(final_writer) - assembled:
+            self._registry.pop(key, None)
+        if self._task_cache is not None:
+            # the assembled values are addressed by the streamed tasks and the values they sliced
+            streamed_tasks = [[task["function"], task.get("inputs", {})] for task, *_ in plans]
+            inputs_digest = _digest(streamed_tasks, sorted(self._digests.get(key, key) for key in sources))
+            self._digests.update({key: _digest(inputs_digest, key) for key in results})
+        self._complete_tasks(tasks, streamed, dead_values)
+
+    def _resolve_slab_inputs(
+        self, task: dict, paramdict: dict, values: dict, separable: tuple, lo: int, hi: int
+    ) -> dict:
+        r"""Resolve the inputs of a streamed task, slicing the rows ``[lo, hi)`` of the row-separable inputs.
+
+        The values sliced from the registry are copied, so that a task modifying its input in
+        place does not alter the rows that the next slabs read as halo.
+        """
+        registry = self._registry.keys() | values.keys()
+        inputs = dict()
+        for pname, param in paramdict.items():
+            if pname == "name":
+                continue
+            source = self._input_source(pname, task.get("inputs", {}), registry)
+            if source is None:
+                if pname in task.get("inputs", {}):
+                    inputs[pname] = task["inputs"][pname]
+                continue
+            if source not in values:
+                inputs[pname] = self._registry_value(source)
+                continue
+            value, axis, first = values[source]
+            if pname in separable.sliced_inputs and axis is not None:
+                rows = take_rows(value, axis, lo - first, hi - first)
+                # the registry itself is not updated until all the slabs are done
+                value = np.array(rows) if value is self._registry.get(source) else rows
+            inputs[pname] = value
+        return inputs
+
+    def estimate(self, memory_bytes: Optional[int] = None, seconds_per_pixel: Optional[dict] = None) -> dict:
+        r"""Estimate the memory and time needed to run the workflow, without running it.
+
+        The shapes and data types of the stacks are read from one image header per stack and
+        propagated through the tasks, see ``imars3d.backend.workflow.estimate``.
+
+        Parameters
+        ----------
+        memory_bytes
+            memory available to the run, the memory available on this node by default.
+        seconds_per_pixel
+            throughputs of the task functions, see ``imars3d.backend.workflow.estimate.calibrate``.
+
+        Returns
+        -------
+        dict
+            the size of the outputs of every task, the peak memory with and without freeing the
+            values after their last use, the runtime, whether the workflow fits in memory and
+            a suggestion to make it fit otherwise.
+        """
+        return estimate_workflow(self, memory_bytes=memory_bytes, seconds_per_pixel=seconds_per_pixel)
+
     def run(self) -> None:
-        r"""Sequential execution of the tasks specified in the JSON configuration file."""
+        r"""Execution of the tasks specified in the JSON configuration file.
+
+        The tasks run in the order of the configuration, or as soon as the tasks they depend on
+        are done with the "dag" scheduler, see ``_task_dependencies``. Task outputs are dropped
+        from the registry after their last use, except for the keys listed in the "keep" entry
+        of the configuration, see ``_dead_values``.
+
+        If the configuration has a "memoize" entry, the outputs of the tasks are stored in
+        ``<workingdir>/task_cache`` and replayed when a task runs again with the same inputs,
+        see ``_task_key``. The entry sets the size of the cache in GiB with "max_gb" (20 by default).
+
+        With ``profile=True``, the wall time, CPU time, peak RSS delta and the description of
+        the inputs and outputs of every task are written to a JSON report, see ``profile_paths``.
+        CPU time and memory include the workers of the process pool, see ``TaskProfiler``.
+
+        With a "streaming" entry in the configuration, the row-separable tasks before the final
+        save tasks run on slabs of "slab_rows" detector rows at a time, see ``_run_streaming``.
+
+        Tasks writing in the background (e.g. ``save_checkpoint`` with ``background=True``)
+        overlap with the tasks that follow them, and are waited for at the end of the run.
+
+        With ``snapshot=True``, the values written by every task are saved to ``snapshot_dir``
+        as soon as it completes, and a run with ``resume=True`` restores them and only executes
+        the tasks not completed by the previous run. The snapshot is removed once the run succeeds.
+
+        The worker processes shared by the parallel filters (see ``imars3d.backend.util.pool``)
+        are stopped at the end of the run.
+        """
         # set the logger file if it is specified in the configuration
         log_file_name = self.config.get("log_file_name", "")
         if log_file_name:
@@ -256,11 +1041,66 @@ class WorkflowEngineAuto(WorkflowEngine):
         # verify the inputs are sensible
         self._dryrun()
         # initialize the registry of global parameters with the metadata
-        self._registry = {k: v for k, v in self.config.items() if k not in ("name", "tasks")}
-        for task in self.config["tasks"]:
-            peek = self._instrospect_task_function(task["function"])
-            inputs = self._resolve_inputs(task.get("inputs", {}), peek.paramdict)
-            outputs = peek.function(**inputs)
-            if task.get("outputs", []):
-                outputs = self._validate_outputs(task["outputs"], outputs)
-                self._registry.update(dict(zip(task["outputs"], outputs)))
+        self._registry = {k: v for k, v in self.config.items() if k not in self.config_entries}
+        if "memoize" in self.config:
+            max_bytes = int(self.config["memoize"].get("max_gb", 20) * 1024**3)
+            self._task_cache = TaskResultCache(Path(self.config["workingdir"]) / "task_cache", max_bytes)
+            self._digests = {key: _digest(value) for key, value in self._registry.items()}
+        tasks = self._fuse_pointwise(self._push_down_crop(self.config["tasks"]))
+        reads, dependencies = self._task_dependencies(tasks)
+        # release the arrays as soon as they are no longer needed
+        dead_values = self._dead_values(tasks, reads)
+        streamed = self._streaming_tasks(tasks, reads)
+        completed = self._restore_snapshot(tasks, dead_values) if self.snapshot else set()
+        pending = [idx for idx in range(len(tasks)) if idx not in completed]
+        self.profiler = TaskProfiler() if self.profile else None
+        try:
+            if streamed and streamed[0] in pending:
+                self._run_tasks(tasks, reads, dependencies, dead_values, [i for i in pending if i < streamed[0]])
+                self._run_streaming(tasks, streamed, reads, dead_values)
+                self._run_tasks(tasks, reads, dependencies, dead_values, [i for i in pending if i > streamed[-1]])
+            else:
+                self._run_tasks(tasks, reads, dependencies, dead_values, pending)
+            # outputs written in the background are registered as handles, replace them by their results
+            wait_for_pending_writes()
+            for key in self._registry:
+                self._registry_value(key)
+            if self._snapshot is not None:
+                self._snapshot.clear()
+        finally:
+            # stop the worker processes of the parallel filters, the next run starts them again
+            shutdown_pool()
+            # the profile of a failed run shows where it failed
+            if self.profiler is not None:
+                report_path, trace_path = self.profile_paths()
+                self.profiler.write(
+                    report_path,
+                    trace_path if self.trace else None,
+                    name=self.config.get("name", ""),
+                    scheduler=self.scheduler,
+                    max_workers=self.max_workers,
+                )
+
+    @property
+    def snapshot_dir(self) -> Path:
+        r"""Directory of the snapshot of the registry, ``<workingdir>/snapshot``, see ``RegistrySnapshot``."""
+        return Path(self.config["workingdir"]) / "snapshot"
+
+    def profile_paths(self) -> Tuple[Path, Path]:
+        r"""Files the profile report and the Chrome trace events are written to.
+
+        They are written next to the log file, ``<log>.profile.json`` and ``<log>.trace.json``,
+        or to ``imars3d.profile.json`` and ``imars3d.trace.json`` in the working directory if
+        the configuration does not set ``log_file_name``.
+
+        Returns
+        -------
+        tuple
+            (report, trace) file paths.
+        """
+        log_file_name = self.config.get("log_file_name", "")
+        if log_file_name:
+            base = Path(log_file_name).with_suffix("")
+        else:
+            base = Path(self.config.get("workingdir", ".")) / "imars3d"
+        return base.with_name(base.name + ".profile.json"), base.with_name(base.name + ".trace.json")
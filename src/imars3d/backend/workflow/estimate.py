@@ -0,0 +1,601 @@
+#!/usr/bin/env python3
+"""Pre-run estimate of the memory and time a workflow needs.
+
+The shapes and data types of the image stacks are read from the header of one file per
+stack, and propagated through the tasks with a cost model per task function, giving the
+size of every task output. Replaying the liveness analysis of the engine on these sizes
+gives the peak resident memory, and calibrated throughputs (seconds per processed pixel)
+give a rough runtime. No image is decoded.
+"""
+# package imports
+from imars3d.backend.dataio.data import _get_filelist_by_dir
+from imars3d.backend.preparation.normalization import _BLOCK_BYTES as _NORMALIZATION_BLOCK_BYTES
+from imars3d.backend.workflow.streaming import SEPARABLE_FUNCTIONS, UNKNOWN, static_params
+
+# third-party imports
+import numpy as np
+import tifffile
+
+# standard imports
+from collections import namedtuple
+from fnmatch import fnmatchcase
+import logging
+import os
+from pathlib import Path
+from statistics import median
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ArraySpec = namedtuple("ArraySpec", ["shape", "dtype"])
+ArraySpec.__doc__ = (
+    r"""Shape and data type (as a numpy type string, e.g. ``"<u2"``) of an array that is not computed yet."""
+)
+
+CostModel = namedtuple("CostModel", ["outputs", "workspace", "pixels", "inplace"])
+CostModel.__doc__ = r"""Cost model of a task function.
+
+outputs
+    function of the inputs of the task returning the list of ``ArraySpec`` of its outputs (None for non-arrays).
+workspace
+    function of the inputs and outputs returning the bytes of the temporary arrays allocated by the task.
+pixels
+    function of the inputs and outputs returning the number of pixels processed by the task, its runtime
+    is proportional to it.
+inplace
+    name of the input parameter whose array is modified and returned as the first output, None if there is none,
+    or a function of the inputs returning it.
+"""
+
+
+def nbytes(spec: Any) -> int:
+    r"""Size in bytes of an ``ArraySpec``, 0 for anything else."""
+    if not isinstance(spec, ArraySpec):
+        return 0
+    return int(np.prod(spec.shape, dtype=np.int64)) * np.dtype(spec.dtype).itemsize
+
+
+# use _func to avoid sphinx pulling it into docs
+def _pixels(spec: Any) -> int:
+    return int(np.prod(spec.shape, dtype=np.int64)) if isinstance(spec, ArraySpec) else 0
+
+
+# use _func to avoid sphinx pulling it into docs
+def _like(pname: str = "arrays", dtype: Optional[str] = None) -> Callable:
+    r"""Outputs model of a function returning an array of the shape of one of its inputs."""
+
+    def outputs(inputs: dict) -> list:
+        spec = inputs.get(pname)
+        if not isinstance(spec, ArraySpec):
+            return [None]
+        return [ArraySpec(spec.shape, np.dtype(dtype or spec.dtype).str)]
+
+    return outputs
+
+
+# use _func to avoid sphinx pulling it into docs
+def _no_outputs(inputs: dict) -> list:
+    return [None]
+
+
+# use _func to avoid sphinx pulling it into docs
+def _no_workspace(inputs: dict, outputs: list) -> int:
+    return 0
+
+
+# use _func to avoid sphinx pulling it into docs
+def _input_copy(inputs: dict, outputs: list) -> int:
+    # the parallel filters copy the stack to shared memory, see imars3d.backend.util.shared
+    return nbytes(inputs.get("arrays"))
+
+
+# use _func to avoid sphinx pulling it into docs
+def _input_pixels(inputs: dict, outputs: list) -> int:
+    return _pixels(inputs.get("arrays"))
+
+
+# use _func to avoid sphinx pulling it into docs
+def _output_pixels(inputs: dict, outputs: list) -> int:
+    return sum(_pixels(spec) for spec in outputs)
+
+
+# use _func to avoid sphinx pulling it into docs
+def _crop_outputs(inputs: dict) -> list:
+    spec, limits = inputs.get("arrays"), inputs.get("crop_limit")
+    if not isinstance(spec, ArraySpec):
+        return [None]
+    if not isinstance(limits, (list, tuple)) or -1 in limits:
+        return [spec]  # bounds detected from the data, the full image is the upper bound
+    height, width = spec.shape[-2:]
+    left, right, _ = slice(limits[0], limits[1]).indices(width)
+    top, bottom, _ = slice(limits[2], limits[3]).indices(height)
+    return [ArraySpec(spec.shape[:-2] + (max(bottom - top, 0), max(right - left, 0)), spec.dtype)]
+
+
+# use _func to avoid sphinx pulling it into docs
+def _filter_outputs(inputs: dict) -> list:
+    # see the inplace and dtype options of the corrections filters, a new float32 array by default
+    dtype = inputs.get("dtype", "float32")
+    if inputs.get("inplace", False) or dtype == "same":
+        return _like()(inputs)
+    return _like(dtype=dtype)(inputs)
+
+
+# use _func to avoid sphinx pulling it into docs
+def _filter_inplace(inputs: dict) -> Optional[str]:
+    return "arrays" if inputs.get("inplace", False) else None
+
+
+# use _func to avoid sphinx pulling it into docs
+def _gamma_filter_sparse(inputs: dict) -> bool:
+    return inputs.get("selective_median_filter", True) and inputs.get("sparse", False)
+
+
+# use _func to avoid sphinx pulling it into docs
+def _gamma_filter_workspace(inputs: dict, outputs: list) -> int:
+    # the sparse filter only computes the medians of the saturated pixels
+    spec = inputs.get("arrays")
+    if not isinstance(spec, ArraySpec) or _gamma_filter_sparse(inputs):
+        return 0
+    # the median filtered stack when it is not the result, and the mask of the saturated pixels
+    filtered = ArraySpec(spec.shape, "<f4")
+    workspace = 0 if outputs[0] == filtered and not inputs.get("inplace", False) else nbytes(filtered)
+    return workspace + (_pixels(spec) if inputs.get("selective_median_filter", True) else 0)
+
+
+# use _func to avoid sphinx pulling it into docs
+def _normalization_workspace(inputs: dict, outputs: list) -> int:
+    # arrays - darks is computed in double precision, a block of images at a time
+    spec = inputs.get("arrays")
+    if not isinstance(spec, ArraySpec):
+        return 0
+    image = 8 * _pixels(ArraySpec(spec.shape[-2:], spec.dtype))
+    return min(8 * _pixels(spec), max(image, _NORMALIZATION_BLOCK_BYTES))
+
+
+# use _func to avoid sphinx pulling it into docs
+def _denoise_workspace(inputs: dict, outputs: list) -> int:
+    # the bilateral grid only holds a block of images at a time
+    return _input_copy(inputs, outputs) if inputs.get("method", "bilateral") == "bilateral" else 0
+
+
+# use _func to avoid sphinx pulling it into docs
+def _ring_removal_workspace(inputs: dict, outputs: list) -> int:
+    # the stack is corrected in place, the sums over the angle sub-divisions are small
+    spec = inputs.get("arrays")
+    if not isinstance(spec, ArraySpec) or len(spec.shape) != 3:
+        return 0
+    return 3 * inputs.get("sub_division", 10) * spec.shape[1] * spec.shape[2] * np.dtype(spec.dtype).itemsize
+
+
+# use _func to avoid sphinx pulling it into docs
+def _ifc_outputs(inputs: dict) -> list:
+    return _like("ct", dtype="<f8" if inputs.get("air_pixels", 5) < 0 else "<f4")(inputs)
+
+
+# use _func to avoid sphinx pulling it into docs
+def _ifc_workspace(inputs: dict, outputs: list) -> int:
+    return nbytes(inputs.get("ct")) if inputs.get("air_pixels", 5) < 0 else 0
+
+
+# use _func to avoid sphinx pulling it into docs
+def _ifc_pixels(inputs: dict, outputs: list) -> int:
+    return _pixels(inputs.get("ct"))
+
+
+# use _func to avoid sphinx pulling it into docs
+def _tilt_outputs(inputs: dict) -> list:
+    # the correction is skipped when the tilt is small, the rotated stack is the upper bound
+    return _like(dtype="<f4")(inputs)
+
+
+# use _func to avoid sphinx pulling it into docs
+def _tilt_workspace(inputs: dict, outputs: list) -> int:
+    # a shared copy to find the tilt, and another one to apply it
+    return 2 * _input_copy(inputs, outputs)
+
+
+# use _func to avoid sphinx pulling it into docs
+def _recon_outputs(inputs: dict) -> list:
+    spec = inputs.get("arrays")
+    if not isinstance(spec, ArraySpec) or len(spec.shape) != 3:
+        return [None]
+    _, rows, width = spec.shape
+    return [ArraySpec((rows, width, width), "<f4")]
+
+
+# use _func to avoid sphinx pulling it into docs
+def _recon_workspace(inputs: dict, outputs: list) -> int:
+    # float32 copy of the sinograms for minus_log
+    return 4 * _pixels(inputs.get("arrays")) if inputs.get("perform_minus_log", False) else 0
+
+
+# use _func to avoid sphinx pulling it into docs
+def _recon_pixels(inputs: dict, outputs: list) -> int:
+    # every voxel of a slice is back-projected from every angle
+    spec = inputs.get("arrays")
+    if not isinstance(spec, ArraySpec) or len(spec.shape) != 3:
+        return 0
+    return int(spec.shape[0]) * _output_pixels(inputs, outputs)
+
+
+# use _func to avoid sphinx pulling it into docs
+def _image_spec(filename: str) -> ArraySpec:
+    r"""Shape and data type of the first image of a tiff file, read from its header."""
+    with tifffile.TiffFile(filename) as tif:
+        page = tif.pages.first
+        return ArraySpec(tuple(page.shape), np.dtype(page.dtype).str)
+
+
+# use _func to avoid sphinx pulling it into docs
+def _load_file_lists(inputs: dict) -> tuple:
+    r"""ct, ob and dc files loaded by ``load_data``, following its call signatures."""
+    patterns = [inputs.get(f"{kind}_fnmatch", "*") for kind in ("ct", "ob", "dc")]
+    if "ct_dir" in inputs and "ob_files" in inputs:
+        ct_files = sorted(map(str, Path(inputs["ct_dir"]).glob(patterns[0])))
+        ob_files, dc_files = inputs["ob_files"], inputs.get("dc_files", [])
+    elif "ct_files" in inputs:
+        ct_files, ob_files, dc_files = inputs["ct_files"], inputs["ob_files"], inputs.get("dc_files", [])
+    else:
+        ct_files, ob_files, dc_files = _get_filelist_by_dir(
+            inputs["ct_dir"], inputs["ob_dir"], inputs.get("dc_dir", []), *patterns
+        )
+    return tuple(
+        [str(f) for f in files if fnmatchcase(str(f), pattern)]
+        for files, pattern in zip((ct_files, ob_files, dc_files or []), patterns)
+    )
+
+
+# use _func to avoid sphinx pulling it into docs
+def _load_data_outputs(inputs: dict) -> list:
+    ct_files, ob_files, dc_files = _load_file_lists(inputs)
+    ct_files = ct_files[:: inputs.get("angle_stride", 1)]
+    roi, bin_factor = inputs.get("roi"), inputs.get("bin_factor", 1)
+    # the flats are reduced to a single image, in single precision
+    reduced = inputs.get("reduction", "none") != "none" or inputs.get("master_dir") is not None
+    specs = []
+    for kind, files in (("ct", ct_files), ("ob", ob_files), ("dc", dc_files)):
+        if not files:
+            specs.append(None)
+            continue
+        spec = _image_spec(files[0])
+        height, width = spec.shape[-2:]
+        if roi is not None:
+            left, right, top, bottom = roi
+            width, height = right - left, bottom - top
+        height, width = height // bin_factor, width // bin_factor
+        if kind != "ct" and reduced:
+            specs.append(ArraySpec((height, width), "<f4"))
+        else:
+            specs.append(ArraySpec((len(files), height, width), spec.dtype))
+    return specs + [ArraySpec((len(ct_files),), "<f8")]
+
+
+# use _func to avoid sphinx pulling it into docs
+def _load_data_pixels(inputs: dict, outputs: list) -> int:
+    return sum(_pixels(spec) for spec in outputs[:3])
+
+
+#: cost models of the task functions, functions without a model return an array like their "arrays" input
+COST_MODELS: Dict[str, CostModel] = {
+    "imars3d.backend.dataio.data.load_data": CostModel(_load_data_outputs, _no_workspace, _load_data_pixels, None),
+    "imars3d.backend.dataio.data.save_data": CostModel(_no_outputs, _no_workspace, _input_pixels, None),
+    "imars3d.backend.dataio.data.save_checkpoint": CostModel(_no_outputs, _no_workspace, _input_pixels, None),
+    "imars3d.backend.morph.crop.crop": CostModel(_crop_outputs, _no_workspace, _output_pixels, None),
+    "imars3d.backend.corrections.gamma_filter.gamma_filter": CostModel(
+        _filter_outputs, _gamma_filter_workspace, _input_pixels, _filter_inplace
+    ),
+    "imars3d.backend.preparation.normalization.normalization": CostModel(
+        _filter_outputs, _normalization_workspace, _input_pixels, _filter_inplace
+    ),
+    "imars3d.backend.preparation.normalization.minus_log": CostModel(
+        _like(dtype="<f4"), _no_workspace, _input_pixels, None
+    ),
+    "imars3d.backend.preparation.normalization.fused_normalization": CostModel(
+        _like(dtype="<f4"), _no_workspace, _input_pixels, None
+    ),
+    "imars3d.backend.corrections.beam_hardening.beam_hardening_correction": CostModel(
+        _filter_outputs, _no_workspace, _input_pixels, _filter_inplace
+    ),
+    "imars3d.backend.corrections.denoise.denoise": CostModel(
+        _filter_outputs, _denoise_workspace, _input_pixels, _filter_inplace
+    ),
+    "imars3d.backend.corrections.ring_removal.remove_ring_artifact": CostModel(
+        _like(), _ring_removal_workspace, _input_pixels, "arrays"
+    ),
+    "imars3d.backend.corrections.intensity_fluctuation_correction.intensity_fluctuation_correction": CostModel(
+        _ifc_outputs, _ifc_workspace, _ifc_pixels, None
+    ),
+    "imars3d.backend.diagnostics.tilt.tilt_correction": CostModel(_tilt_outputs, _tilt_workspace, _input_pixels, None),
+    "imars3d.backend.diagnostics.tilt.apply_tilt_correction": CostModel(
+        _filter_outputs, _input_copy, _input_pixels, _filter_inplace
+    ),
+    "imars3d.backend.diagnostics.rotation.find_rotation_center": CostModel(
+        _no_outputs, _input_copy, _input_pixels, None
+    ),
+    "imars3d.backend.reconstruction.recon": CostModel(_recon_outputs, _recon_workspace, _recon_pixels, None),
+}
+DEFAULT_COST_MODEL = CostModel(_like(), _no_workspace, _input_pixels, None)
+
+#: wall time per processed pixel (see ``CostModel.pixels``) of the task functions on a typical analysis node,
+#: see ``calibrate`` to derive them from the profiles of actual runs
+SECONDS_PER_PIXEL: Dict[str, float] = {
+    "imars3d.backend.dataio.data.load_data": 5e-9,
+    "imars3d.backend.dataio.data.save_data": 2e-9,
+    "imars3d.backend.dataio.data.save_checkpoint": 2e-9,
+    "imars3d.backend.morph.crop.crop": 1e-9,
+    "imars3d.backend.corrections.gamma_filter.gamma_filter": 3e-8,
+    "imars3d.backend.preparation.normalization.normalization": 4e-9,
+    "imars3d.backend.preparation.normalization.minus_log": 3e-9,
+    "imars3d.backend.preparation.normalization.fused_normalization": 3e-9,
+    "imars3d.backend.corrections.beam_hardening.beam_hardening_correction": 2e-8,
+    "imars3d.backend.corrections.denoise.denoise": 2e-7,
+    "imars3d.backend.corrections.ring_removal.remove_ring_artifact": 2e-8,
+    "imars3d.backend.corrections.intensity_fluctuation_correction.intensity_fluctuation_correction": 2e-8,
+    "imars3d.backend.diagnostics.tilt.tilt_correction": 5e-8,
+    "imars3d.backend.diagnostics.tilt.apply_tilt_correction": 3e-8,
+    "imars3d.backend.diagnostics.rotation.find_rotation_center": 2e-8,
+    "imars3d.backend.reconstruction.recon": 2e-10,
+}
+DEFAULT_SECONDS_PER_PIXEL = 2e-8
+
+
+def calibrate(reports: Iterable[dict]) -> Dict[str, float]:
+    r"""Seconds per processed pixel of the task functions, measured from profile reports.
+
+    Parameters
+    ----------
+    reports
+        reports written by ``WorkflowEngineAuto(profile=True)``, see ``TaskProfiler.report``.
+
+    Returns
+    -------
+    dict
+        the median seconds per pixel of every function profiled, tasks replayed from the cache are ignored.
+    """
+
+    def spec(description: dict) -> Any:
+        if "shape" in description:
+            return ArraySpec(tuple(description["shape"]), description["dtype"])
+        return description.get("value", UNKNOWN)
+
+    samples = dict()
+    for report in reports:
+        for record in report.get("tasks", []):
+            if record.get("cached") or not record.get("wall_time"):
+                continue
+            model = COST_MODELS.get(record["function"], DEFAULT_COST_MODEL)
+            inputs = {pname: spec(description) for pname, description in record.get("inputs", {}).items()}
+            outputs = [spec(description) for description in record.get("outputs", {}).values()]
+            pixels = model.pixels(inputs, outputs)
+            if pixels > 0:
+                samples.setdefault(record["function"], []).append(record["wall_time"] / pixels)
+    return {function: median(values) for function, values in samples.items()}
+
+
+def available_memory() -> int:
+    r"""Memory available to a new process on this node in bytes, ``MemAvailable`` where ``/proc`` is available."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+
+# use _func to avoid sphinx pulling it into docs
+def _row_bytes(inputs: dict, outputs: list, workspace: int) -> float:
+    r"""Bytes of the inputs, outputs and temporaries of a task per detector row."""
+    spec = inputs.get("arrays")
+    if not isinstance(spec, ArraySpec) or len(spec.shape) < 2:
+        return 0.0
+    num_rows = spec.shape[1] if len(spec.shape) == 3 else spec.shape[0]
+    total = sum(nbytes(value) for value in inputs.values()) + sum(nbytes(out) for out in outputs) + workspace
+    return total / max(num_rows, 1)
+
+
+class _Memory:
+    r"""Replay of the registry of a run, tracking the bytes held by the registry values."""
+
+    def __init__(self, dead_values: list, release: bool):
+        self.buffers: Dict[int, int] = dict()  # id: bytes of the arrays held in memory
+        self.keys: Dict[str, int] = dict()  # registry key: buffer id
+        self.dead_values = [(key, set(readers)) for key, readers in dead_values]
+        self.release = release
+
+    @property
+    def resident(self) -> int:
+        return sum(self.buffers.values())
+
+    def _drop(self, key: str) -> None:
+        buffer = self.keys.pop(key, None)
+        if buffer is not None and buffer not in self.keys.values():
+            self.buffers.pop(buffer, None)
+
+    def store(self, idx: int, names: List[str], outputs: list, inplace: Optional[str], resident: bool) -> None:
+        r"""Register the outputs of a task, the first one shares the buffer of the registry key ``inplace``."""
+        for pos, (name, spec) in enumerate(zip(names, outputs)):
+            buffer = self.keys.get(inplace) if pos == 0 and inplace is not None else None
+            self._drop(name)
+            if buffer is None and resident and nbytes(spec):
+                buffer = max(self.buffers, default=-1) + 1
+                self.buffers[buffer] = nbytes(spec)
+            if buffer is not None:
+                self.keys[name] = buffer
+        if self.release:
+            for key, readers in self.dead_values:
+                if idx in readers:
+                    readers.discard(idx)
+                    if not readers:
+                        self._drop(key)
+
+
+def estimate_workflow(
+    engine,
+    memory_bytes: Optional[int] = None,
+    seconds_per_pixel: Optional[Dict[str, float]] = None,
+) -> dict:
+    r"""Estimate the size of the outputs of every task, the peak memory and the runtime of a workflow.
+
+    Parameters
+    ----------
+    engine
+        the ``WorkflowEngineAuto`` of the workflow, it is not run.
+    memory_bytes
+        memory available to the run, the memory available on this node by default.
+    seconds_per_pixel
+        throughputs overriding ``SECONDS_PER_PIXEL``, see ``calibrate``.
+
+    Returns
+    -------
+    dict
+        JSON serializable estimate, see ``format_estimate``.
+    """
+    engine._dryrun()
+    engine._registry = {k: v for k, v in engine.config.items() if k not in engine.config_entries}
+    tasks = engine._fuse_pointwise(engine._push_down_crop(engine.config["tasks"]))
+    reads, _ = engine._task_dependencies(tasks)
+    dead_values = engine._dead_values(tasks, reads)
+    streamed = engine._streaming_tasks(tasks, reads)
+    slab_rows = engine.config.get("streaming", {}).get("slab_rows", 0)
+    throughputs = dict(SECONDS_PER_PIXEL, **(seconds_per_pixel or {}))
+    memory_bytes = available_memory() if memory_bytes is None else memory_bytes
+
+    specs: Dict[str, Any] = dict(engine._registry)  # registry key: ArraySpec, or value of the metadata
+    freeing, keeping = _Memory(dead_values, release=True), _Memory(dead_values, release=False)
+    registry = set(engine._registry)
+    records, row_bytes, resident_before = [], dict(), dict()
+    for idx, task in enumerate(tasks):
+        paramdict = engine._instrospect_task_function(task["function"]).paramdict
+        task_inputs = task.get("inputs", {})
+        # the parameters set in the configuration or from the registry, as the keyword arguments of the task
+        inputs, sources = dict(), dict()
+        for pname in paramdict:
+            source = engine._input_source(pname, task_inputs, registry)
+            if source is not None:
+                inputs[pname], sources[pname] = specs.get(source, UNKNOWN), source
+            elif pname in task_inputs:
+                inputs[pname] = task_inputs[pname]
+        model = COST_MODELS.get(task["function"], DEFAULT_COST_MODEL)
+        inplace = model.inplace(inputs) if callable(model.inplace) else model.inplace
+        names = task.get("outputs", [])
+        outputs = list(model.outputs(inputs)) if names else []
+        outputs = (outputs + [None] * len(names))[: len(names)]
+        workspace = model.workspace(inputs, outputs)
+        row_bytes[idx] = _row_bytes(inputs, outputs, workspace)
+        seconds = model.pixels(inputs, outputs) * throughputs.get(task["function"], DEFAULT_SECONDS_PER_PIXEL)
+        # memory maps are paged in and out by the kernel, they do not count as resident memory
+        resident = not (task["function"] == engine.load_data_function and task_inputs.get("memmap_dir"))
+        new_bytes = sum(nbytes(spec) for pos, spec in enumerate(outputs) if pos or inplace is None)
+        resident_before[idx] = freeing.resident
+        peaks = []
+        for memory in (freeing, keeping):
+            if idx in streamed:
+                separable = SEPARABLE_FUNCTIONS[task["function"]]
+                halo = separable.halo(static_params(task, paramdict, registry.__contains__)) or 0
+                peaks.append(memory.resident + int(row_bytes[idx] * (slab_rows + 2 * halo)))
+            else:
+                peaks.append(memory.resident + (new_bytes if resident else 0) + workspace)
+            memory.store(idx, names, outputs, sources.get(inplace), resident and idx not in streamed)
+        records.append(
+            {
+                "name": task["name"],
+                "function": task["function"],
+                "modeled": task["function"] in COST_MODELS,
+                "streamed": idx in streamed,
+                "outputs": {
+                    name: {"shape": list(spec.shape), "dtype": spec.dtype, "nbytes": nbytes(spec)}
+                    for name, spec in zip(names, outputs)
+                    if isinstance(spec, ArraySpec)
+                },
+                "workspace": workspace,
+                "peak": peaks[0],
+                "peak_without_freeing": peaks[1],
+                "seconds": seconds,
+            }
+        )
+        specs.update({name: spec if spec is not None else UNKNOWN for name, spec in zip(names, outputs)})
+        registry |= set(names)
+
+    peak = max((record["peak"] for record in records), default=0)
+    estimate = {
+        "name": engine.config.get("name", ""),
+        "tasks": records,
+        "peak": peak,
+        "peak_without_freeing": max((record["peak_without_freeing"] for record in records), default=0),
+        "seconds": sum(record["seconds"] for record in records),
+        "memory": memory_bytes,
+        "fits": peak <= memory_bytes,
+        "suggestion": None,
+    }
+    if not estimate["fits"]:
+        estimate["suggestion"] = _suggestion(engine, tasks, streamed, row_bytes, resident_before, memory_bytes)
+    return estimate
+
+
+# use _func to avoid sphinx pulling it into docs
+def _suggestion(
+    engine, tasks: list, streamed: List[int], row_bytes: dict, resident_before: dict, memory_bytes: int
+) -> str:
+    r"""How to make a workflow exceeding the memory fit in it."""
+    tail = [] if streamed else engine._separable_tail(tasks)
+    if tail:
+        load_inputs = tasks[0].get("inputs", {})
+        memmapped = tasks[0]["function"] != engine.load_data_function or "memmap_dir" in load_inputs
+        # the values computed before the streamed tasks stay in memory, unless the loaded stacks are memory-mapped
+        budget = memory_bytes if not memmapped else memory_bytes - resident_before[tail[0]]
+        slab_rows = int(budget // max(max(row_bytes[idx] for idx in tail), 1))
+        if slab_rows > 0:
+            names = ", ".join(tasks[idx]["name"] for idx in tail)
+            suggestion = (
+                f'Add "streaming": {{"slab_rows": {slab_rows}}} to the configuration to run {names} slab by slab'
+            )
+            if not memmapped:
+                suggestion += (
+                    ', and "memmap_dir" to the inputs of the load task to keep the loaded stacks out of memory'
+                )
+            return suggestion
+    return (
+        'Reduce the data with "roi", "bin_factor" or "angle_stride" in the inputs of the load task, '
+        "or run the workflow on a node with more memory"
+    )
+
+
+# use _func to avoid sphinx pulling it into docs
+def _human(nbytes: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(nbytes) < 1024:
+            return f"{nbytes:.1f} {unit}" if unit != "B" else f"{int(nbytes)} B"
+        nbytes /= 1024
+    return f"{nbytes:.1f} TiB"
+
+
+def format_estimate(estimate: dict) -> str:
+    r"""Human readable table of an estimate, see ``estimate_workflow``."""
+    rows = [("task", "outputs", "peak", "peak (no freeing)", "time (s)")]
+    for record in estimate["tasks"]:
+        outputs = ", ".join(
+            f"{name} {'x'.join(map(str, out['shape']))} {out['dtype']} ({_human(out['nbytes'])})"
+            for name, out in record["outputs"].items()
+        )
+        name = record["name"] + (" [streamed]" if record["streamed"] else "") + ("" if record["modeled"] else " *")
+        rows.append(
+            (name, outputs, _human(record["peak"]), _human(record["peak_without_freeing"]), f"{record['seconds']:.1f}")
+        )
+    widths = [max(len(row[col]) for row in rows) for col in range(len(rows[0]))]
+    lines = ["  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in rows]
+    lines.insert(1, "  ".join("-" * width for width in widths))
+    lines.append("")
+    lines.append(
+        f"peak memory: {_human(estimate['peak'])} ({_human(estimate['peak_without_freeing'])} without freeing)"
+    )
+    lines.append(f"available memory: {_human(estimate['memory'])}")
+    seconds = estimate["seconds"]
+    lines.append(f"estimated time: {seconds:.0f} s" if seconds < 600 else f"estimated time: {seconds / 60:.0f} min")
+    if any(not record["modeled"] for record in estimate["tasks"]):
+        lines.append("* no cost model, assumed to return an array like its input")
+    if not estimate["fits"]:
+        lines.append(f"The workflow does not fit in memory. {estimate['suggestion']}")
+    return "\n".join(lines)
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""Per-task profiling of the workflow engine."""
+# package imports
+from imars3d.backend.util.functions import clamp_max_workers
+from imars3d.backend.util.pool import worker_pids
+
+# third-party imports
+import numpy as np
+
+# standard imports
+from contextlib import contextmanager
+from datetime import datetime
+import json
+import logging
+import multiprocessing
+import os
+from pathlib import Path
+import resource
+import sys
+import threading
+import time
+from typing import Any, Iterator, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+
+def describe(value: Any) -> dict:
+    r"""Summary of a task input or output suitable for a JSON report.
+
+    Arrays are described by their shape, dtype and size in bytes, scalars by their value,
+    and anything else by its type (and length, for lists and tuples).
+    """
+    if isinstance(value, np.ndarray):
+        return {"shape": list(value.shape), "dtype": str(value.dtype), "nbytes": int(value.nbytes)}
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return {"value": value}
+    if isinstance(value, np.generic):
+        return {"value": value.item()}
+    if isinstance(value, (list, tuple)):
+        return {"type": type(value).__name__, "length": len(value)}
+    return {"type": type(value).__name__}
+
+
+# use _func to avoid sphinx pulling it into docs
+def _process_rss(pid: Union[int, str] = "self") -> Optional[int]:
+    r"""Resident set size of a process in bytes, None where ``/proc`` is not available or the process is gone."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+# use _func to avoid sphinx pulling it into docs
+def _process_cpu_time(pid: int) -> float:
+    r"""CPU time (user and system) used by a running process in seconds, 0 if it cannot be read."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # the fields after the command name, which may contain spaces, start with the state
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+# use _func to avoid sphinx pulling it into docs
+def _current_rss() -> Optional[int]:
+    r"""Resident set size of the process and of the workers of the shared pool in bytes.
+
+    None where ``/proc`` is not available.
+    """
+    rss = _process_rss()
+    if rss is None:
+        return None
+    return rss + sum(_process_rss(pid) or 0 for pid in worker_pids())
+
+
+# use _func to avoid sphinx pulling it into docs
+def _max_rss() -> int:
+    r"""Peak resident set size of the process in bytes."""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == "darwin" else max_rss * 1024  # kilobytes on Linux
+
+
+# use _func to avoid sphinx pulling it into docs
+def _cpu_time() -> float:
+    r"""CPU time (user and system) used by the process and its child processes, in seconds.
+
+    The terminated child processes are accounted by ``getrusage``, the running workers of
+    the shared pool, which stay up between filters, are read from ``/proc``.
+    """
+    total = sum(_process_cpu_time(pid) for pid in worker_pids())
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+class TaskProfiler:
+    """
+    Record the wall time, CPU time and memory use of the tasks of a workflow.
+
+    The resident set size is sampled by a background thread while tasks are running, the
+    peak RSS delta of a task is the peak resident set size during the task minus the
+    resident set size when it started. CPU time and memory are measured for the whole
+    process, so they include the contributions of the tasks running concurrently with
+    the "dag" scheduler, and for the worker processes of the shared pool of the parallel
+    filters. The resident set sizes of the workers are summed, so the memory they share
+    with each other is counted once per worker. Where ``/proc`` is not available, i.e.
+    not on Linux, the running workers are left out and the peak RSS delta is that of the
+    main process.
+
+    Parameters
+    ----------
+    interval:
+        time between two samples of the resident set size, in seconds.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.records: List[dict] = []
+        self.started = datetime.now()
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._active: List[dict] = []
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            rss = _current_rss()
+            with self._lock:
+                for record in self._active:
+                    record["_peak_rss"] = max(record["_peak_rss"], rss or 0)
+
+    @contextmanager
+    def profile(self, task: dict, inputs: dict) -> Iterator[dict]:
+        r"""Profile the execution of a task.
+
+        Parameters
+        ----------
+        task
+            the task being executed.
+        inputs
+            the resolved inputs of the task.
+
+        Returns
+        -------
+        dict
+            the record of the task, the caller adds the description of the outputs to it.
+        """
+        rss = _current_rss()
+        record = {
+            "name": task["name"],
+            "function": task["function"],
+            "thread": threading.current_thread().name,
+            "thread_id": threading.get_ident(),
+            "inputs": {pname: describe(value) for pname, value in inputs.items()},
+            "_rss": rss if rss is not None else _max_rss(),
+            "_peak_rss": rss or 0,
+        }
+        if "max_workers" in inputs:
+            record["max_workers"] = clamp_max_workers(inputs["max_workers"])
+        with self._lock:
+            self._active.append(record)
+            if rss is not None and self._sampler is None:
+                self._stop.clear()
+                self._sampler = threading.Thread(target=self._sample, name="imars3d-profiler", daemon=True)
+                self._sampler.start()
+        cpu_time, start = _cpu_time(), time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["start"] = start - self._origin
+            record["wall_time"] = time.perf_counter() - start
+            record["cpu_time"] = _cpu_time() - cpu_time
+            rss = _current_rss()
+            with self._lock:
+                self._active.remove(record)
+                if not self._active and self._sampler is not None:
+                    self._stop.set()
+                    sampler, self._sampler = self._sampler, None
+                else:
+                    sampler = None
+                peak_rss = max(record.pop("_peak_rss"), rss or 0) if rss is not None else _max_rss()
+                record["peak_rss_delta"] = max(0, peak_rss - record.pop("_rss"))
+                self.records.append(record)
+            if sampler is not None:
+                sampler.join()
+
+    def report(self, **metadata) -> dict:
+        r"""JSON serializable report of the tasks profiled so far, in order of completion.
+
+        Parameters
+        ----------
+        metadata
+            additional entries of the report, e.g. the scheduler.
+        """
+        from imars3d import __version__
+
+        report = {
+            "imars3d_version": __version__,
+            "started": self.started.isoformat(timespec="seconds"),
+            "wall_time": time.perf_counter() - self._origin,
+            "cpu_count": multiprocessing.cpu_count(),
+        }
+        report.update(metadata)
+        report["tasks"] = list(self.records)
+        return report
+
+    def trace_events(self) -> dict:
+        r"""Tasks profiled so far in the Chrome trace event format, see ``chrome://tracing`` or Perfetto."""
+        events = []
+        for thread_id, thread in sorted({(record["thread_id"], record["thread"]) for record in self.records}):
+            events.append(
+                {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": thread_id, "args": {"name": thread}}
+            )
+        for record in self.records:
+            args = {
+                key: record[key] for key in ("cpu_time", "peak_rss_delta", "max_workers", "cached") if key in record
+            }
+            events.append(
+                {
+                    "name": record["name"],
+                    "cat": record["function"],
+                    "ph": "X",
+                    "ts": record["start"] * 1e6,
+                    "dur": record["wall_time"] * 1e6,
+                    "pid": os.getpid(),
+                    "tid": record["thread_id"],
+                    "args": args,
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, filename: Union[str, Path], trace_filename: Optional[Union[str, Path]] = None, **metadata) -> None:
+        r"""Write the JSON report, and the Chrome trace if a file name is given for it.
+
+        Failing to write is logged, as the report should not make a successful reduction fail.
+        """
+        outputs = [(filename, self.report(**metadata))]
+        if trace_filename is not None:
+            outputs.append((trace_filename, self.trace_events()))
+        for path, content in outputs:
+            try:
+                Path(path).parent.mkdir(parents=True, exist_ok=True)
+                with open(path, "w") as f:
+                    json.dump(content, f, indent=2, default=str)
+            except OSError as e:
+                logger.warning(f"Failed to write the profile {path}: {e}")
+            else:
+                logger.info(f"Wrote the profile {path}")
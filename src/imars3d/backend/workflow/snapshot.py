@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""Snapshots of the registry of a workflow run, to resume a failed or interrupted run.
+
+After every task, the values it wrote to the registry are saved to the snapshot directory,
+arrays as raw ``.npy`` files and other values pickled, and ``manifest.json`` records the
+tasks completed so far, the digest of the configuration and the file of every live value.
+The manifest is replaced atomically once the files it lists are complete, so a run killed
+at any point leaves the snapshot of the last completed task. Values released by the engine
+are removed from the snapshot, which therefore never grows much beyond the registry.
+"""
+# third-party imports
+import numpy as np
+
+# standard imports
+import json
+import logging
+import os
+from pathlib import Path
+import pickle
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+
+class RegistrySnapshot:
+    r"""Snapshot of the registry values computed by the completed tasks of a run.
+
+    Parameters
+    ----------
+    snapshot_dir
+        directory holding the snapshot, created if needed.
+    config_digest
+        digest of the configuration of the run, a snapshot of another configuration is not resumed.
+    """
+
+    manifest_name = "manifest.json"
+
+    def __init__(self, snapshot_dir: Union[str, Path], config_digest: str):
+        self.snapshot_dir = Path(snapshot_dir)
+        self.config_digest = config_digest
+        self.completed: List[Tuple[int, str]] = []  # (index, name) of the completed tasks
+        self.entries: Dict[str, str] = dict()  # registry key: file holding its value
+        self.digests: Dict[str, str] = dict()  # registry key: content digest, when memoizing task results
+        self._version = 0
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.snapshot_dir / self.manifest_name
+
+    @staticmethod
+    def read_config(snapshot_dir: Union[str, Path]) -> dict:
+        r"""Configuration of the run that wrote a snapshot."""
+        with open(Path(snapshot_dir) / RegistrySnapshot.manifest_name) as f:
+            return json.load(f)["config"]
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        r"""Read the snapshot of a previous run of the same configuration.
+
+        Arrays are returned as copy-on-write memory maps, so the tasks resumed may modify them
+        in place without altering the snapshot.
+
+        Returns
+        -------
+        dict
+            the registry values of the snapshot, None if there is no usable snapshot.
+        """
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.info(f"No snapshot to resume in {self.snapshot_dir}: {e}")
+            return None
+        if manifest.get("config_digest") != self.config_digest:
+            logger.warning(f"The snapshot in {self.snapshot_dir} is of another configuration, starting over")
+            return None
+        values = dict()
+        try:
+            for key, filename in manifest["entries"].items():
+                path = self.snapshot_dir / filename
+                if path.suffix == ".npy":
+                    values[key] = np.load(str(path), mmap_mode="c")
+                else:
+                    with open(path, "rb") as f:
+                        values[key] = pickle.load(f)
+        except (OSError, ValueError, KeyError, pickle.UnpicklingError) as e:
+            logger.warning(f"Discarding unreadable snapshot {self.snapshot_dir}: {e}")
+            return None
+        self.completed = [tuple(item) for item in manifest["completed"]]
+        self.entries = dict(manifest["entries"])
+        self.digests = dict(manifest.get("digests", {}))
+        self._version = manifest.get("version", 0)
+        return values
+
+    def record(
+        self,
+        config: dict,
+        completed: List[Tuple[int, str]],
+        values: Dict[str, Any],
+        live: set,
+        digests: Optional[Dict[str, str]] = None,
+    ) -> None:
+        r"""Save the values written by tasks that just completed, and mark them completed.
+
+        Parameters
+        ----------
+        config
+            configuration of the run, stored in the manifest so that the run can be resumed from the snapshot alone.
+        completed
+            (index, name) of the tasks that just completed.
+        values
+            the registry values they wrote.
+        live
+            the registry keys still in use, the values of the other keys are removed from the snapshot.
+        digests
+            the content digests of the registry values, when memoizing task results.
+        """
+        self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+        self._version += 1
+        stale = []
+        for key, value in values.items():
+            filename = self._write(key, value)
+            if key in self.entries:
+                stale.append(self.entries[key])
+            self.entries[key] = filename
+        for key in [key for key in self.entries if key not in live]:
+            stale.append(self.entries.pop(key))
+        self.completed.extend(completed)
+        if digests is not None:
+            self.digests = {key: digests[key] for key in self.entries if key in digests}
+        manifest = {
+            "config_digest": self.config_digest,
+            "config": config,
+            "version": self._version,
+            "completed": self.completed,
+            "entries": self.entries,
+            "digests": self.digests,
+        }
+        partial = self.manifest_path.with_suffix(f".{os.getpid()}.partial")
+        with open(partial, "w") as f:
+            json.dump(manifest, f, indent=2, default=str)
+        os.replace(partial, self.manifest_path)
+        # the previous values are no longer referenced by the manifest
+        for filename in stale:
+            (self.snapshot_dir / filename).unlink(missing_ok=True)
+
+    def _write(self, key: str, value: Any) -> str:
+        r"""Write a registry value to a file of its own, returns the name of the file."""
+        stem = f"{key}.{self._version}"
+        if isinstance(value, np.ndarray):
+            filename = f"{stem}.npy"
+            np.save(str(self.snapshot_dir / filename), value)
+        else:
+            filename = f"{stem}.pkl"
+            with open(self.snapshot_dir / filename, "wb") as f:
+                pickle.dump(value, f)
+        return filename
+
+    def clear(self) -> None:
+        r"""Remove the snapshot, e.g. once the run it allows to resume is complete."""
+        for path in self.snapshot_dir.glob("*"):
+            if path.is_file():
+                path.unlink(missing_ok=True)
+        self.completed, self.entries, self.digests = [], dict(), dict()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Row-separable task functions for the slab-streaming mode of the workflow engine.
+
+A task function is row-separable when every detector row (i.e. sinogram) of its output only
+depends on a bounded number of neighbouring rows of its inputs. Such tasks can be run on a
+slab of rows at a time, padded with enough halo rows for the filters with a kernel, and give
+the same rows as when run on the whole stack.
+"""
+# third-party imports
+import numpy as np
+
+# standard imports
+from collections import namedtuple
+from typing import Callable, Dict, Optional, Tuple
+
+RowSeparable = namedtuple("RowSeparable", ["sliced_inputs", "output_axis", "halo"])
+RowSeparable.__doc__ = r"""Description of a row-separable task function.
+
+sliced_inputs
+    names of the array parameters sliced along the detector rows, other parameters are passed as is.
+output_axis
+    axis of the detector rows in the outputs of the function.
+halo
+    function of the task parameters returning the number of halo rows needed on each side of a slab,
+    or None if the function is not row-separable with these parameters.
+"""
+
+
+# value of the parameters set from the registry, unknown until the workflow runs
+UNKNOWN = object()
+
+
+# use _func to avoid sphinx pulling it into docs
+def _no_halo(params: dict) -> int:
+    return 0
+
+
+# use _func to avoid sphinx pulling it into docs
+def _gamma_filter_halo(params: dict) -> Optional[int]:
+    if UNKNOWN in (params.get("axis"), params.get("median_kernel")):
+        return None
+    # the median filter is applied to the 2D slices perpendicular to "axis", axis=1 slices are sinograms
+    if params.get("axis", 0) == 1:
+        return 0
+    return params.get("median_kernel", 5) // 2
+
+
+# use _func to avoid sphinx pulling it into docs
+def _denoise_halo(params: dict) -> Optional[int]:
+    if UNKNOWN in (params.get("method"), params.get("median_filter_kernel")):
+        return None
+    # the bilateral filter rescales every projection by its maximum, which depends on all the rows
+    if params.get("method", "bilateral") != "median":
+        return None
+    return params.get("median_filter_kernel", 3) // 2
+
+
+SEPARABLE_FUNCTIONS: Dict[str, RowSeparable] = {
+    "imars3d.backend.corrections.gamma_filter.gamma_filter": RowSeparable(("arrays",), 1, _gamma_filter_halo),
+    "imars3d.backend.preparation.normalization.normalization": RowSeparable(("arrays", "flats", "darks"), 1, _no_halo),
+    "imars3d.backend.preparation.normalization.minus_log": RowSeparable(("arrays",), 1, _no_halo),
+    "imars3d.backend.preparation.normalization.fused_normalization": RowSeparable(
+        ("arrays", "flats", "darks"), 1, _no_halo
+    ),
+    "imars3d.backend.corrections.denoise.denoise": RowSeparable(("arrays",), 1, _denoise_halo),
+    "imars3d.backend.corrections.ring_removal.remove_ring_artifact": RowSeparable(("arrays",), 1, _no_halo),
+    "imars3d.backend.reconstruction.recon": RowSeparable(("arrays",), 0, _no_halo),
+}
+
+
+def row_axis(array: np.ndarray) -> int:
+    r"""Axis of the detector rows in a stack of images (axis 1) or in a single image (axis 0)."""
+    return 1 if array.ndim == 3 else 0
+
+
+def slab_range(start: int, stop: int, halo: int, num_rows: int) -> Tuple[int, int]:
+    r"""Rows ``[start, stop)`` extended by ``halo`` rows on each side, within the ``num_rows`` rows of the stack."""
+    return max(0, start - halo), min(num_rows, stop + halo)
+
+
+def take_rows(array: np.ndarray, axis: int, start: int, stop: int) -> np.ndarray:
+    r"""View of the rows ``[start, stop)`` of an array along the given axis."""
+    index = [slice(None)] * array.ndim
+    index[axis] = slice(start, stop)
+    return array[tuple(index)]
+
+
+def static_params(task: dict, paramdict: dict, is_registry_key: Callable[[str], bool]) -> dict:
+    r"""Task parameters known before running the workflow: defaults overridden by explicit inputs.
+
+    Parameters
+    ----------
+    task
+        the task being planned.
+    paramdict
+        dictionary of `name: instance` parameters of the task function.
+    is_registry_key
+        whether an input value refers to a registry value, such parameters are set to ``UNKNOWN``.
+    """
+    params = {pname: UNKNOWN if is_registry_key(pname) else param.default for pname, param in paramdict.items()}
+    params.pop("name", None)
+    for pname, val in task.get("inputs", {}).items():
+        if isinstance(val, str) and is_registry_key(val):
+            params[pname] = UNKNOWN
+        else:
+            params[pname] = val
+    return params
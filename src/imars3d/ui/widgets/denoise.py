@@ -16,7 +16,9 @@ class Denoise(param.Parameterized):
     parent = param.Parameter()
     # denoise
     denoise_action = param.Action(lambda x: x.param.trigger("denoise_action"), label="Execute")
-    denoise_method = param.Selector(default="bilateral", objects=["bilateral", "median"], doc="denoise method")
+    denoise_method = param.Selector(
+        default="bilateral", objects=["bilateral", "bilateral_fast", "median"], doc="denoise method"
+    )
     denoise_median_kernel = param.Integer(
         default=3,
         bounds=(3, None),
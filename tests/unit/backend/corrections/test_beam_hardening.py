@@ -3,6 +3,7 @@
 #!/usr/bin/env python
 import numpy as np
 import pytest
+from algotom.prep.correction import beam_hardening_correction as algotom_beam_hardening_correction
 from imars3d.backend.corrections.beam_hardening import beam_hardening_correction
 
 
@@ -64,9 +65,48 @@ def test_beam_hardening_correction(fake_beam_hardening_image):
         opt=True,
     )
     assert corrected_image.shape == (10, 255, 255)
-    assert corrected_image.dtype == np.float64
+    assert corrected_image.dtype == np.float32
     assert np.all(corrected_image >= 0)
 
 
+@pytest.mark.parametrize("opt", [True, False])
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_beam_hardening_correction_algotom(opt, max_workers):
+    """Test the vectorized correction against algotom"""
+    arrays = np.random.default_rng(0).random((7, 30, 40))
+    expected = np.stack([algotom_beam_hardening_correction(image, 0.05, 5.0, opt) for image in arrays])
+    rst = beam_hardening_correction(arrays=arrays, q=0.05, n=5.0, opt=opt, max_workers=max_workers, dtype="float64")
+    np.testing.assert_allclose(rst, expected, rtol=1e-12, atol=1e-14)
+    # single precision by default
+    rst = beam_hardening_correction(arrays=arrays, q=0.05, n=5.0, opt=opt, max_workers=max_workers)
+    np.testing.assert_allclose(rst, expected, rtol=1e-5, atol=1e-6)
+    # the stack is checked before any image is modified
+    arrays[-1, -1, -1] = 2.0
+    stack = arrays.copy()
+    with pytest.raises(ValueError):
+        beam_hardening_correction(arrays=stack, inplace=True, max_workers=max_workers)
+    np.testing.assert_array_equal(stack, arrays)
+    with pytest.raises(ValueError):
+        beam_hardening_correction(arrays=arrays[:-1], n=1.5)
+
+
+def test_beam_hardening_correction_output(fake_beam_hardening_image):
+    """Test writing the correction into a given array"""
+    arrays = fake_beam_hardening_image[:3] * 0.5 + 0.25
+    expected = beam_hardening_correction(arrays=arrays, dtype="float64", max_workers=1)
+    assert expected.dtype == np.float64
+    out = np.empty(arrays.shape, dtype=np.float32)
+    assert beam_hardening_correction(arrays=arrays, out=out, max_workers=1) is out
+    np.testing.assert_allclose(out, expected, rtol=1e-6)
+    stack = arrays.copy()
+    assert beam_hardening_correction(arrays=stack, inplace=True, max_workers=1) is stack
+    np.testing.assert_array_equal(stack, expected)
+    image = arrays[0].copy()
+    assert beam_hardening_correction(arrays=image, inplace=True) is image
+    np.testing.assert_array_equal(image, expected[0])
+    with pytest.raises(ValueError):
+        beam_hardening_correction(arrays=arrays, out=np.empty(arrays.shape, dtype=np.uint8))
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
@@ -10,6 +10,7 @@ from imars3d.backend.corrections.denoise import denoise
 from imars3d.backend.corrections.denoise import denoise_by_median
 from imars3d.backend.corrections.denoise import denoise_by_bilateral
 from imars3d.backend.corrections.denoise import denoise_by_bilateral_2d
+from imars3d.backend.corrections.denoise import denoise_by_bilateral_fast
 
 
 @pytest.fixture(scope="module")
@@ -103,5 +104,72 @@ def test_denoise_by_bilateral_2d(fake_noisy_image):
     assert noise_level_noisy > noise_level_denoised
 
 
+def _bilateral_reference(image, sigma_color, sigma_spatial):
+    # direct evaluation of the bilateral filter, the pixels outside the image are zeros as in skimage
+    radius = int(np.ceil(3 * sigma_spatial))
+    padded = np.pad(image, radius)
+    sums, weights = np.zeros_like(image), np.zeros_like(image)
+    for dy in range(-radius, radius + 1):
+        for dx in range(-radius, radius + 1):
+            window = padded[radius + dy : radius + dy + image.shape[0], radius + dx : radius + dx + image.shape[1]]
+            weight = np.exp(-(dy**2 + dx**2) / (2 * sigma_spatial**2) - (window - image) ** 2 / (2 * sigma_color**2))
+            sums += weight * window
+            weights += weight
+    return sums / weights
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_denoise_by_bilateral_fast(max_workers):
+    rng = np.random.default_rng(0)
+    rows, cols = np.mgrid[:48, :64]
+    phantom = np.where((rows - 24) ** 2 + (cols - 32) ** 2 < 15**2, 0.4, 0.9) + 0.05 * np.sin(cols / 10)
+    arrays = phantom + rng.normal(0, 0.02, (5,) + phantom.shape)
+    denoised = denoise_by_bilateral_fast(arrays, max_workers=max_workers)
+    assert denoised.shape == arrays.shape and denoised.dtype == np.float64
+    for image, result in zip(arrays[:2], denoised):
+        reference = _bilateral_reference(image, 0.02, 5.0)
+        # much closer to the bilateral filter than the noise
+        assert np.sqrt(np.mean((result - reference) ** 2)) < 0.1 * np.sqrt(np.mean((image - reference) ** 2))
+    # the edge of the disk is preserved
+    assert np.all(denoised[:, 24, 16] > 0.85) and np.all(denoised[:, 24, 18] < 0.5)
+    # the images are denoised independently of the block they are in
+    np.testing.assert_allclose(denoise_by_bilateral_fast(arrays[2]), denoised[2], rtol=1e-12)
+    stack = arrays.astype(np.float32)
+    assert denoise_by_bilateral_fast(stack, out=stack, max_workers=max_workers) is stack
+    np.testing.assert_allclose(stack, denoised, atol=1e-6)
+    # the intensity levels are capped
+    step = np.zeros((1, 8, 8))
+    step[:, :, 4:] = 1e4
+    np.testing.assert_allclose(denoise_by_bilateral_fast(step), step, atol=1e-6)
+    with pytest.raises(ValueError):
+        denoise_by_bilateral_fast(np.arange(3.0))
+
+
+@pytest.mark.parametrize("method", ["median", "bilateral", "bilateral_fast"])
+def test_denoise_output(method):
+    rng = np.random.default_rng(0)
+    arrays = rng.random((3, 16, 16)) + 0.5
+    expected = denoise(arrays=arrays, method=method, max_workers=1, dtype="float64")
+    # float32 by default, converted image by image
+    rst = denoise(arrays=arrays, method=method, max_workers=1)
+    assert rst.dtype == np.float32
+    np.testing.assert_allclose(rst, expected, rtol=1e-6)
+    out = np.empty(arrays.shape, dtype=np.float32)
+    assert denoise(arrays=arrays, method=method, max_workers=1, out=out) is out
+    np.testing.assert_array_equal(out, rst)
+    stack = arrays.copy()
+    assert denoise(arrays=stack, method=method, max_workers=1, inplace=True) is stack
+    np.testing.assert_allclose(stack, expected)
+    # 2D image
+    image = arrays[0].copy()
+    rst = denoise(arrays=image, method=method, max_workers=1, dtype="same")
+    assert rst.dtype == np.float64
+    np.testing.assert_array_equal(image, arrays[0])
+    # floating point results cannot be written into integer arrays
+    if method == "bilateral":
+        with pytest.raises(ValueError):
+            denoise(arrays=(arrays * 100).astype(np.uint16), method=method, inplace=True)
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
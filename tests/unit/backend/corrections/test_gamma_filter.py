@@ -61,5 +61,55 @@ def test_gamma_filter_selective_filtering(use_selective_median_filter, data_fixt
         assert imgs_filtered[0, j, i] == imgs_reference[0, j, i]
 
 
+@pytest.mark.parametrize("axis", [0, 1, 2])
+@pytest.mark.parametrize("median_kernel", [3, 4, 5])
+def test_gamma_filter_sparse(axis, median_kernel):
+    rng = np.random.default_rng(0)
+    imgs_with_noise = rng.integers(0, 1000, size=(6, 20, 30)).astype(np.uint16)
+    hits = rng.random(imgs_with_noise.shape) < 0.05
+    imgs_with_noise[hits] = 65535 - rng.integers(0, 4, np.count_nonzero(hits))
+    imgs_with_noise[0, 0, 0] = imgs_with_noise[-1, -1, -1] = 65535  # corners
+    expected = gamma_filter(arrays=imgs_with_noise, axis=axis, median_kernel=median_kernel)
+    # a new float32 array by default
+    imgs_filtered = gamma_filter(arrays=imgs_with_noise, axis=axis, median_kernel=median_kernel, sparse=True)
+    assert imgs_filtered.dtype == np.float32
+    np.testing.assert_array_equal(imgs_filtered, expected)
+    # the hits are replaced in place, the arrays keep their data type
+    arrays = imgs_with_noise.copy()
+    imgs_filtered = gamma_filter(arrays=arrays, axis=axis, median_kernel=median_kernel, sparse=True, inplace=True)
+    assert imgs_filtered is arrays
+    assert imgs_filtered.dtype == np.uint16
+    np.testing.assert_array_equal(imgs_filtered, expected)
+    # read-only arrays cannot be filtered in place
+    imgs_with_noise.flags.writeable = False
+    with pytest.raises(ValueError):
+        gamma_filter(arrays=imgs_with_noise, sparse=True, inplace=True)
+    # nothing to replace
+    clean = np.ones((2, 5, 5), dtype=np.uint16)
+    np.testing.assert_array_equal(gamma_filter(arrays=clean, sparse=True), 1)
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_gamma_filter_output(sparse):
+    rng = np.random.default_rng(1)
+    imgs_with_noise = rng.integers(0, 1000, size=(4, 16, 16)).astype(np.uint16)
+    imgs_with_noise[rng.random(imgs_with_noise.shape) < 0.05] = 65535
+    expected = gamma_filter(arrays=imgs_with_noise)
+    # same values whatever the array the result is written to
+    arrays = imgs_with_noise.copy()
+    assert gamma_filter(arrays=arrays, sparse=sparse, inplace=True) is arrays
+    np.testing.assert_array_equal(arrays, expected)
+    out = np.empty(imgs_with_noise.shape, dtype=np.float64)
+    assert gamma_filter(arrays=imgs_with_noise, sparse=sparse, out=out) is out
+    np.testing.assert_array_equal(out, expected)
+    rst = gamma_filter(arrays=imgs_with_noise, sparse=sparse, dtype="same")
+    assert rst.dtype == imgs_with_noise.dtype
+    np.testing.assert_array_equal(rst, expected)
+    with pytest.raises(ValueError):
+        gamma_filter(arrays=arrays, inplace=True, out=out)
+    with pytest.raises(ValueError):
+        gamma_filter(arrays=imgs_with_noise, out=out[1:])
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
@@ -5,6 +5,8 @@ import tomopy
 from imars3d.backend.corrections.ring_removal import remove_ring_artifact
 from imars3d.backend.corrections.ring_removal import remove_ring_artifact_Ketcham
 from imars3d.backend.corrections.ring_removal import bm3d_ring_removal
+from imars3d.backend.corrections.ring_removal import _remove_ring_artifact_Ketcham
+from imars3d.backend.corrections.ring_removal import _remove_ring_artifact_Ketcham_batch
 
 try:
     import bm3d_streak_removal as bm3dsr
@@ -67,6 +69,43 @@ def test_remove_ring_artifact_Ketcham():
     assert err_correction < err_no_correction
 
 
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+@pytest.mark.parametrize("sub_division", [10, 200])
+def test_remove_ring_artifact_Ketcham_batch(dtype, sub_division):
+    rng = np.random.default_rng(0)
+    tomo_with_ring = (0.5 + rng.random((181, 12, 64))).astype(dtype)
+    tomo_with_ring[:, :, 20] *= 1.07
+    tomo_with_ring[:, 3:6, 40] *= 0.93
+    expected = np.stack(
+        [
+            _remove_ring_artifact_Ketcham(tomo_with_ring[:, i, :], kernel_size=5, sub_division=sub_division)
+            for i in range(tomo_with_ring.shape[1])
+        ],
+        axis=1,
+    )
+    # the slab is corrected in place
+    arrays = tomo_with_ring.copy()
+    assert _remove_ring_artifact_Ketcham_batch(arrays, kernel_size=5, sub_division=sub_division) is arrays
+    np.testing.assert_array_equal(arrays, expected)
+    # the whole stack, by blocks of sinograms
+    arrays = tomo_with_ring.copy()
+    assert remove_ring_artifact(arrays=arrays, sub_division=sub_division, max_workers=3) is arrays
+    np.testing.assert_array_equal(arrays, expected)
+    with pytest.raises(ValueError):
+        _remove_ring_artifact_Ketcham_batch(arrays, kernel_size=4)
+
+
+def test_remove_ring_artifact_Ketcham_batch_integer():
+    rng = np.random.default_rng(0)
+    tomo_with_ring = rng.integers(20000, 50000, (181, 4, 64), dtype=np.uint16)
+    tomo_with_ring[:, :, 20] = tomo_with_ring[:, :, 20] // 100 * 107
+    # the ratios are those of the same counts in float64
+    expected = _remove_ring_artifact_Ketcham_batch(tomo_with_ring.astype(np.float64))
+    arrays = tomo_with_ring.copy()
+    _remove_ring_artifact_Ketcham_batch(arrays)
+    np.testing.assert_array_equal(arrays, expected.astype(np.uint16))
+
+
 @pytest.mark.skipif(not bm3dsr, reason="bm3d not installed, skipping test.")
 def test_bm3d_ring_removal():
     # step_0: prepare synthetic data
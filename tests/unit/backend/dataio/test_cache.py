@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the decoded stack cache.
+"""
+# package imports
+from imars3d.backend.dataio.cache import MasterImageCache, StackCache, TaskResultCache, file_signature
+from imars3d.backend.dataio.data import _load_by_file_list, _load_images
+
+# third party imports
+import numpy as np
+import pytest
+import tifffile
+
+# standard imports
+import json
+import os
+from pathlib import Path
+from unittest import mock
+
+
+@pytest.fixture(scope="function")
+def tiff_files(tmpdir):
+    filelist = []
+    for i in range(3):
+        filename = str(tmpdir / f"img_{i}.tiff")
+        tifffile.imwrite(filename, np.full((4, 5), i, dtype=np.uint16))
+        filelist.append(filename)
+    return filelist
+
+
+def test_file_signature(tiff_files):
+    key = file_signature(tiff_files, roi=None)
+    assert key == file_signature(tiff_files, roi=None)
+    # order, options and file modification all change the key
+    assert key != file_signature(tiff_files[::-1], roi=None)
+    assert key != file_signature(tiff_files, roi=[0, 1, 0, 1])
+    stat = os.stat(tiff_files[1])
+    os.utime(tiff_files[1], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert key != file_signature(tiff_files, roi=None)
+    # missing files do not raise
+    assert file_signature(["does_not_exist.tiff"])
+
+
+def test_stack_cache(tmpdir):
+    cache = StackCache(tmpdir / "cache", max_bytes=10**6)
+    assert cache.get("a") is None
+    stack = np.lib.format.open_memmap(str(cache.partial_path("a")), mode="w+", dtype=np.float32, shape=(3, 2, 2))
+    stack[:] = 1.0
+    mask = np.array([True, True, False])
+    cached = cache.commit("a", stack, mask)
+    assert cached.shape == (2, 2, 2)
+    stack, cached_mask = cache.get("a")
+    np.testing.assert_array_equal(cached_mask, mask)
+    # copy-on-write, modifications do not reach the cache
+    stack[:] = 2.0
+    np.testing.assert_array_equal(cache.get("a")[0], np.ones((2, 2, 2)))
+
+
+def test_stack_cache_eviction(tmpdir):
+    entry = np.zeros((10, 10, 10), dtype=np.float64)  # 8000 bytes
+    cache = StackCache(tmpdir / "cache", max_bytes=20000)
+    for i, key in enumerate(["a", "b", "c"]):
+        stack = np.lib.format.open_memmap(
+            str(cache.partial_path(key)), mode="w+", dtype=entry.dtype, shape=entry.shape
+        )
+        cache.commit(key, stack, np.ones(10, dtype=bool))
+        os.utime(cache.cache_dir / f"{key}.npy", (i, i))
+        if key == "b":
+            cache.get("a")  # "a" becomes more recently used than "b"
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+
+def test_load_images_with_cache(tiff_files, tmpdir):
+    cache = StackCache(tmpdir / "cache", max_bytes=10**6)
+    stack, mask = _load_images(tiff_files, desc="test", max_workers=1, cache=cache, return_mask=True)
+    np.testing.assert_array_equal(stack[:, 0, 0], [0, 1, 2])
+    # second call is served from the cache without decoding
+    with mock.patch("imars3d.backend.dataio.data.tifffile.imread", side_effect=RuntimeError("decoded")):
+        cached, cached_mask = _load_images(tiff_files, desc="test", max_workers=1, cache=cache, return_mask=True)
+    assert isinstance(cached, np.memmap)
+    np.testing.assert_array_equal(cached, stack)
+    np.testing.assert_array_equal(cached_mask, mask)
+    # modifying a file invalidates the entry
+    tifffile.imwrite(tiff_files[0], np.full((4, 5), 7, dtype=np.uint16))
+    stat = os.stat(tiff_files[0])
+    os.utime(tiff_files[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    reloaded = _load_images(tiff_files, desc="test", max_workers=1, cache=cache)
+    np.testing.assert_array_equal(reloaded[:, 0, 0], [7, 1, 2])
+
+
+def test_master_image_cache(tmpdir):
+    cache = MasterImageCache(tmpdir / "master")
+    assert cache.get("a") is None
+    cache.put("a", np.ones((2, 3), dtype=np.float32), {"num_files": 3})
+    np.testing.assert_array_equal(cache.get("a"), np.ones((2, 3)))
+    with open(cache.cache_dir / "a.json") as f:
+        assert json.load(f) == {"num_files": 3}
+    assert not list(cache.cache_dir.glob("*.partial"))
+
+
+def test_load_master_flats(tiff_files, tmpdir):
+    ct_files, ob_files = tiff_files[:1], tiff_files[1:]
+    ct, ob, dc, _ = _load_by_file_list(ct_files, ob_files, max_workers=1, master_dir=str(tmpdir))
+    # reduced with the median by default
+    np.testing.assert_array_equal(ob, np.full((4, 5), 1.5))
+    assert dc is None
+    # a later scan sharing the open beams does not read them again
+    with mock.patch("imars3d.backend.dataio.data._reduce_images", side_effect=RuntimeError("reduced")):
+        _, cached, _, _ = _load_by_file_list(ct_files, ob_files, max_workers=1, master_dir=str(tmpdir))
+    np.testing.assert_array_equal(cached, ob)
+    # but a different reduction does
+    _, clipped, _, _ = _load_by_file_list(
+        ct_files, ob_files, max_workers=1, master_dir=str(tmpdir), reduction="clipped_mean"
+    )
+    np.testing.assert_array_equal(clipped, np.full((4, 5), 1.5))
+    assert len(list(Path(tmpdir, "master_flats").glob("*.npy"))) == 2
+
+
+def test_task_result_cache(tmpdir):
+    cache = TaskResultCache(Path(tmpdir, "tasks"), max_bytes=20000)
+    assert cache.get("a") is None
+    assert cache.put("a", [np.ones((10, 10, 10)), 1.5, None], {"task": "a"})  # 8000 bytes array
+    array, number, nothing = cache.get("a")
+    # copy-on-write, modifications do not reach the cache
+    array[:] = 2.0
+    np.testing.assert_array_equal(cache.get("a")[0], np.ones((10, 10, 10)))
+    assert (number, nothing) == (1.5, None)
+    # values that cannot be serialized are not cached
+    assert not cache.put("b", [lambda x: x], {"task": "b"})
+    assert cache.get("b") is None
+    assert not list(cache.cache_dir.glob("*.partial"))
+    # least recently used entries are evicted
+    for i, key in enumerate(["b", "c"]):
+        os.utime(cache.cache_dir / "a" / "entry.json", (i, i))
+        cache.put(key, [np.zeros((10, 10, 10))], {"task": key})
+    assert cache.get("a") is None
+    assert cache.get("b") is not None
+    assert cache.get("c") is not None
+    # outputs larger than the cache are not stored
+    assert not cache.put("d", [np.zeros(3000)], {"task": "d"})
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
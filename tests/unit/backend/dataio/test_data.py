@@ -10,7 +10,11 @@ from imars3d.backend.dataio.data import (
     _forgiving_reader,
     _get_filelist_by_dir,
     _load_by_file_list,
+    _bin_frame,
     _load_images,
+    _read_tiff_roi,
+    _reduce_images,
+    _reduce_stack,
     Foldernames,
     load_data,
     save_checkpoint,
@@ -22,11 +26,13 @@ from imars3d.backend.dataio.data import (
 
 # third party imports
 import astropy.io.fits as fits
+import h5py
 import numpy as np
 import pytest
 import tifffile
 
 # standard imports
+from collections import deque
 from copy import deepcopy
 from functools import partial
 from pathlib import Path
@@ -94,7 +100,7 @@ def test_Foldernames(tmpdir):
 def test_load_data(
     mock__load_by_file_list: MagicMock, mock__get_filelist_by_dir: MagicMock, mock__extract_rotation_angles: MagicMock
 ):
-    mock__load_by_file_list.return_value = (np.array([1.0]), np.array([2.0]), np.array([3.0]))
+    mock__load_by_file_list.return_value = (np.array([1.0]), np.array([2.0]), np.array([3.0]), np.array([True]))
     mock__get_filelist_by_dir.return_value = ("1", "2", "3")
     mock__extract_rotation_angles.return_value = np.array([4.0])
     # error_0: incorrect input argument types
@@ -149,10 +155,58 @@ def test_load_images(data_fixture):
     fits_filelist = [generic_fits, generic_fits]
     rst = func(filelist=fits_filelist)
     assert rst.shape == (2, 3, 3)
+    # case_3: read only the region of interest
+    rst = func(filelist=tiff_filelist, roi=[0, 2, 1, 3])
+    assert rst.shape == (3, 2, 2)
+    rst = func(filelist=fits_filelist, roi=[0, 2, 1, 3])
+    assert rst.shape == (2, 2, 2)
+    # error_1 case: unsupported executor
+    with pytest.raises(ValueError):
+        func(filelist=tiff_filelist, executor="mpi")
+    # case_2: every executor produces the same stack
+    ref = func(filelist=tiff_filelist, executor="serial")
+    for executor in ("thread", "process"):
+        np.testing.assert_array_equal(func(filelist=tiff_filelist, executor=executor), ref)
+
+
+@pytest.mark.parametrize("max_workers, executor", [(1, "thread"), (2, "serial"), (2, "thread"), (2, "process")])
+def test_load_images_skip_corrupted(data_fixture, tmpdir, max_workers, executor):
+    generic_tiff, good_tiff, metadata_tiff, _ = list(map(str, data_fixture))
+    corrupted_tiff = str(tmpdir / "corrupted.tiff")
+    with open(corrupted_tiff, "w") as f:
+        f.write("not a tiff")
+    mismatched_tiff = str(tmpdir / "mismatched.tiff")
+    tifffile.imwrite(mismatched_tiff, np.ones((4, 4)))
+    filelist = [corrupted_tiff, generic_tiff, mismatched_tiff, good_tiff, metadata_tiff]
+    rst, mask = _load_images(
+        filelist, desc="test", max_workers=max_workers, tqdm_class=None, return_mask=True, executor=executor
+    )
+    np.testing.assert_array_equal(mask, [False, True, False, True, True])
+    assert rst.shape == (3, 3, 3)
+    np.testing.assert_array_equal(rst, np.ones((3, 3, 3)))
+    # nothing readable at all
+    rst, mask = _load_images([corrupted_tiff], desc="test", max_workers=1, return_mask=True)
+    assert rst.size == 0
+    np.testing.assert_array_equal(mask, [False])
+
+
+def test_load_images_memmap(data_fixture, tmpdir):
+    generic_tiff, good_tiff, metadata_tiff, _ = list(map(str, data_fixture))
+    memmap_file = tmpdir / "stack" / "ct.npy"
+    rst = _load_images(
+        [generic_tiff, good_tiff, metadata_tiff], desc="test", max_workers=1, tqdm_class=None, memmap_file=memmap_file
+    )
+    assert isinstance(rst, np.memmap)
+    assert rst.shape == (3, 3, 3)
+    rst.flush()
+    np.testing.assert_array_equal(np.load(str(memmap_file)), np.ones((3, 3, 3)))
 
 
-@mock.patch("imars3d.backend.dataio.data._load_images", return_value="a")
+@mock.patch("imars3d.backend.dataio.data._load_images")
 def test_load_by_file_list(_load_images):
+    _load_images.side_effect = lambda filelist, return_mask=False, **kwargs: (
+        ("a", np.ones(len(filelist), dtype=bool)) if return_mask else "a"
+    )
     # error_0: ct empty
     with pytest.raises(ValueError):
         _load_by_file_list(ct_files=[], ob_files=[])
@@ -160,11 +214,133 @@ def test_load_by_file_list(_load_images):
     with pytest.raises(ValueError):
         _load_by_file_list(ct_files=["dummy"], ob_files=[])
     # case_0: load all three
-    rst = _load_by_file_list(ct_files=["a.tiff"], ob_files=["a.tiff"], dc_files=["a.tiff"])
-    assert rst == ("a", "a", "a")
+    ct, ob, dc, ct_mask = _load_by_file_list(ct_files=["a.tiff"], ob_files=["a.tiff"], dc_files=["a.tiff"])
+    assert (ct, ob, dc) == ("a", "a", "a")
+    np.testing.assert_array_equal(ct_mask, [True])
     # case_1: load only ct and ob
-    rst = _load_by_file_list(ct_files=["a.tiff"], ob_files=["a.tiff"])
-    assert rst == ("a", "a", None)
+    ct, ob, dc, ct_mask = _load_by_file_list(ct_files=["a.tiff"], ob_files=["a.tiff"])
+    assert (ct, ob, dc) == ("a", "a", None)
+    # case_2: the ct mask covers files excluded by fnmatch
+    _, _, _, ct_mask = _load_by_file_list(ct_files=["a.tiff", "b.fits"], ob_files=["a.tiff"], ct_fnmatch="*.tiff")
+    np.testing.assert_array_equal(ct_mask, [True, False])
+
+
+def test_load_data_drops_angles_of_skipped_files(tmpdir):
+    data = np.ones((3, 3))
+    ct_dir = tmpdir / "ct"
+    ct_dir.mkdir()
+    ct_files = [str(ct_dir / f"20191030_expname_0080_{i:03d}_000_1960.tiff") for i in range(3)]
+    for ct_file in ct_files:
+        tifffile.imwrite(ct_file, data)
+    with open(ct_files[1], "w") as f:
+        f.write("corrupted")
+    ob_file = str(tmpdir / "ob.tiff")
+    tifffile.imwrite(ob_file, data)
+    ct, ob, dc, rot_angles = load_data(ct_files=ct_files, ob_files=[ob_file], max_workers=1)
+    assert ct.shape == (2, 3, 3)
+    np.testing.assert_array_almost_equal(rot_angles, [0.0, 2.0])
+
+
+@pytest.mark.parametrize(
+    "layout",
+    [
+        {},
+        {"rowsperstrip": 7},
+        {"rowsperstrip": 5, "compression": "zlib", "predictor": True},
+        {"tile": (32, 32), "compression": "zlib"},
+        {"rowsperstrip": 3, "byteorder": ">"},
+    ],
+)
+def test_read_tiff_roi(tmpdir, layout):
+    data = np.random.default_rng(0).integers(0, 65535, (100, 80)).astype(np.uint16)
+    filename = str(tmpdir / "roi.tiff")
+    tifffile.imwrite(filename, data, **layout)
+    for left, right, top, bottom in [(5, 70, 3, 97), (0, 80, 0, 100), (33, 34, 64, 65), (10, 200, -20, -1)]:
+        expected = data[top:bottom, left:right]
+        np.testing.assert_array_equal(_read_tiff_roi(filename, (left, right, top, bottom)), expected)
+        out = np.zeros_like(expected)
+        _read_tiff_roi(filename, (left, right, top, bottom), out=out)
+        np.testing.assert_array_equal(out, expected)
+
+
+def test_bin_frame():
+    frame = np.arange(30, dtype=np.uint16).reshape(5, 6)
+    binned = _bin_frame(frame, 2)
+    assert binned.dtype == np.uint16
+    # the last row does not fill a complete block and is dropped
+    np.testing.assert_array_equal(binned, np.rint(frame[:4].reshape(2, 2, 3, 2).mean(axis=(1, 3))))
+    binned = _bin_frame(frame.astype(np.float32), 3)
+    np.testing.assert_allclose(binned, [[7.0, 10.0]])
+
+
+def test_load_data_preview(tmpdir):
+    ct_dir = tmpdir / "ct"
+    ct_dir.mkdir()
+    ct_files = [str(ct_dir / f"20191030_expname_0080_{i:03d}_000_1960.tiff") for i in range(5)]
+    for i, ct_file in enumerate(ct_files):
+        tifffile.imwrite(ct_file, np.full((8, 6), i, dtype=np.uint16))
+    ob_file = str(tmpdir / "ob.tiff")
+    tifffile.imwrite(ob_file, np.ones((8, 6), dtype=np.uint16))
+    ct, ob, dc, rot_angles = load_data(
+        ct_files=ct_files, ob_files=[ob_file], max_workers=1, bin_factor=2, angle_stride=2, roi=[0, 6, 2, 8]
+    )
+    assert ct.shape == (3, 3, 3)
+    assert ob.shape == (1, 3, 3)
+    np.testing.assert_array_equal(ct[:, 0, 0], [0, 2, 4])
+    np.testing.assert_array_almost_equal(rot_angles, [0.0, 2.0, 4.0])
+
+
+def test_reduce_stack():
+    stack = np.array([[[1.0]], [[2.0]], [[3.0]], [[4.0]], [[100.0]]])
+    assert _reduce_stack(stack, "median") == 3.0
+    # the outlier is more than one standard deviation away from the median
+    assert _reduce_stack(stack, "clipped_mean", clip_sigma=1.0) == 2.5
+    assert _reduce_stack(stack, "clipped_mean", clip_sigma=10.0) == 22.0
+    with pytest.raises(ValueError):
+        _reduce_stack(stack, "mode")
+
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+@pytest.mark.parametrize("method", ["median", "clipped_mean"])
+def test_reduce_images(tmpdir, compression, method):
+    rng = np.random.default_rng(42)
+    images = rng.integers(0, 1000, size=(7, 20, 12), dtype=np.uint16)
+    filelist = []
+    for i, image in enumerate(images):
+        filelist.append(str(tmpdir / f"ob_{i}.tiff"))
+        tifffile.imwrite(filelist[-1], image, compression=compression, rowsperstrip=3)
+    # a tiny block size forces many blocks of rows
+    block_bytes = 7 * 12 * 2 * 3
+    reduced = _reduce_images(filelist, desc="ob", max_workers=2, method=method, block_bytes=block_bytes)
+    assert reduced.dtype == np.float32
+    np.testing.assert_allclose(reduced, _reduce_stack(images, method), rtol=1e-6)
+    # roi and binning match the full load
+    reduced = _reduce_images(
+        filelist, desc="ob", max_workers=1, method=method, roi=(1, 11, 3, 18), bin_factor=2, block_bytes=block_bytes
+    )
+    full = _load_images(filelist, desc="ob", max_workers=1, roi=(1, 11, 3, 18), bin_factor=2)
+    assert reduced.shape == (7, 5)
+    np.testing.assert_allclose(reduced, _reduce_stack(full, method), rtol=1e-6)
+    # corrupted files are skipped
+    corrupted = str(tmpdir / "corrupted.tiff")
+    with open(corrupted, "w") as f:
+        f.write("not a tiff")
+    reduced = _reduce_images([corrupted] + filelist, desc="ob", max_workers=1, method=method)
+    np.testing.assert_allclose(reduced, _reduce_stack(images, method), rtol=1e-6)
+
+
+def test_load_data_reduction(tmpdir):
+    ct_file = str(tmpdir / "ct.tiff")
+    tifffile.imwrite(ct_file, np.ones((4, 4), dtype=np.uint16))
+    ob_files = [str(tmpdir / f"ob_{i}.tiff") for i in range(3)]
+    dc_files = [str(tmpdir / f"dc_{i}.tiff") for i in range(3)]
+    for i, (ob_file, dc_file) in enumerate(zip(ob_files, dc_files)):
+        tifffile.imwrite(ob_file, np.full((4, 4), 10 * i, dtype=np.uint16))
+        tifffile.imwrite(dc_file, np.full((4, 4), i, dtype=np.uint16))
+    ct, ob, dc, _ = load_data(ct_files=[ct_file], ob_files=ob_files, dc_files=dc_files, reduction="median")
+    assert ct.shape == (1, 4, 4)
+    np.testing.assert_array_equal(ob, np.full((4, 4), 10.0))
+    np.testing.assert_array_equal(dc, np.ones((4, 4)))
 
 
 def test_extract_rotation_angles(data_fixture):
@@ -294,6 +470,17 @@ def test_get_filelist_by_dir(tiff_with_metadata):
         dc_fnmatch=None,
     )
     assert rst == ([ct], [ob], [dc])
+    # same, scanning the headers with a thread pool
+    rst = _get_filelist_by_dir(
+        ct_dir=ct_dir,
+        ob_dir=ob_dir,
+        dc_dir=dc_dir,
+        ct_fnmatch="*.tiff",
+        ob_fnmatch=None,
+        dc_fnmatch=None,
+        max_workers=2,
+    )
+    assert rst == ([ct], [ob], [dc])
     # case_3: load ct, and detect ob from metadata
     rst = _get_filelist_by_dir(
         ct_dir=ct_dir,
@@ -479,5 +666,65 @@ def test_save_checkpoint(tmpdir):
     check_savefiles(outputdir, "chk", num_files=4, has_omega=True)
 
 
+@pytest.mark.parametrize("compression_level", [0, 6])
+def test_save_data_hdf5(tmpdir, compression_level):
+    data = np.arange(60, dtype=np.float32).reshape(3, 4, 5)
+    omegas = np.asarray([1.0, 2.0, 3.0])
+    outputdir = save_data(
+        data=data,
+        outputbase=tmpdir,
+        name="recon",
+        rot_angles=omegas,
+        rot_center=2.5,
+        format="hdf5",
+        compression_level=compression_level,
+        max_workers=2,
+    )
+    assert [item.name for item in outputdir.iterdir()] == ["recon.h5"]
+    with h5py.File(outputdir / "recon.h5", "r") as h5file:
+        dataset = h5file["data"]
+        assert dataset.chunks == (1, 4, 5)
+        assert dataset.compression == ("gzip" if compression_level else None)
+        np.testing.assert_array_equal(dataset[...], data)
+        assert dataset.attrs["rot_center"] == 2.5
+        np.testing.assert_array_equal(h5file["rot_angles"][...], omegas)
+
+
+def test_save_data_hdf5_bounded(tmpdir):
+    data = np.random.default_rng(0).random((11, 4, 5)).astype(np.float32)
+    lengths = []
+
+    class recording_deque(deque):
+        def append(self, item):
+            super().append(item)
+            lengths.append(len(self))
+
+    # the compressed slices waiting for the writer are bounded by a window per thread
+    with mock.patch("imars3d.backend.dataio.data.deque", recording_deque):
+        with mock.patch("imars3d.backend.dataio.data._HDF5_SLICES_PER_WORKER", 2):
+            outputdir = save_data(
+                data=data, outputbase=tmpdir, name="recon", format="hdf5", compression_level=6, max_workers=2
+            )
+    assert len(lengths) == len(data)
+    assert max(lengths) == 4
+    with h5py.File(outputdir / "recon.h5", "r") as h5file:
+        np.testing.assert_array_equal(h5file["data"][...], data)
+
+
+def test_save_checkpoint_zarr(tmpdir):
+    zarr = pytest.importorskip("zarr")
+    data = np.arange(60, dtype=np.float32).reshape(3, 4, 5)
+    omegas = np.asarray([1.0, 2.0, 3.0])
+    outputdir = save_checkpoint(
+        data=data, outputbase=Path(tmpdir), name="chk", rot_angles=omegas, format="zarr", compression_level=3
+    )
+    array = zarr.open_group(str(outputdir / "chk.zarr"), mode="r")["data"]
+    assert array.chunks == (1, 4, 5)
+    np.testing.assert_array_equal(array[...], data)
+    assert array.attrs["rot_angles"] == [1.0, 2.0, 3.0]
+    # no rotation center given
+    assert "rot_center" not in array.attrs
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
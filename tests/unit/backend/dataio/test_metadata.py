@@ -5,6 +5,8 @@ Unit tests for backend metadata auxiliary class.
 # package imports
 from imars3d.backend.dataio.metadata import _extract_metadata_from_tiff
 from imars3d.backend.dataio.metadata import MetaData
+from imars3d.backend.dataio.metadata import DARK_CURRENT_TAGS, INSTRUMENT_TAGS
+from imars3d.backend.dataio.metadata import header_values, match_headers, scan_tiff_headers
 
 # third party imports
 import pytest
@@ -96,5 +98,44 @@ def test_extract_metadata_from_tiff(data_fixture):
     assert _extract_metadata_from_tiff(test_filename, test_index) == ref
 
 
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_scan_tiff_headers(data_fixture, max_workers):
+    ct, ob, dc, ct_alt, fits = list(map(str, data_fixture))
+    table = scan_tiff_headers([ct, ob, dc, ct_alt, "does_not_exist.tiff"], max_workers=max_workers)
+    assert len(table) == 5
+    assert list(table["filename"][:2]) == [ct, ob]
+    assert list(table["65026"]) == ["Test", "Test", "Test", "Test", ""]
+    # missing tags and unreadable files are empty entries
+    assert table["65066"][2] == ""
+    assert list(table["readable"]) == [True, True, True, True, False]
+    np.testing.assert_array_equal(header_values(table, 65027), [70.0, 70.0, 70.0, 71.0, np.nan])
+    # duplicated tags are read once
+    assert scan_tiff_headers([ct], tags=[65027, 65027]).dtype.names == ("filename", "readable", "65027")
+
+
+def test_match_headers(data_fixture):
+    ct, ob, dc, ct_alt, fits = list(map(str, data_fixture))
+    table = scan_tiff_headers([ct, ob, dc, ct_alt])
+    # same rules as MetaData
+    np.testing.assert_array_equal(match_headers(table, table[0], INSTRUMENT_TAGS), [True, True, True, False])
+    np.testing.assert_array_equal(match_headers(table, table[3], INSTRUMENT_TAGS), [False, False, False, True])
+    np.testing.assert_array_equal(match_headers(table, table[0], DARK_CURRENT_TAGS), [True, True, True, False])
+    # string values must be equal
+    table["65026"][1] = "Other"
+    assert not match_headers(table, table[0], INSTRUMENT_TAGS)[1]
+
+
+def test_match_headers_unreadable(data_fixture, tmp_path, caplog):
+    ct, ob, dc, ct_alt, fits = list(map(str, data_fixture))
+    corrupt = tmp_path / "corrupt.tiff"
+    corrupt.write_bytes(b"not a tiff")
+    table = scan_tiff_headers([ct, ob, str(corrupt), dc])
+    # unreadable files never match, a readable file without the slit tags does
+    np.testing.assert_array_equal(match_headers(table, table[0], INSTRUMENT_TAGS), [True, True, False, True])
+    assert str(corrupt) in caplog.text
+    with pytest.raises(ValueError, match="reference"):
+        match_headers(table, table[2], INSTRUMENT_TAGS)
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
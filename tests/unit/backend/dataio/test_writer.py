@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the background writer.
+"""
+# package imports
+from imars3d.backend.dataio.data import save_checkpoint
+from imars3d.backend.dataio.writer import submit_write, wait_for_pending_writes
+
+# third party imports
+import numpy as np
+import pytest
+
+# standard imports
+from concurrent.futures import Future
+from pathlib import Path
+import threading
+
+
+def test_submit_write():
+    data = np.zeros(3)
+    started, release = threading.Event(), threading.Event()
+
+    def write():
+        started.set()
+        release.wait()
+        return "done"
+
+    handle = submit_write(write, readonly=[data, None])
+    started.wait()
+    # the array is immutable while being written
+    with pytest.raises(ValueError):
+        data[0] = 1.0
+    assert not handle.done()
+    release.set()
+    assert wait_for_pending_writes() == [handle]
+    assert handle.result() == "done"
+    assert data.flags.writeable
+    assert wait_for_pending_writes() == []
+
+
+def test_submit_write_failure():
+    data = np.zeros(3)
+
+    def write():
+        raise OSError("disk full")
+
+    handle = submit_write(write, readonly=[data])
+    wait_for_pending_writes()
+    with pytest.raises(OSError, match="disk full"):
+        handle.result()
+    assert data.flags.writeable
+
+
+def test_save_checkpoint_background(tmpdir):
+    data = np.arange(60, dtype=np.float32).reshape(3, 4, 5)
+    handle = save_checkpoint(data=data, outputbase=Path(tmpdir), name="chk", format="hdf5", background=True)
+    assert isinstance(handle, Future)
+    wait_for_pending_writes()
+    assert (handle.result() / "chk.h5").exists()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
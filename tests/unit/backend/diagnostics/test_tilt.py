@@ -282,6 +282,22 @@ def test_apply_tilt_correction():
         apply_tilt_correction(arrays=imgs_incorrect, tilt=tilt)
 
 
+def test_apply_tilt_correction_output():
+    rng = np.random.default_rng(0)
+    imgs = rng.random((3, 32, 32))
+    expected = apply_tilt_correction(arrays=imgs, tilt=1.0, max_workers=1, dtype="float64")
+    # float32 by default instead of the double precision of skimage
+    rst = apply_tilt_correction(arrays=imgs, tilt=1.0, max_workers=1)
+    assert rst.dtype == np.float32
+    np.testing.assert_allclose(rst, expected, rtol=1e-6)
+    stack = imgs.copy()
+    assert apply_tilt_correction(arrays=stack, tilt=1.0, max_workers=1, inplace=True) is stack
+    np.testing.assert_array_equal(stack, expected)
+    out = np.empty((32, 32), dtype=np.float32)
+    assert apply_tilt_correction(arrays=imgs[0], tilt=1.0, out=out) is out
+    np.testing.assert_array_equal(out, rst[0])
+
+
 def test_tilt_correction():
     # error_0: incorrect dimension
     with pytest.raises(ValueError):
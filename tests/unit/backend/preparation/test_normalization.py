@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
 # package imports
-from imars3d.backend.preparation.normalization import minus_log, normalization
+from imars3d.backend.corrections.beam_hardening import beam_hardening_correction as beam_hardening
+from imars3d.backend.preparation.normalization import fused_normalization, minus_log, normalization
 from imars3d.backend.workflow.engine import WorkflowEngineAuto
 
 # third party imports
+from algotom.prep.correction import beam_hardening_correction
 import numpy as np
 import pytest
 from scipy.ndimage import gaussian_filter
@@ -12,6 +14,7 @@ import skimage
 # standard library
 import json
 from pathlib import Path
+from unittest import mock
 
 
 def generate_fake_darkfield(
@@ -124,6 +127,14 @@ def test_normalization_bright_dark():
     assert diff < 0.01
 
 
+def test_normalization_reduced_flats_darks():
+    """flats and darks already reduced to a single image, e.g. while loading."""
+    raw, darks, flats, proj = prepare_synthetic_data()
+    proj_stacks = normalization(arrays=raw, flats=flats, darks=darks)
+    proj_reduced = normalization(arrays=raw, flats=np.median(flats, axis=0), darks=np.median(darks, axis=0))
+    np.testing.assert_allclose(proj_reduced, proj_stacks)
+
+
 def test_normalization_no_darks():
     """Test normalization routine without providing dark field images."""
     raw, _, flats, proj = prepare_synthetic_data()
@@ -142,6 +153,93 @@ def test_normalization_no_darks():
     assert np.all(proj_imars3d >= 0) and np.all(proj_imars3d <= 1)
 
 
+def test_normalization_output():
+    """normalized images written into a given array, or of a given data type."""
+    rng = np.random.default_rng(0)
+    raw = rng.integers(1000, 4000, size=(5, 8, 9)).astype(np.uint16)
+    flats = rng.integers(4000, 5000, size=(3, 8, 9)).astype(np.uint16)
+    darks = rng.integers(0, 100, size=(2, 8, 9)).astype(np.uint16)
+    expected = normalization(arrays=raw, flats=flats, darks=darks)
+    assert expected.dtype == np.float32
+    arrays = raw.astype(np.float32)
+    assert normalization(arrays=arrays, flats=flats, darks=darks, inplace=True) is arrays
+    np.testing.assert_array_equal(arrays, expected)
+    out = np.empty(raw.shape, dtype=np.float64)
+    assert normalization(arrays=raw, flats=flats, darks=darks, out=out) is out
+    np.testing.assert_allclose(out, expected, rtol=1e-6)
+    rst = normalization(arrays=raw, flats=flats, darks=darks, dtype="float64")
+    np.testing.assert_array_equal(rst, out)
+    # single image
+    np.testing.assert_array_equal(normalization(arrays=raw[0], flats=flats, darks=darks), expected[0])
+    # the raw counts are integers
+    with pytest.raises(ValueError):
+        normalization(arrays=raw, flats=flats, darks=darks, inplace=True)
+    with pytest.raises(ValueError):
+        normalization(arrays=raw, flats=flats, darks=darks, dtype="same")
+
+
+def prepare_random_stack(seed: int = 7):
+    """raw images, darks and flats with normalized values in (0, 1)"""
+    rng = np.random.default_rng(seed)
+    darks = rng.uniform(90, 110, (4, 16, 24))
+    flats = rng.uniform(900, 1100, (4, 16, 24))
+    proj = rng.uniform(0.05, 0.95, (5, 16, 24))
+    raw = proj * (np.median(flats, axis=0) - np.median(darks, axis=0)) + np.median(darks, axis=0)
+    return raw, darks, flats
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_fused_normalization(max_workers):
+    """fused normalization gives the same result as the separate filters."""
+    raw, darks, flats = prepare_random_stack()
+    expected = normalization(arrays=raw, flats=flats, darks=darks)
+    # small blocks to exercise the blocking
+    with mock.patch("imars3d.backend.preparation.normalization._BLOCK_BYTES", raw[0].nbytes * 3):
+        normalized = fused_normalization(
+            arrays=raw, flats=flats, darks=darks, minus_log=False, max_workers=max_workers
+        )
+        assert normalized.dtype == np.float32
+        np.testing.assert_array_equal(normalized, expected)
+        np.testing.assert_allclose(
+            fused_normalization(arrays=raw, flats=flats, darks=darks, max_workers=max_workers),
+            minus_log(arrays=expected),
+            rtol=1e-6,
+        )
+        # beam hardening correction on the normalized images
+        hardened = fused_normalization(
+            arrays=raw, flats=flats, darks=darks, beam_hardening=True, q=0.1, n=3.0, minus_log=False
+        )
+        np.testing.assert_array_equal(hardened, beam_hardening(arrays=expected, q=0.1, n=3.0))
+        np.testing.assert_allclose(
+            hardened, [beam_hardening_correction(image, 0.1, 3.0) for image in expected.astype(float)], rtol=1e-5
+        )
+        # clipping only when asked for
+        clipped = fused_normalization(arrays=raw, flats=flats, darks=darks, minus_log=False, clip_min=0.5)
+        np.testing.assert_array_equal(clipped, np.maximum(expected, np.float32(0.5)))
+
+
+def test_fused_normalization_errors():
+    """fused normalization raises the errors of the separate filters."""
+    raw, darks, flats = prepare_random_stack()
+    # a pixel darker than the dark field
+    raw[3, 2, 2] = 0.0
+    with pytest.raises(ValueError) as e:
+        minus_log(arrays=normalization(arrays=raw, flats=flats, darks=darks))
+    with mock.patch("imars3d.backend.preparation.normalization._BLOCK_BYTES", raw[0].nbytes * 2):
+        with pytest.raises(ValueError) as fused_error:
+            fused_normalization(arrays=raw, flats=flats, darks=darks, max_workers=2)
+    assert str(fused_error.value) == str(e.value)
+    # no error without the log, or with the values clipped
+    assert fused_normalization(arrays=raw, flats=flats, darks=darks, minus_log=False).min() < 0
+    assert np.isfinite(fused_normalization(arrays=raw, flats=flats, darks=darks, clip_min=1e-6)).all()
+    # beam hardening correction of images not normalized
+    raw[1, 2, 2] = 3000.0
+    with pytest.raises(ValueError, match="must be normalized"):
+        fused_normalization(arrays=raw, flats=flats, darks=darks, beam_hardening=True)
+    with pytest.raises(ValueError, match="must be normalized"):
+        beam_hardening(arrays=normalization(arrays=raw, flats=flats, darks=darks))
+
+
 class TestMinusLog:
     @pytest.mark.parametrize("ncore", [1, 2])
     def test_execution(self, ncore: int) -> None:
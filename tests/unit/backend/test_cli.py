@@ -21,6 +21,25 @@ def test_good(JSON_DIR):
     main_backend([str(good_json)])
 
 
+def test_good_dag_scheduler(JSON_DIR):
+    good_json = JSON_DIR / "good_interactive.json"
+
+    main_backend([str(good_json), "--scheduler", "dag", "--workers", "2"])
+
+
+def test_resume_without_snapshot(tmpdir):
+    assert main_backend(["--resume", str(tmpdir)]) == 1
+    with pytest.raises(SystemExit):
+        main_backend([])
+
+
+def test_resume_with_configfile(JSON_DIR, tmpdir, capsys):
+    # an edited configuration would silently be replaced by the snapshotted one
+    with pytest.raises(SystemExit):
+        main_backend([str(JSON_DIR / "good_interactive.json"), "--resume", str(tmpdir)])
+    assert "cannot be given with --resume" in capsys.readouterr().err
+
+
 @pytest.mark.datarepo
 def test_outputdir_not_writable(TIFF_RANDOM):
     assert main_CG1D(TIFF_RANDOM, "this/dir/doesnt/exist") == 1
@@ -0,0 +1,98 @@
+# package imports
+from imars3d.backend.util import pool
+from imars3d.backend.util.pool import get_pool, pool_imap, pool_map, shutdown_pool, warm_pool, worker_pids
+
+# third party imports
+import pytest
+
+# standard imports
+from concurrent.futures.process import BrokenProcessPool
+import os
+import time
+
+
+def slow_abs(value):
+    time.sleep(0.05)
+    return abs(value)
+
+
+@pytest.fixture
+def shared_pool():
+    shutdown_pool()
+    yield
+    shutdown_pool()
+
+
+def test_pool_map(shared_pool):
+    bases, exponents = list(range(23)), [2] * 23
+    for chunksize in (1, 4, 30):
+        assert pool_map(pow, bases, exponents, max_workers=2, chunksize=chunksize) == [b**2 for b in bases]
+    assert pool_map(pow, [], [], max_workers=2) == []
+    # consumed lazily and in order
+    assert list(pool_imap(divmod, range(10), [3] * 10, max_workers=3, chunksize=2)) == [
+        divmod(i, 3) for i in range(10)
+    ]
+
+
+def test_pool_is_reused(shared_pool):
+    first = get_pool(1)
+    pool_map(abs, [-1, -2], max_workers=1)
+    assert get_pool(1) is first
+    # a larger map starts a larger pool, smaller maps keep using it
+    larger = get_pool(2)
+    assert larger is not first
+    assert get_pool(1) is larger
+    # the processes are kept between maps
+    pool_map(abs, range(8), max_workers=2)
+    pids = set(larger._processes)
+    pool_map(abs, range(8), max_workers=2)
+    assert set(larger._processes) == pids
+    shutdown_pool()
+    assert get_pool(1) is not larger
+
+
+def test_warm_pool(shared_pool):
+    assert warm_pool(2, modules=("json",)) == 2
+    assert len(get_pool(2)._processes) == 2
+
+
+def test_worker_pids(shared_pool):
+    assert worker_pids() == []
+    warm_pool(2, modules=("json",))
+    assert worker_pids() == sorted(get_pool(2)._processes)
+    shutdown_pool()
+    assert worker_pids() == []
+
+
+def test_broken_pool(shared_pool):
+    broken = get_pool(1)
+    with pytest.raises(BrokenProcessPool):
+        pool_map(os._exit, [1], max_workers=1)
+    assert pool._pool is None
+    assert get_pool(1) is not broken
+    assert pool_map(abs, [-3], max_workers=1) == [3]
+
+
+def test_replaced_pool(shared_pool):
+    first = get_pool(1)
+    # a map started on the first pool carries on with the larger one
+    results = pool_imap(abs, range(-6, 0), max_workers=1)
+    assert next(results) == 6
+    pool_map(abs, range(8), max_workers=3)
+    # the workers of the replaced pool are stopped
+    assert len(worker_pids()) == 3
+    with pytest.raises(RuntimeError):
+        first.submit(abs, -1)
+    assert list(results) == [5, 4, 3, 2, 1]
+
+
+def test_broken_pool_spares_other_maps(shared_pool):
+    # a map still running on a replaced pool when the shared one breaks
+    results = pool_imap(slow_abs, range(-6, 0), max_workers=2)
+    assert next(results) == 6
+    broken = get_pool(3)
+    with pytest.raises(BrokenProcessPool):
+        pool_map(os._exit, [1], max_workers=3)
+    assert pool._pool is None
+    assert list(results) == [5, 4, 3, 2, 1]
+    assert get_pool(1) is not broken
@@ -0,0 +1,104 @@
+# package imports
+from imars3d.backend.util import shared
+from imars3d.backend.util.pool import shutdown_pool
+from imars3d.backend.util.shared import map_slice_groups, map_slices
+
+# third party imports
+import numpy as np
+import pytest
+
+# standard imports
+from functools import partial
+import glob
+import os
+
+
+def _leftover_blocks():
+    return set(glob.glob(os.path.join(shared._SHARED_DIR or "/tmp", "imars3d-*.bin")))
+
+
+@pytest.fixture(scope="module", autouse=True)
+def shared_pool():
+    yield
+    shutdown_pool()
+
+
+def _scale(image, factor):
+    return image * factor
+
+
+def _halve_inplace(image):
+    image /= 2
+    return image
+
+
+def _column_sums(image):
+    return image.sum(axis=0, dtype=np.float32)
+
+
+def _difference(first, second):
+    return float(np.abs(first - second).sum())
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+@pytest.mark.parametrize("axis", [0, 1])
+def test_map_slices(max_workers, axis):
+    before = _leftover_blocks()
+    arrays = np.arange(5 * 6 * 7, dtype=np.uint16).reshape(5, 6, 7)
+    rst = map_slices(partial(_scale, factor=0.5), arrays, axis=axis, max_workers=max_workers, chunksize=2)
+    np.testing.assert_array_equal(rst, arrays * 0.5)
+    assert rst.dtype == np.float64
+    # the shape and dtype of the output follow the result of the function
+    rst = map_slices(_column_sums, arrays, axis=axis, max_workers=max_workers)
+    expected = arrays.sum(axis=1 if axis == 0 else 0).astype(np.float32)
+    assert rst.dtype == np.float32
+    np.testing.assert_array_equal(rst, expected if axis == 0 else expected.T)
+    # functions modifying their input do not modify the stack
+    arrays = arrays.astype(np.float64)
+    rst = map_slices(_halve_inplace, arrays, axis=axis, max_workers=max_workers)
+    np.testing.assert_array_equal(rst * 2, arrays)
+    assert _leftover_blocks() == before
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_map_slices_inplace(max_workers):
+    arrays = np.arange(4 * 5 * 3, dtype=np.float32).reshape(4, 5, 3)
+    expected = arrays * 2
+    rst = map_slices(partial(_scale, factor=2), arrays, axis=1, out=arrays, max_workers=max_workers)
+    assert rst is arrays
+    np.testing.assert_array_equal(arrays, expected)
+    with pytest.raises(ValueError):
+        map_slices(_column_sums, arrays, out=arrays, max_workers=max_workers)
+
+
+def test_map_slices_memmap(tmpdir):
+    filename = str(tmpdir / "stack.npy")
+    arrays = np.lib.format.open_memmap(filename, mode="w+", dtype=np.float32, shape=(6, 4, 4))
+    arrays[:] = np.random.default_rng(0).random(arrays.shape)
+    expected = arrays * 3
+    # the workers attach to the file instead of a copy, and write the results back to it
+    assert shared._file_block(arrays, writable=True) is not None
+    assert shared._file_block(arrays[1:]) is None
+    rst = map_slices(partial(_scale, factor=3), arrays, out=arrays, max_workers=2)
+    assert rst is arrays
+    np.testing.assert_allclose(np.load(filename), expected)
+    # copy-on-write changes are not in the file, they are copied
+    cow = np.load(filename, mmap_mode="c")
+    assert shared._file_block(cow) is None
+    cow[0] = -1
+    np.testing.assert_allclose(map_slices(partial(_scale, factor=1), cow, max_workers=2)[0], -1)
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_map_slice_groups(max_workers):
+    arrays = np.random.default_rng(1).random((8, 3, 3))
+    pairs = list(zip(range(4), range(4, 8)))
+    rst = map_slice_groups(_difference, arrays, pairs, max_workers=max_workers, chunksize=1)
+    assert rst == pytest.approx([_difference(arrays[i], arrays[j]) for i, j in pairs])
+    rst = map_slice_groups(_difference, arrays, [(0, 0), (1, 2)], axis=2, max_workers=max_workers)
+    assert rst == pytest.approx([0.0, _difference(arrays[:, :, 1], arrays[:, :, 2])])
+    assert map_slice_groups(_difference, arrays, [], max_workers=max_workers) == []
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
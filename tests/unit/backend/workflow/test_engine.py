@@ -1,5 +1,9 @@
 # package imports
+from imars3d.backend.dataio.writer import submit_write
+from imars3d.backend.util.pool import pool_map, shutdown_pool
 from imars3d.backend.workflow.engine import WorkflowEngineAuto, WorkflowValidationError
+from imars3d.backend.workflow.profiler import TaskProfiler
+from imars3d.backend.workflow.streaming import SEPARABLE_FUNCTIONS, RowSeparable
 
 # third party imports
 import numpy as np
@@ -9,7 +13,20 @@ from param.parameterized import String as StringParam
 # standard library imports
 from copy import deepcopy
 import json
+from pathlib import Path
 import pytest
+import threading
+import time
+from typing import Iterable, Optional
+from unittest import mock
+
+
+def spin(seconds: float) -> float:
+    r"""busy loop using about ``seconds`` of CPU time"""
+    start = time.process_time()
+    while time.process_time() - start < seconds:
+        pass
+    return seconds
 
 
 class load_data(ParameterizedFunction):
@@ -65,6 +82,127 @@ class reconstruction_with_default(ParameterizedFunction):
         ]
 
 
+class checkpoint(ParameterizedFunction):
+    r"""mock writing a checkpoint in the background"""
+
+    ct = Parameter(default=None)
+
+    def __call__(self, **params):
+        def write():
+            time.sleep(0.1)
+            return "checkpoint_dir"
+
+        return submit_write(write, readonly=[params["ct"]])
+
+
+class load_stacks(ParameterizedFunction):
+    r"""mock loading radiographs, open beams and dark currents"""
+
+    ct_files = Parameter(default=None)
+
+    def __call__(self, **params):
+        size = len(params["ct_files"])
+        return np.arange(size, dtype=float), np.ones(size), np.zeros(size)
+
+
+class load_radiographs(ParameterizedFunction):
+    r"""mock loading radiographs, open beams and dark currents, within a range of transmissions"""
+
+    ct_files = Parameter(default=None)
+    transmission = Parameter(default=(0.05, 0.95))
+
+    def __call__(self, **params):
+        rng = np.random.default_rng(0)
+        dc = rng.uniform(90.0, 110.0, (3, 6, 5))
+        ob = rng.uniform(900.0, 1100.0, (3, 6, 5))
+        low, high = params.get("transmission", (0.05, 0.95))
+        proj = rng.uniform(low, high, (len(params["ct_files"]), 6, 5))
+        return proj * 900.0 + 110.0, ob, dc
+
+
+class scale(ParameterizedFunction):
+    r"""mock a slow filter"""
+
+    arrays = Parameter(default=None)
+    factor = Parameter(default=2.0)
+
+    def __call__(self, **params):
+        time.sleep(0.1)
+        return params["arrays"] * params.get("factor", 2.0)
+
+
+class normalize(ParameterizedFunction):
+    r"""mock normalization"""
+
+    ct = Parameter(default=None)
+    ob = Parameter(default=None)
+    dc = Parameter(default=None)
+
+    def __call__(self, **params):
+        return (params["ct"] - params["dc"]) / (params["ob"] - params["dc"])
+
+
+class load_volume(ParameterizedFunction):
+    r"""mock loading a stack of radiographs and a reduced open beam"""
+
+    ct_files = Parameter(default=None)
+
+    def __call__(self, **params):
+        rng = np.random.default_rng(0)
+        return rng.random((4, 10, 3)), 1.0 + rng.random((10, 3))
+
+
+class offset(ParameterizedFunction):
+    r"""mock a pointwise filter modifying its input in place"""
+
+    arrays = Parameter(default=None)
+    flats = Parameter(default=None)
+
+    def __call__(self, **params):
+        params["arrays"] += params["flats"]
+        return params["arrays"]
+
+
+class smooth(ParameterizedFunction):
+    r"""mock a filter with a kernel along the detector rows"""
+
+    arrays = Parameter(default=None)
+
+    def __call__(self, **params):
+        padded = np.pad(params["arrays"], ((0, 0), (1, 1), (0, 0)), mode="edge")
+        return (padded[:, :-2] + padded[:, 1:-1] + padded[:, 2:]) / 3.0
+
+
+class project(ParameterizedFunction):
+    r"""mock a reconstruction, returning the detector rows along the first axis"""
+
+    arrays = Parameter(default=None)
+
+    def __call__(self, **params):
+        return params["arrays"].sum(axis=0)
+
+
+def _task(name: str, function: str, inputs: Optional[dict] = None, outputs: Iterable[str] = ()) -> dict:
+    r"""task of a test configuration, ``function`` is the name of a mock of this module, or a full path"""
+    function = function if "." in function else f"{__name__}.{function}"
+    return {"name": name, "function": function, "inputs": dict(inputs or {}), "outputs": list(outputs)}
+
+
+def _workflow(config: dict, **kwargs) -> WorkflowEngineAuto:
+    r"""workflow engine accepting the first and last tasks of the configuration as its load and save tasks"""
+    workflow = WorkflowEngineAuto(config, **kwargs)
+    workflow.load_data_function = config["tasks"][0]["function"]
+    workflow.save_data_function = config["tasks"][-1]["function"]
+    return workflow
+
+
+def _run_workflow(config: dict, **kwargs) -> WorkflowEngineAuto:
+    r"""run the workflow of a test configuration, see ``_workflow``"""
+    workflow = _workflow(config, **kwargs)
+    workflow.run()
+    return workflow
+
+
 @pytest.fixture(scope="module")
 def config():
     config_str = """{
@@ -121,10 +259,7 @@ def config():
 
 class TestWorkflowEngineAuto:
     def test_dryrun(self, config):
-        workflow = WorkflowEngineAuto(config)
-        workflow.load_data_function = f"{__name__}.load_data"
-        workflow.save_data_function = f"{__name__}.save_data"
-        workflow._dryrun()
+        _workflow(config)._dryrun()
 
     def test_dryrun_missing_input(self, config):
         # Error: task for which implicit ct has not been computed yet
@@ -132,27 +267,372 @@ class TestWorkflowEngineAuto:
         config_bad = deepcopy(config)
         config_bad["tasks"][0]["outputs"][0] = "ob"
         config_bad["tasks"].insert(1, task0)
-        workflow = WorkflowEngineAuto(config_bad)
-        workflow.load_data_function = f"{__name__}.load_data"
-        workflow.save_data_function = f"{__name__}.save_data"
         with pytest.raises(WorkflowValidationError, match="ct for task task0 are missing"):
-            workflow._dryrun()
+            _workflow(config_bad)._dryrun()
 
     def test_dryrun_missing_rot(self, config):
         # Error: task for which templated rot_center has not been computed yet
         config_bad = deepcopy(config)
         config_bad["tasks"][2].pop("inputs")
-        workflow = WorkflowEngineAuto(config_bad)
-        workflow.load_data_function = f"{__name__}.load_data"
-        workflow.save_data_function = f"{__name__}.save_data"
         with pytest.raises(WorkflowValidationError, match="rot_center for task task4 are missing"):
-            workflow._dryrun()
+            _workflow(config_bad)._dryrun()
 
     def test_run(self, config):
-        workflow = WorkflowEngineAuto(config)
-        workflow.load_data_function = f"{__name__}.load_data"
-        workflow.save_data_function = f"{__name__}.save_data"
+        _run_workflow(config)
+
+    def test_run_background_write(self, config):
+        config = deepcopy(config)
+        config["tasks"].insert(1, _task("checkpoint", "checkpoint", outputs=["checkpoint_dir"]))
+        workflow = _run_workflow(config)
+        # the handle is replaced by the result of the write
+        assert workflow.registry["checkpoint_dir"] == "checkpoint_dir"
+
+    def test_dag_scheduler(self, config):
+        config = deepcopy(config)
+        config["tasks"] = [
+            _task("load", "load_stacks", {"ct_files": ["ct1", "ct2", "ct3"]}, ["ct", "ob", "dc"]),
+            _task("scale-ct", "scale", {"arrays": "ct"}, ["ct"]),
+            _task("scale-ob", "scale", {"arrays": "ob", "factor": 3.0}, ["ob"]),
+            _task("scale-dc", "scale", {"arrays": "dc"}, ["dc"]),
+            _task("normalize", "normalize", {}, ["ct"]),
+            _task("save", "save_data"),
+        ]
+        config["keep"] = ["ct", "ob", "dc"]
+        workflow = _workflow(config)
+        workflow._registry = {"workingdir": "/tmp"}
+        _, dependencies = workflow._task_dependencies(config["tasks"])
+        assert dependencies == [set(), {0}, {0}, {0}, {1, 2, 3}, {4}]
+        # the three filters only get past the barrier if they run concurrently
+        original = scale.__call__
+        barrier = threading.Barrier(3, timeout=10)
+
+        def concurrent(self, **params):
+            barrier.wait()
+            return original(self, **params)
+
+        sequential = _run_workflow(config, scheduler="sequential")
+        with mock.patch.object(scale, "__call__", concurrent):
+            dag = _run_workflow(config, scheduler="dag", max_workers=3)
+        # same results
+        for key in ("ct", "ob", "dc"):
+            np.testing.assert_array_equal(dag.registry[key], sequential.registry[key])
+        with pytest.raises(ValueError, match="Unknown scheduler"):
+            WorkflowEngineAuto(config, scheduler="random")
+
+    @pytest.mark.parametrize("scheduler", WorkflowEngineAuto.schedulers)
+    def test_release_dead_values(self, config, scheduler):
+        config = deepcopy(config)
+        config["tasks"] = [
+            _task("load", "load_stacks", {"ct_files": ["ct1", "ct2"]}, ["ct", "ob", "dc"]),
+            _task("normalize", "normalize", {}, ["ct"]),
+            _task("checkpoint", "checkpoint", {}, ["checkpoint_dir"]),
+            _task("save", "save_data"),
+        ]
+        config["keep"] = ["dc"]
+        workflow = _workflow(config, scheduler=scheduler)
+        tasks = config["tasks"]
+        workflow._registry = {"workingdir": "/tmp"}
+        reads, _ = workflow._task_dependencies(tasks)
+        # ob is dead after normalization, ct after the save, dc is kept
+        assert workflow._dead_values(tasks, reads) == [("ob", {1}), ("ct", {2, 3})]
         workflow.run()
+        assert "ob" not in workflow.registry
+        assert "ct" not in workflow.registry
+        np.testing.assert_array_equal(workflow.registry["dc"], np.zeros(2))
+        # outputs that are never read are results
+        assert workflow.registry["checkpoint_dir"] == "checkpoint_dir"
+        # the configuration entries stay in the registry, "keep" is not a registry value
+        assert workflow.registry["workingdir"] == config["workingdir"]
+        assert "keep" not in workflow.registry
+
+    @pytest.mark.parametrize("scheduler", WorkflowEngineAuto.schedulers)
+    def test_memoize(self, config, scheduler, tmpdir):
+        config = deepcopy(config)
+        config["workingdir"] = str(tmpdir)
+        config["memoize"] = {"max_gb": 1}
+        config["keep"] = ["ct"]
+        config["tasks"] = [
+            _task("load", "load_stacks", {"ct_files": ["ct1", "ct2"]}, ["ct", "ob", "dc"]),
+            _task("normalize", "normalize", {}, ["ct"]),
+            _task("scale", "scale", {"arrays": "ct", "factor": 2.0}, ["ct"]),
+            _task("save", "save_data"),
+        ]
+
+        def run():
+            return _run_workflow(config, scheduler=scheduler).registry["ct"]
+
+        expected = np.array([0.0, 2.0])
+        np.testing.assert_array_equal(run(), expected)
+        assert len(list(Path(tmpdir, "task_cache").iterdir())) == 3  # the save task is never cached
+        # nothing changed, every task is replayed
+        failing = mock.Mock(side_effect=RuntimeError("executed"))
+        with mock.patch.object(load_stacks, "__call__", failing), mock.patch.object(normalize, "__call__", failing):
+            with mock.patch.object(scale, "__call__", failing):
+                np.testing.assert_array_equal(run(), expected)
+        # changing a late parameter only executes the tasks from there on
+        config["tasks"][2]["inputs"]["factor"] = 3.0
+        with mock.patch.object(load_stacks, "__call__", failing), mock.patch.object(normalize, "__call__", failing):
+            np.testing.assert_array_equal(run(), 1.5 * expected)
+        # changing an early parameter invalidates the results depending on it
+        config["tasks"][0]["inputs"]["ct_files"] = ["ct1", "ct2", "ct3"]
+        np.testing.assert_array_equal(run(), [0.0, 3.0, 6.0])
+
+    @pytest.mark.parametrize("scheduler", WorkflowEngineAuto.schedulers)
+    def test_resume(self, config, scheduler, tmpdir):
+        config = deepcopy(config)
+        config["workingdir"] = str(tmpdir)
+        config["keep"] = ["ct"]
+        config["tasks"] = [
+            _task("load", "load_stacks", {"ct_files": ["ct1", "ct2"]}, ["ct", "ob", "dc"]),
+            _task("normalize", "normalize", {}, ["ct"]),
+            _task("scale", "scale", {"arrays": "ct", "factor": 2.0}, ["ct"]),
+            _task("scale-again", "scale", {"arrays": "ct", "factor": 3.0}, ["ct"]),
+            _task("save", "save_data"),
+        ]
+
+        def run(**kwargs):
+            return _run_workflow(config, scheduler=scheduler, **kwargs)
+
+        expected = np.array([0.0, 6.0])
+        # the run dies in the last filter
+        original = scale.__call__
+        calls = []
+
+        def dies_the_second_time(self, **params):
+            calls.append(params["factor"])
+            if len(calls) == 2:
+                raise MemoryError("killed")
+            return original(self, **params)
+
+        with mock.patch.object(scale, "__call__", dies_the_second_time):
+            with pytest.raises(MemoryError):
+                run(snapshot=True)
+        snapshot_dir = Path(tmpdir) / "snapshot"
+        manifest = json.loads((snapshot_dir / "manifest.json").read_text())
+        assert [name for _, name in manifest["completed"]] == ["load", "normalize", "scale"]
+        # the flats are no longer needed, only the current ct is kept
+        assert sorted(manifest["entries"]) == ["ct"]
+        assert len(list(snapshot_dir.glob("*.npy"))) == 1
+        # only the incomplete tasks run again
+        failing = mock.Mock(side_effect=RuntimeError("executed"))
+        with mock.patch.object(load_stacks, "__call__", failing), mock.patch.object(normalize, "__call__", failing):
+            workflow = run(resume=True)
+        np.testing.assert_array_equal(workflow.registry["ct"], expected)
+        # the snapshot of a successful run is removed
+        assert not (snapshot_dir / "manifest.json").exists()
+        # a snapshot of another configuration is not resumed
+        with mock.patch.object(scale, "__call__", failing):
+            with pytest.raises(RuntimeError):
+                run(snapshot=True)
+        config["tasks"][3]["inputs"]["factor"] = 0.5
+        np.testing.assert_array_equal(run(resume=True).registry["ct"], [0.0, 1.0])
+
+    @pytest.mark.parametrize("scheduler", WorkflowEngineAuto.schedulers)
+    def test_profile(self, config, scheduler, tmpdir):
+        config = deepcopy(config)
+        config["workingdir"] = str(tmpdir)
+        config["tasks"] = [
+            _task("load", "load_stacks", {"ct_files": ["ct1", "ct2"]}, ["ct", "ob", "dc"]),
+            _task("normalize", "normalize", outputs=["ct"]),
+            _task("save", "save_data"),
+        ]
+        workflow = _run_workflow(config, scheduler=scheduler, trace=True)
+        report_path, trace_path = workflow.profile_paths()
+        assert report_path == Path(tmpdir, "imars3d.profile.json")
+        with open(report_path) as f:
+            report = json.load(f)
+        assert report["scheduler"] == scheduler
+        assert [record["name"] for record in report["tasks"]] == ["load", "normalize", "save"]
+        normalize = report["tasks"][1]
+        assert normalize["inputs"]["ob"] == {"shape": [2], "dtype": "float64", "nbytes": 16}
+        assert normalize["outputs"]["ct"]["shape"] == [2]
+        for entry in ("wall_time", "cpu_time", "peak_rss_delta"):
+            assert normalize[entry] >= 0
+        with open(trace_path) as f:
+            events = [event for event in json.load(f)["traceEvents"] if event["ph"] == "X"]
+        assert [event["name"] for event in events] == ["load", "normalize", "save"]
+        # the profile is written next to the log file when there is one
+        workflow.config["log_file_name"] = str(Path(tmpdir, "logs", "reduction.log"))
+        assert workflow.profile_paths() == (
+            Path(tmpdir, "logs", "reduction.profile.json"),
+            Path(tmpdir, "logs", "reduction.trace.json"),
+        )
+
+    def test_profile_pool_workers(self):
+        profiler = TaskProfiler()
+        try:
+            # the workers of the shared pool stay up after the task
+            with profiler.profile({"name": "spin", "function": "spin"}, {"max_workers": 1}):
+                pool_map(spin, [0.2, 0.2], max_workers=1)
+        finally:
+            shutdown_pool()
+        (record,) = profiler.records
+        assert record["cpu_time"] >= 0.3
+        # the memory of the worker started by the task
+        assert record["peak_rss_delta"] > 0
+
+    @pytest.mark.parametrize("scheduler", WorkflowEngineAuto.schedulers)
+    def test_streaming(self, config, scheduler, tmpdir):
+        config = deepcopy(config)
+        config["workingdir"] = str(tmpdir)
+        config["keep"] = ["ct"]
+        config["tasks"] = [
+            _task("load", "load_volume", {"ct_files": ["ct1"]}, ["ct", "ob"]),
+            _task("offset", "offset", {"arrays": "ct", "flats": "ob"}, ["ct"]),
+            _task("smooth", "smooth", {"arrays": "ct"}, ["ct"]),
+            _task("smooth-again", "smooth", {"arrays": "ct"}, ["ct"]),
+            _task("project", "project", {"arrays": "ct"}, ["ct"]),
+            _task("save", "save_data"),
+        ]
+        separable = {
+            f"{__name__}.offset": RowSeparable(("arrays", "flats"), 1, lambda params: 0),
+            f"{__name__}.smooth": RowSeparable(("arrays",), 1, lambda params: 1),
+            f"{__name__}.project": RowSeparable(("arrays",), 0, lambda params: 0),
+        }
+
+        def run(config):
+            with mock.patch.dict(SEPARABLE_FUNCTIONS, separable):
+                workflow = _workflow(config, scheduler=scheduler)
+                workflow._registry = {"workingdir": str(tmpdir)}
+                streamed = workflow._streaming_tasks(config["tasks"], workflow._task_dependencies(config["tasks"])[0])
+                return streamed, _run_workflow(config, scheduler=scheduler).registry["ct"]
+
+        _, expected = run(config)
+        assert expected.shape == (10, 3)
+        for slab_rows in (1, 3, 10):
+            config["streaming"] = {"slab_rows": slab_rows}
+            streamed, result = run(config)
+            assert streamed == [1, 2, 3, 4]
+            assert isinstance(result, np.memmap)
+            np.testing.assert_allclose(result, expected)
+        # a task that is not row-separable ends the streamed tasks
+        config["tasks"][2]["function"] = f"{__name__}.scale"
+        streamed, _ = run(config)
+        assert streamed == [3, 4]
+
+    def test_task_dependencies_overwrite(self, config):
+        workflow = WorkflowEngineAuto(config)
+        workflow._registry = {"workingdir": "/tmp"}
+        tasks = [
+            _task("load", "load_data", {"ct_files": []}, ["ct"]),
+            _task("reader", "scale", {"arrays": "ct"}, ["ob"]),
+            _task("writer", "scale", {"arrays": "ob"}, ["ct"]),
+            _task("late", "find_rot_center", outputs=["rot_center"]),
+        ]
+        reads, dependencies = workflow._task_dependencies(tasks)
+        assert reads == [set(), {"ct"}, {"ob"}, {"ct"}]
+        # "writer" overwrites "ct" read by "reader", "late" reads the overwritten "ct"
+        assert dependencies == [set(), {0}, {0, 1}, {2}]
+
+    def test_push_down_crop(self, config):
+        workflow = WorkflowEngineAuto(config)
+        load = {
+            "name": "load",
+            "function": workflow.load_data_function,
+            "inputs": {"ct_dir": "/ct"},
+            "outputs": ["ct", "ob", "dc", "rot_angles"],
+        }
+
+        def crop(array, limits):
+            return {
+                "name": f"crop-{array}",
+                "function": workflow.crop_function,
+                "inputs": {"arrays": array, "crop_limit": limits},
+                "outputs": [array],
+            }
+
+        save = {"name": "save", "function": workflow.save_data_function, "inputs": {"data": "ct"}}
+        limits = [1, 5, 2, 6]
+        # all three stacks cropped with the same constant limits
+        tasks = [load, crop("ct", limits), crop("ob", limits), crop("dc", limits), save]
+        optimized = workflow._push_down_crop(tasks)
+        assert [task["name"] for task in optimized] == ["load", "save"]
+        assert optimized[0]["inputs"]["roi"] == limits
+        assert "roi" not in load["inputs"]  # the configuration is left untouched
+        # different limits, automatic detection, or partially cropped stacks are left alone
+        for tasks in (
+            [load, crop("ct", limits), crop("ob", [0, 5, 2, 6]), crop("dc", limits), save],
+            [load, crop("ct", [-1, -1, -1, -1]), crop("ob", [-1, -1, -1, -1]), crop("dc", [-1, -1, -1, -1]), save],
+            [load, crop("ct", limits), crop("ob", limits), save],
+            [load, crop("ct", limits), crop("ct", limits), crop("ob", limits), crop("dc", limits), save],
+        ):
+            assert workflow._push_down_crop(tasks) == tasks
+        # crop limits of a binned load refer to the binned images
+        binned_load = deepcopy(load)
+        binned_load["inputs"]["bin_factor"] = 2
+        tasks = [binned_load, crop("ct", limits), crop("ob", limits), crop("dc", limits), save]
+        assert workflow._push_down_crop(tasks) == tasks
+
+    @pytest.mark.parametrize("beam_hardening", [False, True])
+    def test_fused_run(self, config, beam_hardening):
+        config = deepcopy(config)
+        config["keep"] = ["ct"]
+        config["tasks"] = [
+            _task("load", "load_radiographs", {"ct_files": ["ct1", "ct2", "ct3", "ct4"]}, ["ct", "ob", "dc"]),
+            _task(
+                "norm",
+                WorkflowEngineAuto.normalization_function,
+                {"arrays": "ct", "flats": "ob", "darks": "dc"},
+                ["ct"],
+            ),
+            _task("bh", WorkflowEngineAuto.beam_hardening_function, {"arrays": "ct", "q": 0.1, "n": 3.0}, ["ct"]),
+            _task("log", WorkflowEngineAuto.minus_log_function, {"arrays": "ct"}, ["ct"]),
+            _task("save", "save_data"),
+        ]
+        if not beam_hardening:
+            del config["tasks"][2]
+        assert len(_workflow(config)._fuse_pointwise(config["tasks"])) == 3
+
+        def run(fused):
+            if fused:
+                return _run_workflow(config).registry["ct"]
+            with mock.patch.object(WorkflowEngineAuto, "_fuse_pointwise", lambda self, tasks: tasks):
+                return _run_workflow(config).registry["ct"]
+
+        # same results
+        np.testing.assert_allclose(run(fused=True), run(fused=False), rtol=1e-6)
+        # same errors, for images not normalized with the beam hardening correction, else negative values
+        if beam_hardening:
+            config["tasks"][0]["inputs"]["transmission"], message = (0.05, 2.5), "must be normalized"
+        else:
+            config["tasks"][0]["inputs"]["transmission"], message = (-0.05, 0.95), "'minus_log' cannot be applied"
+        errors = []
+        for fused in (True, False):
+            with pytest.raises(ValueError, match=message) as e:
+                run(fused)
+            errors.append(str(e.value))
+        assert errors[0] == errors[1]
+
+    def test_fuse_pointwise(self, config):
+        workflow = WorkflowEngineAuto(config)
+        inputs = {"arrays": "ct", "flats": "ob", "darks": "dc"}
+        normalize = _task("norm", workflow.normalization_function, inputs, ["ct"])
+        hardening = _task("bh", workflow.beam_hardening_function, {"arrays": "ct", "q": 0.1}, ["ct"])
+        log = _task("log", workflow.minus_log_function, {"arrays": "ct"}, ["ct"])
+        save = _task("save", workflow.save_data_function, {"data": "ct"})
+        fused = workflow._fuse_pointwise([normalize, hardening, log, save])
+        assert [task["name"] for task in fused] == ["norm + bh + log", "save"]
+        assert fused[0]["function"] == workflow.fused_normalization_function
+        assert fused[0]["inputs"] == {
+            "arrays": "ct",
+            "flats": "ob",
+            "darks": "dc",
+            "beam_hardening": True,
+            "q": 0.1,
+            "minus_log": True,
+        }
+        assert "beam_hardening" not in normalize["inputs"]  # the configuration is left untouched
+        fused = workflow._fuse_pointwise([normalize, log, save])
+        assert fused[0]["inputs"]["minus_log"] and "beam_hardening" not in fused[0]["inputs"]
+        assert not workflow._fuse_pointwise([normalize, hardening, save])[0]["inputs"]["minus_log"]
+        # not in place, or parameters from the registry, are left alone
+        for tasks in (
+            [normalize, save],
+            [normalize, _task("log", workflow.minus_log_function, {"arrays": "ct"}, ["log"]), save],
+            [normalize, _task("bh", workflow.beam_hardening_function, {"arrays": "ct", "q": "q"}, ["ct"]), save],
+            [log, normalize, save],
+        ):
+            assert workflow._fuse_pointwise(tasks) == tasks
 
 
 if __name__ == "__main__":
@@ -0,0 +1,84 @@
+# package imports
+from imars3d.backend.__main__ import main
+from imars3d.backend.workflow.engine import WorkflowEngineAuto
+from imars3d.backend.workflow.estimate import ArraySpec, calibrate, format_estimate, nbytes
+
+# third party imports
+import numpy as np
+import pytest
+import tifffile
+
+# standard library imports
+import json
+from pathlib import Path
+
+JSON_DIR = Path(__file__).parent.parent.parent.parent / "data" / "json"
+
+
+@pytest.fixture
+def config(tmpdir):
+    for kind, count in (("ct", 12), ("ob", 3), ("dc", 2)):
+        (Path(tmpdir) / kind).mkdir()
+        for i in range(count):
+            tifffile.imwrite(Path(tmpdir) / kind / f"{kind}_{i:03d}.tiff", np.zeros((40, 50), dtype=np.uint16))
+    config = json.load(open(JSON_DIR / "good_non_interactive_full.json"))
+    config["workingdir"] = str(tmpdir)
+    inputs = config["tasks"][0]["inputs"]
+    for kind in ("ct", "ob", "dc"):
+        inputs[f"{kind}_dir"] = str(Path(tmpdir) / kind)
+    for task in config["tasks"][1:4]:
+        task["inputs"]["crop_limit"] = [5, 45, 10, 30]
+    return config
+
+
+def test_estimate(config):
+    rst = WorkflowEngineAuto(config).estimate(memory_bytes=2**30)
+    outputs = {record["name"]: record["outputs"] for record in rst["tasks"]}
+    # the crop is done while loading
+    assert outputs["task1"]["ct"]["shape"] == [12, 20, 40]
+    assert outputs["task1"]["ct"]["dtype"] == "<u2"
+    assert outputs["task1"]["ob"]["shape"] == [3, 20, 40]
+    assert outputs["task1"]["rot_angles"]["shape"] == [12]
+    assert outputs["task3"]["ct"]["dtype"] == "<f4"
+    assert outputs["task8"]["result"] == {"shape": [20, 40, 40], "dtype": "<f4", "nbytes": 20 * 40 * 40 * 4}
+    assert rst["fits"] and rst["suggestion"] is None
+    assert 0 < rst["peak"] <= rst["peak_without_freeing"]
+    assert rst["peak"] >= outputs["task8"]["result"]["nbytes"]
+    assert rst["seconds"] > 0
+    assert "peak memory" in format_estimate(rst)
+
+
+def test_estimate_exceeding_memory(config):
+    rst = WorkflowEngineAuto(config).estimate(memory_bytes=150 * 1024)
+    assert not rst["fits"]
+    assert '"streaming"' in rst["suggestion"] and "memmap_dir" in rst["suggestion"]
+    assert "does not fit" in format_estimate(rst)
+    # the streamed reconstruction only holds a slab of its output
+    config["streaming"] = {"slab_rows": 2}
+    streamed = WorkflowEngineAuto(config).estimate(memory_bytes=150 * 1024)
+    assert [record["name"] for record in streamed["tasks"] if record["streamed"]] == ["task8"]
+    assert streamed["tasks"][-2]["peak"] < rst["tasks"][-2]["peak"]
+    # nothing to stream, the data has to be reduced
+    rst = WorkflowEngineAuto(config).estimate(memory_bytes=1024)
+    assert "bin_factor" in rst["suggestion"]
+
+
+def test_calibrate():
+    arrays = {"shape": [10, 20, 30], "dtype": "float32", "nbytes": 24000}
+    assert nbytes(ArraySpec((10, 20, 30), "float32")) == 24000
+    report = {
+        "tasks": [
+            {"function": "a.b", "wall_time": 6.0, "cached": False, "inputs": {"arrays": arrays}, "outputs": {}},
+            {"function": "a.b", "wall_time": 12.0, "cached": False, "inputs": {"arrays": arrays}, "outputs": {}},
+            {"function": "a.b", "wall_time": 0.0, "cached": True, "inputs": {"arrays": arrays}, "outputs": {}},
+        ]
+    }
+    assert calibrate([report]) == {"a.b": pytest.approx(1.5e-3)}
+
+
+def test_cli_estimate(config, tmpdir, capsys):
+    configfile = Path(tmpdir) / "config.json"
+    configfile.write_text(json.dumps(config))
+    assert main([str(configfile), "--estimate", "--memory-gb", "1"]) == 0
+    assert "task8" in capsys.readouterr().out
+    assert main([str(configfile), "--estimate", "--memory-gb", "0.0001"]) == 3